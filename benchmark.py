@@ -0,0 +1,418 @@
+import argparse
+import asyncio
+import csv
+import itertools
+import json
+import math
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from bsp import BSP, getSegmentArrays
+from geometry import LineSegment, Point
+from scene import generatePoints, generateRandomScene, generateSceneFast
+from service import LocalClient, LoSService
+from stats import QueryStats
+
+def getRevision():
+    """returns the git commit of the working tree, None outside of a git repository"""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def timeCall(function, Repeat):
+    """returns the result of the last call and the shortest time in seconds of 'Repeat' calls of 'function'"""
+    BestTime = float('inf')
+    for i in range(Repeat):
+        StartTime = time.perf_counter()
+        Result = function()
+        BestTime = min(BestTime, time.perf_counter() - StartTime)
+    return Result, BestTime
+
+def buildTree(Lines, Heuristic, Seed, Memory=True, Repeat=1):
+    """
+    Generates a BSP tree from a copy of 'Lines', timed without tracing, then once more under tracemalloc for the
+    peak memory if 'Memory' is true
+    :return: (BSP, shortest build time of 'Repeat' builds in seconds, peak memory in bytes or None)
+    """
+    def build():
+        bsptree = BSP(Seed=Seed)
+        bsptree.tree.data = list(Lines)
+        bsptree.generateTree(bsptree.tree, UseHeuristic=Heuristic)
+        return bsptree
+    bsptree, BuildTime = timeCall(build, Repeat)
+
+    PeakMemory = None
+    if Memory:
+        traced = BSP(Seed=Seed)
+        traced.tree.data = list(Lines)
+        tracemalloc.start()
+        traced.generateTree(traced.tree, UseHeuristic=Heuristic)
+        PeakMemory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return bsptree, BuildTime, PeakMemory
+
+def runBenchmark(WallCounts, AgentCounts, Heuristics=('even', 'min'), Distributions=('uniform', 'powerlaw'),
+                 Seed=0, Width=800, Height=600, Memory=True, Repeat=1, Scene='random'):
+    """
+    Times tree generation and line of sight queries over seeded scenes, every combination of the arguments is one run
+    :param WallCounts: list of int, number of line segments of the scenes
+    :param AgentCounts: list of int, number of points queried against every tree
+    :param Heuristics: names of heuristics accepted by BSP.generateTree
+    :param Distributions: 'uniform' and/or 'powerlaw', distribution of line segments and points
+    :param Seed: int, seed of np.random for scenes and points, the same seed gives the same scenes
+    :param Memory: boolean, measure peak memory of tree generation (one extra, traced generation per tree)
+    :param Repeat: int, every time is the shortest of this many runs
+    :param Scene: string, 'random' for generateRandomScene, 'fast' for generateSceneFast
+    :return: list of dictionaries, one per run
+    """
+    Results = []
+    for Distribution in Distributions:
+        isUniform = Distribution == 'uniform'
+        for WallCount in WallCounts:
+            np.random.seed(Seed)
+            if Scene == 'fast':
+                Lines = generateSceneFast(WallCount, Width, Height, isUniform=isUniform, Seed=Seed)
+            else:
+                Lines = generateRandomScene(WallCount, Width, Height, isUniform=isUniform)
+            for Heuristic in Heuristics:
+                bsptree, BuildTime, PeakMemory = buildTree(Lines, Heuristic, Seed, Memory, Repeat)
+                Nodes = bsptree.countNodes(bsptree.tree)
+                Depth = bsptree.getDepth(bsptree.tree)
+                for AgentCount in AgentCounts:
+                    np.random.seed(Seed + 1)
+                    points = generatePoints(AgentCount, Width, Height, isUniform=isUniform)
+
+                    QueryTime = timeCall(lambda: bsptree.checkLoS(points), Repeat)[1]
+                    BatchTime = timeCall(lambda: bsptree.checkLoSBatch(points), Repeat)[1]
+
+                    Stats = QueryStats()
+                    bsptree.checkLoSBatch(points, Stats)
+                    Summary = Stats.summary()
+                    Results.append({
+                        'Distribution': Distribution,
+                        'Walls': WallCount,
+                        'Heuristic': Heuristic,
+                        'Agents': AgentCount,
+                        'Nodes': Nodes,
+                        'Depth': Depth,
+                        'BuildTime': BuildTime,
+                        'PeakMemory': PeakMemory,
+                        'Queries': Summary['Queries'],
+                        'QueryTime': QueryTime,
+                        'BatchQueryTime': BatchTime,
+                        'MeanNodesVisited': Summary['MeanNodesVisited'],
+                        'MaxDepthVisited': Summary['MaxDepth'],
+                        'Blocked': Summary['Blocked'],
+                        'Histogram': Stats.histogram()})
+    return Results
+
+def writeResults(Results, Filename, Arguments=None):
+    """Writes the runs to 'Filename', CSV (without histograms) if it ends in '.csv', otherwise JSON with metadata"""
+    if Filename.endswith('.csv'):
+        Fields = [Key for Key in Results[0] if Key != 'Histogram'] if len(Results) > 0 else []
+        with open(Filename, 'w', newline='') as f:
+            writer = csv.DictWriter(f, Fields, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(Results)
+        return
+
+    with open(Filename, 'w') as f:
+        json.dump({
+            'Revision': getRevision(),
+            'Python': platform.python_version(),
+            'Numpy': np.__version__,
+            'Machine': platform.machine(),
+            'Time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'Arguments': Arguments,
+            'Results': Results}, f, indent=1)
+
+def compareResults(OldFilename, NewFilename, Tolerance=0.1):
+    """
+    Compares two JSON result files run by run
+    :param Tolerance: float, relative increase of a time or of the tree size reported as a regression
+    :return: list of strings, one per regression
+    """
+    Keys = ('Distribution', 'Walls', 'Heuristic', 'Agents')
+    with open(OldFilename) as f:
+        Old = {tuple(Run[Key] for Key in Keys): Run for Run in json.load(f)['Results']}
+    with open(NewFilename) as f:
+        New = json.load(f)['Results']
+
+    Regressions = []
+    for Run in New:
+        Previous = Old.get(tuple(Run[Key] for Key in Keys))
+        if Previous is None:
+            continue
+        for Measure in ('BuildTime', 'QueryTime', 'BatchQueryTime', 'Nodes', 'Depth', 'MeanNodesVisited'):
+            if Previous[Measure] and Run[Measure] > Previous[Measure] * (1 + Tolerance):
+                Regressions.append('%s %s: %s -> %s' % (
+                    '/'.join(str(Run[Key]) for Key in Keys), Measure, Previous[Measure], Run[Measure]))
+    return Regressions
+
+def measureColdStart(Modules=('pipeline', 'bsp'), Repeat=5):
+    """
+    Startup cost of a fresh interpreter that only imports 'Module', i.e. of a query-only worker process
+    :return: dictionary, module name -> shortest time in seconds over 'Repeat' runs, minus that of an empty interpreter;
+    the key 'pygame loaded' lists modules that pulled in pygame
+    """
+    def run(Code):
+        return timeCall(lambda: subprocess.run([sys.executable, '-c', Code], check=True), Repeat)[1]
+
+    Baseline = run('pass')
+    Times = {Module: run('import ' + Module) - Baseline for Module in Modules}
+    Times['pygame loaded'] = [Module for Module in Modules if subprocess.run(
+        [sys.executable, '-c', 'import sys, %s; sys.exit("pygame" in sys.modules)' % Module]).returncode != 0]
+    return Times
+
+def benchmarkGeometry(Count=10000, Repeat=5, Seed=0):
+    """
+    Micro-benchmark of the geometry primitives over random line segments
+    :param Count: int, number of line segments, every operation is called once per line segment in a run
+    :return: dictionary, operation ('construct', 'compare', 'split') -> calls per second of the fastest of 'Repeat' runs
+    """
+    Coordinates = np.random.default_rng(Seed).uniform(0, 800, (Count, 4)).tolist()
+    Lines = [LineSegment(Point(x1, y1), Point(x2, y2)) for x1, y1, x2, y2 in Coordinates]
+    Pairs = list(zip(Lines, Lines[1:] + Lines[:1]))
+
+    def construct():
+        for x1, y1, x2, y2 in Coordinates:
+            LineSegment(Point(x1, y1), Point(x2, y2))
+
+    def compare():
+        for line, other in Pairs:
+            line.compare(other)
+
+    def split():
+        for line, other in Pairs:
+            line.split(other)
+
+    return {function.__name__: Count / timeCall(function, Repeat)[1] for function in (construct, compare, split)}
+
+def generateStressScenes(WallCount=200, Seed=0):
+    """
+    Degenerate scenes for stressPredicates
+    :return: dictionary, name -> list of LineSegment
+    """
+    Scenes = {}
+    # Grid lines cut into pieces, every piece is collinear with a whole row or column and touches its neighbours
+    Scenes['grid'] = [LineSegment(Point(i * 50, k * 50), Point((i + 1) * 50, k * 50), 1 - 2 * (i % 2))
+                      for k in range(10) for i in range(10)] + \
+                     [LineSegment(Point(k * 50 + 25, i * 50), Point(k * 50 + 25, (i + 1) * 50)) for k in range(10)
+                      for i in range(10)]
+    # Spokes meeting in one point, with a collinear outer piece on every spoke
+    Scenes['fan'] = []
+    for k in range(64):
+        Dx, Dy = math.cos(2 * math.pi * k / 64), math.sin(2 * math.pi * k / 64)
+        Scenes['fan'].append(LineSegment(Point(400, 300), Point(400 + 100 * Dx, 300 + 100 * Dy)))
+        Scenes['fan'].append(LineSegment(Point(400 + 150 * Dx, 300 + 150 * Dy), Point(400 + 250 * Dx, 300 + 250 * Dy)))
+    # Pieces of one line, off it by rounding and by up to 1e-6
+    Random = np.random.default_rng(Seed)
+    Scenes['near-collinear'] = []
+    for x, Offset in zip(Random.uniform(0, 700, WallCount).tolist(), Random.uniform(-1e-6, 1e-6, WallCount).tolist()):
+        Scenes['near-collinear'].append(LineSegment(Point(x, x / 3 + Offset), Point(x + 60, (x + 60) / 3)))
+    # The same random scene at different map scales, far from the origin for the largest one
+    Lines = generateSceneFast(WallCount, 800, 600, Seed=Seed)
+    for Scale, Offset in ((1e-3, 0), (1, 0), (1e3, 0), (1e6, 1e9)):
+        Scenes['random x%g' % Scale] = [LineSegment(
+            Point(line.p1.x * Scale + Offset, line.p1.y * Scale + Offset),
+            Point(line.p2.x * Scale + Offset, line.p2.y * Scale + Offset), line.Normal) for line in Lines]
+    return Scenes
+
+def stressPredicates(Heuristics=('even', 'min'), WallCount=200, Seed=0):
+    """
+    Builds trees of the scenes of generateStressScenes with the default, the robust and the exact predicates, a good
+    predicate gives the same number of line segments (walls and fragments) for every scale of the random scene
+    :return: list of dictionaries with keys 'Scene', 'Heuristic', 'Mode', 'Nodes', 'Depth', 'Errors' (fragments that
+    classified as neither front nor back, see BSP.MisclassifiedFragments), 'Failed' (exception raised by generateTree or None) and 'BuildTime'
+    """
+    Modes = {'default': {}, 'robust': {'Robust': True}, 'exact': {'Robust': True, 'RobustTolerance': 0}}
+    Results = []
+    for Scene, Lines in generateStressScenes(WallCount, Seed).items():
+        for Heuristic in Heuristics:
+            for Mode, Options in Modes.items():
+                bsptree = BSP(Seed=Seed, **Options)
+                bsptree.tree.data = list(Lines)
+                Failed = None
+                StartTime = time.perf_counter()
+                try:
+                    bsptree.generateTree(bsptree.tree, Heuristic)
+                except Exception as error:
+                    Failed = repr(error)
+                Results.append({
+                    'Scene': Scene,
+                    'Heuristic': Heuristic,
+                    'Mode': Mode,
+                    'Nodes': bsptree.countNodes(bsptree.tree) if Failed is None else None,
+                    'Depth': bsptree.getDepth(bsptree.tree) if Failed is None else None,
+                    'Errors': bsptree.MisclassifiedFragments,
+                    'Failed': Failed,
+                    'BuildTime': time.perf_counter() - StartTime})
+    return Results
+
+def benchmarkService(WallCount=1000, Clients=200, Requests=50, Segments=4, Seed=0, **Options):
+    """
+    Load test of LoSService with 'Clients' coroutines, each sending 'Requests' requests of 'Segments' sight segments
+    one after the other through a LocalClient, every result is checked against BSP.checkSightSegments
+    :param Options: keyword arguments of LoSService
+    :return: dictionary, the summary of the service plus 'Throughput' (sight segments per second), 'WallTime',
+    'Mismatches' and 'UnbatchedThroughput', sight segments per second of calling checkSightSegments once per request
+    """
+    rng = np.random.default_rng(Seed)
+    bsptree = BSP(Seed=Seed)
+    bsptree.tree.data = generateSceneFast(WallCount, 800, 600, Seed=Seed)
+    bsptree.generateTree(bsptree.tree, 'sample-even')
+    bsptree.compileTree()
+    Queries = rng.uniform(0, [800, 600, 800, 600], (Clients, Requests, Segments, 4))
+    Expected = bsptree.checkSightSegments(Queries.reshape(-1, 4)).reshape(Clients, Requests, Segments)
+    Sample = Queries[:, 0]
+    UnbatchedTime = timeCall(lambda: [bsptree.checkSightSegments(Request) for Request in Sample], 1)[1]
+
+    async def run():
+        async with LoSService(bsptree, **Options) as service:
+            client = LocalClient(service)
+
+            async def play(Client):
+                Mismatches = 0
+                for Request in range(Requests):
+                    Visible = await client.checkSightSegments(Queries[Client, Request])
+                    Mismatches += int(np.count_nonzero(Visible != Expected[Client, Request]))
+                return Mismatches
+
+            StartTime = time.perf_counter()
+            Mismatches = sum(await asyncio.gather(*[play(Client) for Client in range(Clients)]))
+            WallTime = time.perf_counter() - StartTime
+        Result = service.summary()
+        Result.update({'Throughput': service.Segments / WallTime, 'WallTime': WallTime, 'Mismatches': Mismatches,
+                       'UnbatchedThroughput': Sample.size / 4 / UnbatchedTime})
+        return Result
+
+    return asyncio.run(run())
+
+def benchmarkTraversal(WallCount=2000, Viewpoints=50, Nearest=10, Seed=0):
+    """
+    Ordered traversal (BSP.iterFragments) against sorting all line segments of the tree by their distance from the
+    viewpoint, which is what a caller without the tree would do (and which is not even a correct visibility order)
+    :param Nearest: int, number of line segments the early stopping runs take in a 90 degree wedge
+    :return: dictionary, run -> seconds per viewpoint, 'full' for the complete order, 'wedge' for the first
+    'Nearest' line segments of the wedge, each as 'Traversal' and 'Sorting', and 'Fragments' (line segments in the
+    tree)
+    """
+    rng = np.random.default_rng(Seed)
+    bsptree = BSP(Seed=Seed)
+    bsptree.tree.data = generateSceneFast(WallCount, 800, 600, Seed=Seed)
+    bsptree.generateTree(bsptree.tree, 'sample-even')
+    Fragments = bsptree.collectSegments(bsptree.tree)
+    Lines = getSegmentArrays(Fragments)[0]
+    Points = rng.uniform(0, [800, 600], (Viewpoints, 2))
+    Wedges = [(Angle, Angle + math.pi / 2) for Angle in rng.uniform(0, 2 * math.pi, Viewpoints).tolist()]
+
+    def getDistances(Point):
+        """distance of every line segment from 'Point'"""
+        Difference = Lines[:, 2:4] - Lines[:, 0:2]
+        Length = np.maximum((Difference * Difference).sum(axis=1), 1e-300)
+        t = np.clip(((Point - Lines[:, 0:2]) * Difference).sum(axis=1) / Length, 0, 1)
+        Closest = Lines[:, 0:2] + t[:, None] * Difference - Point
+        return np.sqrt((Closest * Closest).sum(axis=1))
+
+    def traverseFull():
+        for Point in Points:
+            for line in bsptree.iterFragments(Point):
+                pass
+
+    def sortFull():
+        for Point in Points:
+            [Fragments[index] for index in np.argsort(getDistances(Point)).tolist()]
+
+    def traverseWedge():
+        for Point, Wedge in zip(Points, Wedges):
+            list(itertools.islice(bsptree.iterFragments(Point, Wedge=Wedge), Nearest))
+
+    def sortWedge():
+        for Point, (Start, Stop) in zip(Points, Wedges):
+            # Line segments with an end point or their middle in the wedge
+            Inside = np.zeros(len(Lines), dtype=bool)
+            for Ends in (Lines[:, 0:2], Lines[:, 2:4], (Lines[:, 0:2] + Lines[:, 2:4]) / 2):
+                Angles = np.arctan2(Ends[:, 1] - Point[1], Ends[:, 0] - Point[0])
+                Inside |= np.mod(Angles - Start, 2 * math.pi) <= Stop - Start
+            Index = np.flatnonzero(Inside)
+            [Fragments[index] for index in Index[np.argsort(getDistances(Point)[Index])[:Nearest]].tolist()]
+
+    Result = {'Fragments': len(Fragments)}
+    for Name, function in (('FullTraversal', traverseFull), ('FullSorting', sortFull),
+                           ('WedgeTraversal', traverseWedge), ('WedgeSorting', sortWedge)):
+        Result[Name] = timeCall(function, 3)[1] / Viewpoints
+    return Result
+
+def parseCounts(Text):
+    """parses a comma separated list of ints"""
+    return [int(x) for x in Text.split(',')]
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark BSP tree generation and line of sight queries')
+    parser.add_argument('--walls', type=parseCounts, default=[25, 50, 100], help='comma separated wall counts')
+    parser.add_argument('--agents', type=parseCounts, default=[10, 50], help='comma separated agent counts')
+    parser.add_argument('--heuristics', default='even,min', help='comma separated heuristics')
+    parser.add_argument('--distributions', default='uniform,powerlaw', help='uniform and/or powerlaw')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--scene', default='random', choices=('random', 'fast'), help='scene generator')
+    parser.add_argument('--width', type=int, default=800)
+    parser.add_argument('--height', type=int, default=600)
+    parser.add_argument('--repeat', type=int, default=3, help='report the shortest of this many runs')
+    parser.add_argument('--no-memory', action='store_true', help='skip peak memory measurement')
+    parser.add_argument('--out', default='benchmark.json', help='output file, .json or .csv')
+    parser.add_argument('--compare', help='JSON results of an earlier run to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    parser.add_argument('--cold-start', action='store_true', help='only measure import time of query-only workers')
+    parser.add_argument('--geometry', action='store_true', help='only measure calls per second of geometry primitives')
+    parser.add_argument('--stress', action='store_true', help='only compare predicates on degenerate scenes')
+    parser.add_argument('--service', action='store_true', help='only load test the asyncio query service')
+    parser.add_argument('--traversal', action='store_true', help='only compare ordered traversal with sorting')
+    args = parser.parse_args()
+
+    if args.cold_start:
+        for Module, Time in measureColdStart(Repeat=args.repeat).items():
+            print(Module + ':', Time)
+        return
+    if args.geometry:
+        for Operation, Rate in benchmarkGeometry(Repeat=args.repeat).items():
+            print('%s: %d calls/s' % (Operation, Rate))
+        return
+    if args.stress:
+        for Run in stressPredicates(args.heuristics.split(','), Seed=args.seed):
+            print('%(Scene)s %(Heuristic)s %(Mode)s: nodes %(Nodes)s depth %(Depth)s errors %(Errors)d '
+                  'failed %(Failed)s build %(BuildTime)0.3fs' % Run)
+        return
+    if args.traversal:
+        for Key, Value in benchmarkTraversal(Seed=args.seed).items():
+            print('%s: %s' % (Key, Value))
+        return
+    if args.service:
+        for Key, Value in benchmarkService(Seed=args.seed).items():
+            print('%s: %s' % (Key, Value))
+        return
+
+    Results = runBenchmark(args.walls, args.agents, args.heuristics.split(','), args.distributions.split(','),
+                           args.seed, args.width, args.height, Memory=not args.no_memory, Repeat=args.repeat,
+                           Scene=args.scene)
+    writeResults(Results, args.out, {Key: Value for Key, Value in vars(args).items()})
+    for Run in Results:
+        print('%(Distribution)s walls %(Walls)d %(Heuristic)s agents %(Agents)d: nodes %(Nodes)d depth %(Depth)d '
+              'build %(BuildTime)0.4fs query %(QueryTime)0.4fs batch %(BatchQueryTime)0.4fs '
+              'traversals %(MeanNodesVisited)0.2f' % Run)
+
+    if args.compare:
+        Regressions = compareResults(args.compare, args.out, args.tolerance)
+        for Regression in Regressions:
+            print('Regression:', Regression)
+        if len(Regressions) > 0:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
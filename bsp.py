@@ -1,4 +1,606 @@
-from geometry import LineSegment, Point
+import bisect
+import collections
+import concurrent.futures
+import heapq
+import math
+import os
+import time
+
+import numpy as np
+
+from geometry import DoubleTolerance, LineSegment, Point, RelativeTolerance
+
+def toPointArray(points):
+    """Returns an (N, 2) float64 array of coordinates from either a list of Point objects or an array-like of (x, y) rows"""
+    if len(points) > 0 and isinstance(points[0], Point):
+        return np.array([(point.x, point.y) for point in points], dtype=np.float64)
+    return np.asarray(points, dtype=np.float64).reshape(-1, 2)
+
+# Side codes of compareMatrix, one per result character of LineSegment.compare
+SideFront, SideBack, SidePartition, SideCollinear = 0, 1, 2, 3
+# Upper bound on the number of entries of a block of compareMatrix computed at once
+HeuristicBlockElements = 1 << 20
+
+def getSegmentArrays(ListLineSegments):
+    """returns two float64 arrays, (n, 4) end points (x1, y1, x2, y2) and (n, 2) normal vectors of the line segments"""
+    Lines = np.array([(line.p1.x, line.p1.y, line.p2.x, line.p2.y) for line in ListLineSegments], dtype=np.float64)
+    Normals = np.array([(line.NormalV.x, line.NormalV.y) for line in ListLineSegments], dtype=np.float64)
+    return Lines.reshape(-1, 4), Normals.reshape(-1, 2)
+
+def compareMatrix(Lines, Normals, Start, Stop):
+    """
+    Vectorized LineSegment.compare of candidates Start to Stop against all line segments, with the same arithmetic
+    :param Lines: float64 array (n, 4), see getSegmentArrays
+    :param Normals: float64 array (n, 2), see getSegmentArrays
+    :return: int8 array (Stop - Start, n), entry [i][j] is the side code (SideFront, SideBack, SidePartition or
+    SideCollinear) of 'Lines[j].compare' by candidate 'Lines[Start + i]'
+    """
+    Px = Lines[Start:Stop, 0:1]
+    Py = Lines[Start:Stop, 1:2]
+    Nx = Normals[Start:Stop, 0:1]
+    Ny = Normals[Start:Stop, 1:2]
+    DotProduct1 = Nx * (Lines[:, 0] - Px) + Ny * (Lines[:, 1] - Py)
+    DotProduct1[np.abs(DotProduct1) < DoubleTolerance] = 0
+    DotProduct2 = Nx * (Lines[:, 2] - Px) + Ny * (Lines[:, 3] - Py)
+    DotProduct2[np.abs(DotProduct2) < DoubleTolerance] = 0
+
+    DotSum = DotProduct1 + DotProduct2
+    Sides = np.full(DotSum.shape, SideCollinear, dtype=np.int8)
+    Sides[DotSum > 0] = SideFront
+    Sides[DotSum < 0] = SideBack
+    Sides[((DotProduct1 > 0) & (DotProduct2 < 0)) | ((DotProduct1 < 0) & (DotProduct2 > 0))] = SidePartition
+    return Sides
+
+def countSides(ListLineSegments, BlockElements=HeuristicBlockElements):
+    """returns an int array (n, 4), entry [i][code] is the number of other line segments that candidate i classifies as
+    side code 'code', the matrix of compareMatrix is computed in blocks of at most 'BlockElements' entries"""
+    Lines, Normals = getSegmentArrays(ListLineSegments)
+    n = len(Lines)
+    Counts = np.zeros((n, 4), dtype=np.int64)
+    BlockRows = max(1, BlockElements // max(n, 1))
+    for Start in range(0, n, BlockRows):
+        Stop = min(n, Start + BlockRows)
+        Sides = compareMatrix(Lines, Normals, Start, Stop)
+        # A line segment is not compared with itself
+        Sides[np.arange(Stop - Start), np.arange(Start, Stop)] = -1
+        for code in (SideFront, SideBack, SidePartition, SideCollinear):
+            Counts[Start:Stop, code] = np.count_nonzero(Sides == code, axis=1)
+    return Counts
+
+def getSplitterRow(Splitter):
+    """returns a tuple (x1, y1, x2, y2, Nx, Ny) holding end points and normal vector of LineSegment 'Splitter'"""
+    return (Splitter.p1.x, Splitter.p1.y, Splitter.p2.x, Splitter.p2.y, Splitter.NormalV.x, Splitter.NormalV.y)
+
+def classifySightSegments(Splitter, Segments, Collinear=()):
+    """
+    Vectorized counterpart of the per node test in BSP.checkLoS, i.e. 'Splitter.compare(SightSegment)' followed by
+    'SightSegment.split(line)' for the line segments of the node when the sight segment is partitioned, evaluated with
+    the same floating point operations so that the outcome is identical for every sight segment
+    :param Splitter: tuple (x1, y1, x2, y2, Nx, Ny), see getSplitterRow
+    :param Segments: float64 array of shape (M, 4), rows of sight segments (x1, y1, x2, y2)
+    :param Collinear: tuples (x1, y1, x2, y2) of the other line segments of the node, collinear with the splitter
+    :return: three boolean arrays of length M, Blocked (a line segment of the node intersects the sight segment),
+    GoLeft and GoRight (sight segment has to be tested against the left or right sub-tree), and an int array of length
+    M, the number of intersection tests checkLoS does for every sight segment
+    """
+    Px, Py, Qx, Qy, Nx, Ny = Splitter
+    DotProduct1 = Nx * (Segments[:, 0] - Px) + Ny * (Segments[:, 1] - Py)
+    DotProduct1[np.abs(DotProduct1) < DoubleTolerance] = 0
+    DotProduct2 = Nx * (Segments[:, 2] - Px) + Ny * (Segments[:, 3] - Py)
+    DotProduct2[np.abs(DotProduct2) < DoubleTolerance] = 0
+
+    Partition = ((DotProduct1 > 0) & (DotProduct2 < 0)) | ((DotProduct1 < 0) & (DotProduct2 > 0))
+    DotSum = DotProduct1 + DotProduct2
+    Front = ~Partition & (DotSum > 0)
+    Back = ~Partition & (DotSum < 0)
+
+    Blocked = np.zeros(len(Segments), dtype=bool)
+    Tests = np.zeros(len(Segments), dtype=np.int64)
+    PartitionIndex = np.flatnonzero(Partition)
+    if len(PartitionIndex) > 0:
+        Sight = Segments[PartitionIndex]
+        SightBlocked = hitsSightSegments(Sight, Px, Py, Qx, Qy)
+        SightTests = np.ones(len(Sight), dtype=np.int64)
+        for x1, y1, x2, y2 in Collinear:
+            # checkLoS stops testing at the first intersection
+            SightTests += ~SightBlocked
+            SightBlocked |= hitsSightSegments(Sight, x1, y1, x2, y2)
+        Blocked[PartitionIndex] = SightBlocked
+        Tests[PartitionIndex] = SightTests
+
+    Pass = Partition & ~Blocked
+    return Blocked, Front | Pass, Back | Pass, Tests
+
+def hitsSightSegments(Sight, Px, Py, Qx, Qy):
+    """Vectorized 'SightSegment.split(line) is not None' for a line segment from (Px, Py) to (Qx, Qy), same arithmetic
+    as LineSegment.split, for an array of sight segments 'Sight' (M, 4)"""
+    SightNx = Sight[:, 3] - Sight[:, 1]
+    SightNy = -(Sight[:, 2] - Sight[:, 0])
+    numer = (SightNx * (Px - Sight[:, 0])) + (SightNy * (Py - Sight[:, 1]))
+    denom = ((-SightNx) * (Qx - Px)) + ((-SightNy) * (Qy - Py))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = numer / denom
+    return (denom != 0.0) & (0 <= t) & (t <= 1.0)
+
+def getBox(ListLineSegments):
+    """returns the bounding box (xmin, ymin, xmax, ymax) of the line segments, None if there are none"""
+    if len(ListLineSegments) == 0:
+        return None
+    xs = [x for line in ListLineSegments for x in (line.p1.x, line.p2.x)]
+    ys = [y for line in ListLineSegments for y in (line.p1.y, line.p2.y)]
+    return min(xs), min(ys), max(xs), max(ys)
+
+def mergeBoxes(Box, Other):
+    """returns the bounding box of two bounding boxes, either may be None"""
+    if Box is None:
+        return Other
+    if Other is None:
+        return Box
+    return min(Box[0], Other[0]), min(Box[1], Other[1]), max(Box[2], Other[2]), max(Box[3], Other[3])
+
+def missesBox(Sight, Box):
+    """
+    Whether sight segment 'Sight' (x1, y1, x2, y2) certainly misses bounding box 'Box' grown by DoubleTolerance, i.e.
+    the two are separated along an axis or along the normal of the sight segment, False if 'Box' is None
+    """
+    if Box is None:
+        return False
+    x1, y1, x2, y2 = Sight
+    xmin = Box[0] - DoubleTolerance
+    ymin = Box[1] - DoubleTolerance
+    xmax = Box[2] + DoubleTolerance
+    ymax = Box[3] + DoubleTolerance
+    if max(x1, x2) < xmin or min(x1, x2) > xmax or max(y1, y2) < ymin or min(y1, y2) > ymax:
+        return True
+    Dx = x2 - x1
+    Dy = y2 - y1
+    Side1 = Dx * (ymin - y1) - Dy * (xmin - x1)
+    Side2 = Dx * (ymin - y1) - Dy * (xmax - x1)
+    Side3 = Dx * (ymax - y1) - Dy * (xmin - x1)
+    Side4 = Dx * (ymax - y1) - Dy * (xmax - x1)
+    return (Side1 > 0 and Side2 > 0 and Side3 > 0 and Side4 > 0) or \
+        (Side1 < 0 and Side2 < 0 and Side3 < 0 and Side4 < 0)
+
+def missesBoxes(Segments, Box):
+    """Vectorized missesBox for an array of sight segments (M, 4), returns a boolean array (M)"""
+    if Box is None:
+        return np.zeros(len(Segments), dtype=bool)
+    x1, y1, x2, y2 = Segments[:, 0], Segments[:, 1], Segments[:, 2], Segments[:, 3]
+    xmin = Box[0] - DoubleTolerance
+    ymin = Box[1] - DoubleTolerance
+    xmax = Box[2] + DoubleTolerance
+    ymax = Box[3] + DoubleTolerance
+    Miss = (np.maximum(x1, x2) < xmin) | (np.minimum(x1, x2) > xmax) | \
+        (np.maximum(y1, y2) < ymin) | (np.minimum(y1, y2) > ymax)
+    Dx = x2 - x1
+    Dy = y2 - y1
+    Sides = [Dx * (y - y1) - Dy * (x - x1) for x, y in ((xmin, ymin), (xmax, ymin), (xmin, ymax), (xmax, ymax))]
+    Above = (Sides[0] > 0) & (Sides[1] > 0) & (Sides[2] > 0) & (Sides[3] > 0)
+    Below = (Sides[0] < 0) & (Sides[1] < 0) & (Sides[2] < 0) & (Sides[3] < 0)
+    return Miss | Above | Below
+
+def getNodeBoxes(Lines, NodeStart, Left, Right):
+    """returns a float64 array (K, 4), the bounding box (xmin, ymin, xmax, ymax) of the line segments of the sub-tree
+    of every node of a FlatTree"""
+    Boxes = np.zeros((len(Left), 4), dtype=np.float64)
+    if len(Left) == 0:
+        return Boxes
+    Starts = NodeStart[:-1]
+    Boxes[:, 0] = np.minimum.reduceat(np.minimum(Lines[:, 0], Lines[:, 2]), Starts)
+    Boxes[:, 1] = np.minimum.reduceat(np.minimum(Lines[:, 1], Lines[:, 3]), Starts)
+    Boxes[:, 2] = np.maximum.reduceat(np.maximum(Lines[:, 0], Lines[:, 2]), Starts)
+    Boxes[:, 3] = np.maximum.reduceat(np.maximum(Lines[:, 1], Lines[:, 3]), Starts)
+    # Children come after their parent in depth first order, so walking backwards merges finished sub-trees
+    Rows = Boxes.tolist()
+    for node, Children in reversed(list(enumerate(zip(Left.tolist(), Right.tolist())))):
+        for Child in Children:
+            if Child != -1:
+                Rows[node] = mergeBoxes(Rows[node], Rows[Child])
+    return np.array(Rows, dtype=np.float64).reshape(-1, 4)
+
+def walkSightSegments(Segments, Root, getNode, Stats=None, getBox=None):
+    """
+    Batch traversal shared by BSP and FlatTree, walks the tree depth first in the same order as checkLoS, carrying the
+    sight segments still in question from node to node
+    :param Segments: float64 array (M, 4), rows of sight segments (x1, y1, x2, y2)
+    :param Root: root node, None for an empty tree
+    :param getNode: function, returns (Splitter, Collinear, Left, Right) of a node, see classifySightSegments for the
+    first two, Left and Right are the child nodes or None
+    :param Stats: QueryStats or None
+    :param getBox: function, returns the bounding box of the sub-tree of a node (see missesBox), sight segments
+    crossing the splitter are not carried into sub-trees whose box they miss, None to carry them into every sub-tree
+    on their side
+    :return: boolean array of length M, an entry is True if nothing in the tree blocks the sight segment
+    """
+    Visible = np.ones(len(Segments), dtype=bool)
+    if len(Segments) == 0 or Root is None:
+        return Visible
+
+    if Stats is not None:
+        BoxRejections = np.zeros(len(Segments), dtype=np.int64)
+        NodesVisited = np.zeros(len(Segments), dtype=np.int64)
+        SplitterTests = np.zeros(len(Segments), dtype=np.int64)
+        Depths = np.zeros(len(Segments), dtype=np.int64)
+        EarlyExits = np.zeros(len(Segments), dtype=bool)
+
+    stack = [(Root, np.arange(len(Segments)), 1)]
+    while len(stack) != 0:
+        Node, Active, Depth = stack.pop()
+        # Sight segments blocked elsewhere in the meantime need no further tests
+        if Stats is not None:
+            EarlyExits[Active[~Visible[Active]]] = True
+        Active = Active[Visible[Active]]
+        if len(Active) == 0:
+            continue
+
+        Splitter, Collinear, Left, Right = getNode(Node)
+        Blocked, GoLeft, GoRight, Tests = classifySightSegments(Splitter, Segments[Active], Collinear)
+        Visible[Active[Blocked]] = False
+        if Stats is not None:
+            NodesVisited[Active] += 1
+            SplitterTests[Active] += Tests
+            Depths[Active] = np.maximum(Depths[Active], Depth)
+
+        Crossing = GoLeft & GoRight if getBox is not None else None
+        for Child, Go in ((Left, GoLeft), (Right, GoRight)):
+            if Child is None or not Go.any():
+                continue
+            if Crossing is not None and Crossing.any():
+                # Same as isVisible, only sight segments crossing the splitter are tested against the box
+                Test = Go & Crossing
+                Miss = np.zeros(len(Go), dtype=bool)
+                Miss[Test] = missesBoxes(Segments[Active[Test]], getBox(Child))
+                if Stats is not None:
+                    BoxRejections[Active[Miss]] += 1
+                Go = Go & ~Miss
+            Next = Active[Go]
+            if len(Next) > 0:
+                stack.append((Child, Next, Depth + 1))
+
+    if Stats is not None:
+        Difference = Segments[:, 2:4] - Segments[:, 0:2]
+        Stats.recordBatch(np.sqrt((Difference * Difference).sum(axis=1)), NodesVisited, SplitterTests, Depths,
+                          ~Visible, EarlyExits, BoxRejections)
+    return Visible
+
+def getTreeBox(tree):
+    """getBox function of walkSightSegments for BinaryTree nodes"""
+    return tree.box
+
+def getTreeNode(tree):
+    """getNode function of walkSightSegments for BinaryTree nodes"""
+    return (getSplitterRow(tree.data[0]),
+            [(line.p1.x, line.p1.y, line.p2.x, line.p2.y) for line in tree.data[1:]],
+            tree.left, tree.right)
+
+def pairSegments(Points, I=None, J=None):
+    """
+    Sight segments between pairs of points, from the point with the lower index to the one with the higher index as
+    checkLoS builds them, so batch queries see the same sight segments
+    :param Points: float64 array (N, 2)
+    :param I: int array, first point of every pair, None for all pairs
+    :param J: int array, second point of every pair
+    :return: I and J with I[k] < J[k], and the sight segments, float64 array (len(I), 4)
+    """
+    if I is None:
+        I, J = np.triu_indices(len(Points), 1)
+    else:
+        I, J = np.minimum(I, J), np.maximum(I, J)
+    return I, J, np.hstack((Points[I], Points[J]))
+
+def fillMatrix(n, I, J, Visible, LoS=None):
+    """Sets entries [I[k]][J[k]] and [J[k]][I[k]] of the n by n boolean matrix 'LoS' (a new one, all False, if None)
+    to Visible[k] and returns it"""
+    if LoS is None:
+        LoS = np.zeros((n, n), dtype=bool)
+    LoS[I, J] = Visible
+    LoS[J, I] = Visible
+    return LoS
+
+def pairsToMatrix(points, checkSightSegments, Stats=None):
+    """Tests all pairs of 'points' with the batch function 'checkSightSegments' and returns the N by N boolean matrix"""
+    Points = toPointArray(points)
+    I, J, Segments = pairSegments(Points)
+    return fillMatrix(len(Points), I, J, checkSightSegments(Segments, Stats))
+
+def findPairsWithin(Points, Radius):
+    """
+    Finds all pairs of points at most 'Radius' apart with a uniform grid of cells 'Radius' wide, so only points in
+    the same or neighbouring cells are compared
+    :param Points: float64 array (N, 2)
+    :param Radius: float
+    :return: two int arrays I and J, the pairs (I[k], J[k]) with I[k] < J[k], ordered by I then J
+    """
+    n = len(Points)
+    if n < 2:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    CellSize = Radius if Radius > 0 else 1.0
+    Cells = np.floor((Points - Points.min(axis=0)) / CellSize).astype(np.int64)
+    # One spare row keeps the neighbours of the top and bottom rows from wrapping into the next column
+    Width = int(Cells[:, 1].max()) + 2
+    Keys = Cells[:, 0] * Width + Cells[:, 1]
+    Order = np.argsort(Keys, kind='stable')
+    SortedKeys = Keys[Order]
+
+    FromList = []
+    ToList = []
+    # Own cell and half of the neighbouring cells, the other half finds the same pairs from the other side
+    for dx, dy in ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1)):
+        Target = Keys + (dx * Width + dy)
+        Start = np.searchsorted(SortedKeys, Target, side='left')
+        Counts = np.searchsorted(SortedKeys, Target, side='right') - Start
+        From = np.repeat(np.arange(n), Counts)
+        Offsets = np.arange(len(From)) - np.repeat(np.cumsum(Counts) - Counts, Counts)
+        To = Order[np.repeat(Start, Counts) + Offsets]
+        if dx == 0 and dy == 0:
+            Keep = From < To
+            From = From[Keep]
+            To = To[Keep]
+        FromList.append(From)
+        ToList.append(To)
+
+    From = np.concatenate(FromList)
+    To = np.concatenate(ToList)
+    I = np.minimum(From, To)
+    J = np.maximum(From, To)
+    Difference = Points[J] - Points[I]
+    Keep = (Difference[:, 0] * Difference[:, 0] + Difference[:, 1] * Difference[:, 1]) <= Radius * Radius
+    I = I[Keep]
+    J = J[Keep]
+    Order = np.lexsort((J, I))
+    return I[Order], J[Order]
+
+def edgesToCSR(n, I, J):
+    """returns the symmetric adjacency of n nodes with edges (I[k], J[k]) in CSR form, arrays IndPtr (n + 1) and
+    Indices, the neighbours of node i are Indices[IndPtr[i]:IndPtr[i + 1]] in ascending order"""
+    From = np.concatenate((I, J))
+    To = np.concatenate((J, I))
+    Order = np.lexsort((To, From))
+    IndPtr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(From, minlength=n), out=IndPtr[1:])
+    return IndPtr, To[Order]
+
+TwoPi = 2 * math.pi
+
+class AngularIntervals:
+    """Union of closed intervals of directions in [0, 2 pi) as seen from a viewpoint, kept as two sorted lists of the
+    starts and stops of disjoint intervals"""
+    def __init__(self):
+        self.Starts = []
+        self.Stops = []
+
+    def cover(self, Start, Stop):
+        """
+        Adds the directions from 'Start' counter-clockwise to 'Stop', both in [0, 2 pi), wrapping through 0 if 'Stop'
+        is below 'Start'
+        :return: list of (Start, Stop), the parts that were not covered before, without wrapping
+        """
+        if Stop < Start:
+            return self.coverPart(Start, TwoPi) + self.coverPart(0.0, Stop)
+        return self.coverPart(Start, Stop)
+
+    def coverPart(self, Start, Stop):
+        """cover for Start <= Stop"""
+        first = bisect.bisect_left(self.Stops, Start)
+        last = first
+        Gaps = []
+        Current = Start
+        while last < len(self.Starts) and self.Starts[last] <= Stop:
+            if self.Starts[last] > Current:
+                Gaps.append((Current, self.Starts[last]))
+            Current = max(Current, self.Stops[last])
+            last += 1
+        if Current < Stop:
+            Gaps.append((Current, Stop))
+        if last > first:
+            Start = min(Start, self.Starts[first])
+            Stop = max(Stop, self.Stops[last - 1])
+        self.Starts[first:last] = [Start]
+        self.Stops[first:last] = [Stop]
+        return Gaps
+
+    def isFull(self):
+        """returns True once every direction is covered"""
+        return len(self.Starts) == 1 and self.Starts[0] <= 0.0 and self.Stops[0] >= TwoPi
+
+    def getGaps(self):
+        """returns list of (Start, Stop), the directions not covered in ascending order"""
+        Gaps = []
+        Current = 0.0
+        for Start, Stop in zip(self.Starts, self.Stops):
+            if Start > Current:
+                Gaps.append((Current, Start))
+            Current = max(Current, Stop)
+        if Current < TwoPi:
+            Gaps.append((Current, TwoPi))
+        return Gaps
+
+def getAngle(x, y):
+    """returns the direction of vector (x, y) in [0, 2 pi)"""
+    Angle = math.atan2(y, x)
+    return Angle + TwoPi if Angle < 0 else Angle
+
+def clipToDisk(x1, y1, x2, y2, Cx, Cy, Radius):
+    """returns the end points (x1, y1, x2, y2) of the part of a line segment inside the disk of 'Radius' around
+    (Cx, Cy), None if no part of it is"""
+    Dx = x2 - x1
+    Dy = y2 - y1
+    Fx = x1 - Cx
+    Fy = y1 - Cy
+    a = Dx * Dx + Dy * Dy
+    b = Fx * Dx + Fy * Dy
+    c = Fx * Fx + Fy * Fy - Radius * Radius
+    Discriminant = b * b - a * c
+    if a == 0 or Discriminant < 0:
+        return None
+    Root = math.sqrt(Discriminant)
+    t1 = max(0.0, (-b - Root) / a)
+    t2 = min(1.0, (-b + Root) / a)
+    if t1 >= t2:
+        return None
+    return (x1 + t1 * Dx if t1 > 0 else x1, y1 + t1 * Dy if t1 > 0 else y1,
+            x1 + t2 * Dx if t2 < 1 else x2, y1 + t2 * Dy if t2 < 1 else y2)
+
+def getRayPoint(Px, Py, Angle, x1, y1, x2, y2):
+    """returns the point where the ray from (Px, Py) in direction 'Angle' meets the line through (x1, y1), (x2, y2)"""
+    Cos = math.cos(Angle)
+    Sin = math.sin(Angle)
+    Dx = x2 - x1
+    Dy = y2 - y1
+    t = ((x1 - Px) * Sin - (y1 - Py) * Cos) / (Cos * Dy - Sin * Dx)
+    return x1 + t * Dx, y1 + t * Dy
+
+def getOuterBoundary(Px, Py, Start, Stop, Radius, Box, ArcSegments):
+    """
+    Boundary of the visible region where no wall is seen, from direction 'Start' to 'Stop'
+    :param Radius: float, the boundary is an arc of this radius around (Px, Py), or None to use 'Box'
+    :param Box: tuple (xmin, ymin, xmax, ymax) around (Px, Py), the boundary follows its sides
+    :param ArcSegments: int, number of polygon edges of a full circle
+    :return: list of (x, y)
+    """
+    if Radius is not None:
+        Steps = max(1, int(math.ceil((Stop - Start) * ArcSegments / TwoPi)))
+        return [(Px + Radius * math.cos(Angle), Py + Radius * math.sin(Angle))
+                for Angle in np.linspace(Start, Stop, Steps + 1).tolist()]
+
+    xmin, ymin, xmax, ymax = Box
+    def hitBox(Angle):
+        Cos = math.cos(Angle)
+        Sin = math.sin(Angle)
+        t = min((xmax - Px) / Cos if Cos > 0 else (xmin - Px) / Cos if Cos < 0 else math.inf,
+                (ymax - Py) / Sin if Sin > 0 else (ymin - Py) / Sin if Sin < 0 else math.inf)
+        return Px + t * Cos, Py + t * Sin
+    Corners = sorted((getAngle(x - Px, y - Py), (x, y)) for x, y in
+                     ((xmin, ymin), (xmax, ymin), (xmax, ymax), (xmin, ymax)))
+    return [hitBox(Start)] + [Corner for Angle, Corner in Corners if Start < Angle < Stop] + [hitBox(Stop)]
+
+def pointsInPolygon(Polygon, Points):
+    """
+    Even-odd test of many points against one polygon
+    :param Polygon: float64 array (V, 2), vertices in order
+    :param Points: float64 array (N, 2)
+    :return: boolean array (N), True for the points inside
+    """
+    Inside = np.zeros(len(Points), dtype=bool)
+    x = Points[:, 0]
+    y = Points[:, 1]
+    for index in range(len(Polygon)):
+        x1, y1 = Polygon[index - 1]
+        x2, y2 = Polygon[index]
+        if y1 == y2:
+            continue
+        Crossing = (y1 > y) != (y2 > y)
+        Inside ^= Crossing & (x < x1 + (y - y1) * (x2 - x1) / (y2 - y1))
+    return Inside
+
+def hitRays(Rays, x1, y1, x2, y2):
+    """
+    Parameter t where rays hit the line segment from (x1, y1) to (x2, y2)
+    :param Rays: float64 array (M, 4), rows (Ox, Oy, Dx, Dy), a ray reaches (Ox + t * Dx, Oy + t * Dy)
+    :return: float64 array (M), t >= 0 of the hit, infinity for rays that miss or run along the line segment
+    """
+    Ax = x1 - Rays[:, 0]
+    Ay = y1 - Rays[:, 1]
+    Ex = x2 - x1
+    Ey = y2 - y1
+    denom = Rays[:, 2] * Ey - Rays[:, 3] * Ex
+    Parallel = denom == 0
+    denom[Parallel] = 1.0
+    t = (Ax * Ey - Ay * Ex) / denom
+    u = (Ax * Rays[:, 3] - Ay * Rays[:, 2]) / denom
+    return np.where(~Parallel & (t >= 0) & (u >= 0) & (u <= 1), t, np.inf)
+
+def hitRay(Ox, Oy, Dx, Dy, line):
+    """Scalar hitRays for one ray and LineSegment 'line', returns t or infinity"""
+    Ax = line.p1.x - Ox
+    Ay = line.p1.y - Oy
+    Ex = line.p2.x - line.p1.x
+    Ey = line.p2.y - line.p1.y
+    denom = Dx * Ey - Dy * Ex
+    if denom == 0:
+        return math.inf
+    t = (Ax * Ey - Ay * Ex) / denom
+    u = (Ax * Dy - Ay * Dx) / denom
+    return t if t >= 0 and 0 <= u <= 1 else math.inf
+
+def splitRayInterval(Dot, Dd, Tmin, Tmax):
+    """
+    Where rays cross a splitter within their parameter interval [Tmin, Tmax], same for scalars and arrays
+    :param Dot: splitter side (dot product with its normal) of the ray origins
+    :param Dd: dot product of the ray directions with the normal of the splitter, not 0
+    :return: Tsplit (t of the crossing), Slack (t the crossing may be off by, as partitioning puts line segments
+    within DoubleTolerance of a splitter on either side of it) and InFront (ray is in front of the splitter at Tmin)
+    """
+    Tsplit = -Dot / Dd
+    Slack = DoubleTolerance / abs(Dd)
+    Start = Dot + Tmin * Dd
+    InFront = (Start > 0) | ((Start == 0) & (Dd > 0))
+    return Tsplit, Slack, InFront
+
+def walkRays(flat, Rays, MaxT):
+    """
+    Batch traversal of BSP.raycastBatch. Each ray carries the parameter interval it spans in the current node's
+    region, so sub-trees it cannot reach, or can only reach beyond its nearest hit so far, are skipped. Of the two
+    children of a node, every ray visits the one on its own side first
+    :param flat: FlatTree
+    :param Rays: float64 array (M, 4), see hitRays
+    :param MaxT: float64 array (M), hits beyond are ignored
+    :return: int array (M), the row in 'flat.Lines' of the nearest hit, -1 for none, and float64 array (M), its t,
+    infinity for none
+    """
+    Best = np.array(MaxT, dtype=np.float64)
+    BestRow = np.full(len(Rays), -1, dtype=np.int64)
+    if len(Rays) == 0 or len(flat.Left) == 0:
+        return BestRow, np.full(len(Rays), np.inf)
+
+    stack = [(0, np.arange(len(Rays)), np.zeros(len(Rays)), Best.copy())]
+    while len(stack) != 0:
+        node, Active, Tmin, Tmax = stack.pop()
+        Tmax = np.minimum(Tmax, Best[Active])
+        Keep = Tmin <= Tmax
+        Active, Tmin, Tmax = Active[Keep], Tmin[Keep], Tmax[Keep]
+        if len(Active) == 0:
+            continue
+
+        Start = flat.NodeStart[node]
+        Px, Py = flat.Lines[Start, 0:2].tolist()
+        Nx, Ny = flat.Normals[Start].tolist()
+        Sub = Rays[Active]
+        Dot = Nx * (Sub[:, 0] - Px) + Ny * (Sub[:, 1] - Py)
+        Dd = Nx * Sub[:, 2] + Ny * Sub[:, 3]
+        # Rays parallel to the splitter stay on their side, they get a direction that never crosses within reach
+        Parallel = Dd == 0
+        Dd[Parallel] = np.where(Dot[Parallel] >= 0, 1.0, -1.0)
+        Tsplit, Slack, InFront = splitRayInterval(Dot, Dd, Tmin, Tmax)
+        Crossing = ~Parallel & (Tsplit + Slack >= Tmin) & (Tsplit - Slack <= Tmax)
+
+        Cross = np.flatnonzero(Crossing)
+        if len(Cross) > 0:
+            for Row in range(Start, flat.NodeStart[node + 1]):
+                t = hitRays(Sub[Cross], *flat.Lines[Row].tolist())
+                # A hit exactly at MaxT counts, a miss (infinity) never does, even without MaxT
+                Better = (t < Best[Active[Cross]]) | \
+                    ((t == Best[Active[Cross]]) & (BestRow[Active[Cross]] == -1) & (t != np.inf))
+                Best[Active[Cross[Better]]] = t[Better]
+                BestRow[Active[Cross[Better]]] = Row
+
+        NearEnd = np.where(Crossing, np.minimum(Tmax, Tsplit + Slack), Tmax)
+        FarStart = np.maximum(Tmin, Tsplit - Slack)
+        # Both sides in one go, each ray with the part of its interval on that side
+        Behind = ~InFront
+        Children = [(flat.Left[node], InFront | Crossing,
+                     np.where(InFront, Tmin, FarStart), np.where(InFront, NearEnd, Tmax)),
+                    (flat.Right[node], Behind | Crossing,
+                     np.where(Behind, Tmin, FarStart), np.where(Behind, NearEnd, Tmax))]
+        # The side nearer to most of the rays is popped first
+        if 2 * np.count_nonzero(InFront) >= len(InFront):
+            Children.reverse()
+        for Child, Side, From, To in Children:
+            if Child != -1 and Side.any():
+                stack.append((Child, Active[Side], From[Side], To[Side]))
+    Best[BestRow == -1] = np.inf
+    return BestRow, Best
 
 class BinaryTree:
     """Binary tree class"""
@@ -7,14 +609,16 @@ class BinaryTree:
         self.left = None
         self.right = None
         self.data = []
+        # Bounding box (xmin, ymin, xmax, ymax) of all line segments in this sub-tree, None while unknown
+        self.box = None
 
     def printTree(self):
         """Prints the all tree nodes 'Name' attribute in a binary tree format (needs to be improved)"""
-        queue = [self]
+        queue = collections.deque([self])
         PrintString = ''
 
         while len(queue) > 0:
-            tree = queue.pop(0)
+            tree = queue.popleft()
 
             List = []
             for line in tree.data:
@@ -41,16 +645,178 @@ class BinaryTree:
             PrintString += '\n'
         return PrintString
 
+class FlatTree:
+    """Compact struct of arrays form of a finished BSP tree, it holds no Python objects per node so it is cheap to keep
+    in memory, to pickle and to share between processes. Nodes are numbered in depth first order, root node is 0,
+    fragments of node k are rows NodeStart[k] to NodeStart[k + 1] of 'Lines' and 'Normals', splitter of the node first"""
+    def __init__(self, Lines, Normals, NodeStart, Left, Right, Ids=None, Boxes=None):
+        """
+        :param Lines: float64 array (F, 4), end points (x1, y1, x2, y2) of all line segments in the tree
+        :param Normals: float64 array (F, 2), normal vector of every line segment in 'Lines'
+        :param NodeStart: int32 array (K + 1), offsets of the line segments of every node into 'Lines'
+        :param Left: int32 array (K), index of the left sub-tree of every node, -1 for none
+        :param Right: int32 array (K), index of the right sub-tree of every node, -1 for none
+        :param Ids: int32 array (F), wall Id of every line segment in 'Lines', -1 for none
+        :param Boxes: float64 array (K, 4), bounding box of the sub-tree of every node, computed if None
+        """
+        self.Lines = Lines
+        self.Normals = Normals
+        self.NodeStart = NodeStart
+        self.Left = Left
+        self.Right = Right
+        self.Ids = Ids if Ids is not None else np.full(len(Lines), -1, dtype=np.int32)
+        self.Boxes = Boxes if Boxes is not None else getNodeBoxes(Lines, NodeStart, Left, Right)
+
+    @classmethod
+    def fromTree(cls, tree):
+        """Compiles a BinaryTree generated by BSP.generateTree into a FlatTree"""
+        Nodes = []
+        if len(tree.data) > 0:
+            stack = [tree]
+            while len(stack) != 0:
+                TreePointer = stack.pop()
+                Nodes.append(TreePointer)
+                if TreePointer.right is not None:
+                    stack.append(TreePointer.right)
+                if TreePointer.left is not None:
+                    stack.append(TreePointer.left)
+
+        NodeIndex = {id(TreePointer): index for index, TreePointer in enumerate(Nodes)}
+        Lines = []
+        Normals = []
+        Ids = []
+        NodeStart = [0]
+        for TreePointer in Nodes:
+            for line in TreePointer.data:
+                Lines.append((line.p1.x, line.p1.y, line.p2.x, line.p2.y))
+                Normals.append((line.NormalV.x, line.NormalV.y))
+                Ids.append(line.Id if line.Id is not None else -1)
+            NodeStart.append(len(Lines))
+
+        return cls(
+            np.array(Lines, dtype=np.float64).reshape(-1, 4),
+            np.array(Normals, dtype=np.float64).reshape(-1, 2),
+            np.array(NodeStart, dtype=np.int32),
+            np.array([NodeIndex[id(t.left)] if t.left is not None else -1 for t in Nodes], dtype=np.int32),
+            np.array([NodeIndex[id(t.right)] if t.right is not None else -1 for t in Nodes], dtype=np.int32),
+            np.array(Ids, dtype=np.int32))
+
+    def getSplitter(self, node):
+        """returns the splitter of 'node' as a tuple (x1, y1, x2, y2, Nx, Ny), see getSplitterRow"""
+        index = self.NodeStart[node]
+        return tuple(self.Lines[index].tolist() + self.Normals[index].tolist())
+
+    def getCollinear(self, node):
+        """returns a list of tuples (x1, y1, x2, y2) of the line segments of 'node' other than its splitter"""
+        return self.Lines[self.NodeStart[node] + 1:self.NodeStart[node + 1]].tolist()
+
+    def countNodes(self, node=0):
+        """returns the number of line segments in the sub-tree rooted at 'node', the same count as BSP.countNodes"""
+        if len(self.Left) == 0:
+            return 0
+        if node == 0:
+            # The whole tree, every line segment is in the arrays once
+            return int(self.NodeStart[-1])
+        count = 0
+        stack = [node]
+        while len(stack) != 0:
+            node = stack.pop()
+            count += self.NodeStart[node + 1] - self.NodeStart[node]
+            if self.Left[node] != -1:
+                stack.append(self.Left[node])
+            if self.Right[node] != -1:
+                stack.append(self.Right[node])
+        return int(count)
+
+    def getNode(self, node):
+        """getNode function of walkSightSegments for FlatTree nodes"""
+        Left = self.Left[node]
+        Right = self.Right[node]
+        return (self.getSplitter(node), self.getCollinear(node),
+                Left if Left != -1 else None, Right if Right != -1 else None)
+
+    def getBox(self, node):
+        """getBox function of walkSightSegments for FlatTree nodes"""
+        return self.Boxes[node].tolist()
+
+    def checkSightSegments(self, segments, Stats=None, UseBoxes=True):
+        """Same as BSP.checkSightSegments, but traverses the arrays instead of the BinaryTree objects
+        :param UseBoxes: boolean, skip sub-trees whose bounding box a sight segment misses
+        """
+        Segments = np.asarray(segments, dtype=np.float64).reshape(-1, 4)
+        return walkSightSegments(Segments, 0 if len(self.Left) > 0 else None, self.getNode, Stats,
+                                 self.getBox if UseBoxes else None)
+
+    def checkLoSBatch(self, points, Stats=None):
+        """Same as BSP.checkLoSBatch, but traverses the arrays instead of the BinaryTree objects"""
+        return pairsToMatrix(points, self.checkSightSegments, Stats)
+
+    def raycastBatch(self, Origins, Directions, MaxT=None):
+        """Same as BSP.raycastBatch"""
+        Rays = np.hstack((toPointArray(Origins), toPointArray(Directions)))
+        MaxT = np.broadcast_to(np.asarray(MaxT if MaxT is not None else np.inf, dtype=np.float64), len(Rays))
+        Rows, T = walkRays(self, Rays, MaxT)
+        Hit = Rows != -1
+        Ids = np.full(len(Rays), -1, dtype=np.int64)
+        Ids[Hit] = self.Ids[Rows[Hit]]
+        # Only where a ray hit, t is infinite for the others and infinity times a zero direction component is NaN
+        Points = np.full((len(Rays), 2), np.nan)
+        Points[Hit] = Rays[Hit, 0:2] + T[Hit, None] * Rays[Hit, 2:4]
+        return Ids, Points, T
+
 class BSP:
     """Binary Space Partition class, optimally generates BSP tree from a list of line segments by using a heuristic"""
-    def __init__(self):
-        """Constructor, initializes binary tree"""
+    def __init__(self, SampleSize=32, SegmentSampleSize=None, Stratified=False, Seed=None, Vectorized=False,
+                 RebalanceDepth=3.0, RebalanceImbalance=0.8, Robust=False, RobustTolerance=RelativeTolerance,
+                 UseBoxes=True):
+        """
+        Constructor, initializes binary tree, the sampling arguments configure the sampled heuristics ('sample-even'
+        and 'sample-min') only, the exhaustive heuristics ignore them
+        :param SampleSize: int, number of candidate splitters scored at every sub-tree
+        :param SegmentSampleSize: int, number of line segments every candidate is compared with, None to compare with all
+        :param Stratified: boolean, draw one candidate from each of 'SampleSize' equal slices of the list if true,
+        otherwise draw candidates uniformly at random
+        :param Seed: int, seed of the random number generator used for sampling, None for a random seed
+        :param Vectorized: boolean, score candidates of the exhaustive heuristics with NumPy (see countSides), the
+        chosen splitters are the same as with the pure Python loops
+        :param RebalanceDepth: float, insert rebalances once the depth of the new node exceeds this factor times
+        log2 of the number of line segments in the tree, None to never rebalance
+        :param RebalanceImbalance: float, share of the line segments of a sub-tree in its larger child sub-tree above
+        which the sub-tree is rebuilt when rebalancing, see rebalance
+        :param Robust: boolean, partition with LineSegment.compareRobust and splitRobust (relative tolerance, exact
+        fallback, fragments always on one side) instead of compare and split, line of sight queries are unchanged and
+        the vectorized heuristics still score candidates with compare
+        :param RobustTolerance: float, relative tolerance of the robust predicates, 0 for exact predicates
+        :param UseBoxes: boolean, line of sight queries skip sub-trees whose bounding box the sight segment misses,
+        the boxes are kept up to date either way
+        """
         self.tree = BinaryTree()
+        self.SampleSize = SampleSize
+        self.SegmentSampleSize = SegmentSampleSize
+        self.Stratified = Stratified
+        self.Random = np.random.default_rng(Seed)
+        self.Vectorized = Vectorized
+        self.RebalanceDepth = RebalanceDepth
+        self.RebalanceImbalance = RebalanceImbalance
+        self.Robust = Robust
+        self.RobustTolerance = RobustTolerance
+        self.UseBoxes = UseBoxes
+        # Walls by Id, Ids are assigned by generateTree and insert
+        self.Segments = {}
+        self.NextId = 0
+        self.SegmentCount = 0
+        self.UseHeuristic = 'even'
+        # FlatTree compiled from self.tree by compileTree, None while not compiled
+        self.flat = None
+        # Incremented by every change of the tree, results derived from the tree are stale once it differs
+        self.Version = 0
+        # Fragments of split line segments that compared as neither front nor back of the splitter, they are dropped
+        self.MisclassifiedFragments = 0
 
     def readLinesFromFile(self, filename):
         """Not in use currently"""
         with open(filename, 'r') as f:
-            for line in f.readlines():
+            for line in f:
                 if line[0] != '#':
                     data = [x for x in line.split('\t')]
                     points = [int(x) for x in data[0].split(',')]
@@ -61,7 +827,7 @@ class BSP:
         """Not in use currently"""
         with open(filename, 'r') as f:
             data = []
-            for line in f.readlines():
+            for line in f:
                 if line[0] != '#':
                     point = [int(x) for x in line.split(',')]
                     data.append(Point(point[0], point[1]))
@@ -69,13 +835,20 @@ class BSP:
 
     def heuristicMinimumPartition(self, ListLineSegments):
         """Returns the index of the line segment in 'ListLineSegments' which causes the least amount of partitions with other line segments in the list"""
+        if self.Vectorized:
+            PartitionCount = countSides(ListLineSegments)[:, SidePartition]
+            if len(PartitionCount) == 0 or PartitionCount.min() >= 99999999:
+                return 0
+            # argmin returns the first minimum, the same one the loop below keeps
+            return int(np.argmin(PartitionCount))
+
         MinIndex = 0
         MinPartition = 99999999
         for index, ALineSegment in enumerate(ListLineSegments):
             PartitionCount = 0
             for OtherIndex, OtherLineSegment in enumerate(ListLineSegments):
                 if index != OtherIndex:
-                    CompareResult = ALineSegment.compare(OtherLineSegment)
+                    CompareResult = self.compareLines(ALineSegment, OtherLineSegment)
                     if CompareResult == 'P':
                         PartitionCount += 1
 
@@ -87,6 +860,17 @@ class BSP:
 
     def heuristicEvenDivide(self, ListLineSegments):
         """Returns the index of the line segment in 'ListLineSegments' which produces the most balanced tree"""
+        if self.Vectorized:
+            Counts = countSides(ListLineSegments)
+            LeftCount = Counts[:, SideFront] + Counts[:, SidePartition]
+            RightCount = Counts[:, SideBack] + Counts[:, SidePartition]
+            Divide = np.abs(LeftCount - RightCount)
+            if len(Divide) == 0 or Divide.min() >= 99999999:
+                return 0
+            # The loop below keeps the first index with the smallest (divide, number of nodes) pair
+            Nodes = np.where(Divide == Divide.min(), LeftCount + RightCount, np.iinfo(np.int64).max)
+            return int(np.argmin(Nodes))
+
         BestIndex = 0
         MinDivide = 99999999
         MinNodes = 99999999
@@ -95,7 +879,7 @@ class BSP:
             RightCount = 0
             for OtherIndex, OtherLineSegment in enumerate(ListLineSegments):
                 if index != OtherIndex:
-                    CompareResult = ALineSegment.compare(OtherLineSegment)
+                    CompareResult = self.compareLines(ALineSegment, OtherLineSegment)
                     if CompareResult == 'P':
                         LeftCount += 1
                         RightCount += 1
@@ -116,38 +900,140 @@ class BSP:
 
         return BestIndex
 
+    def sampleIndices(self, n, SampleSize, Stratified=False):
+        """returns up to 'SampleSize' distinct indices in ascending order out of range(n), all of them if 'SampleSize' is
+        None or not less than n"""
+        if SampleSize is None or SampleSize >= n:
+            return range(n)
+        if Stratified:
+            Bounds = np.linspace(0, n, SampleSize + 1).astype(int)
+            return (Bounds[:-1] + self.Random.integers(0, Bounds[1:] - Bounds[:-1])).tolist()
+        return np.sort(self.Random.choice(n, SampleSize, replace=False)).tolist()
+
+    def heuristicSampled(self, ListLineSegments, Score='even'):
+        """
+        Same selection as heuristicEvenDivide or heuristicMinimumPartition, but only a sample of 'self.SampleSize'
+        candidates is scored, optionally against a sample of 'self.SegmentSampleSize' line segments, so choosing a
+        splitter costs O(SampleSize * SegmentSampleSize) instead of O(n^2)
+        :param ListLineSegments: list of LineSegment
+        :param Score: string, 'even' to score candidates like heuristicEvenDivide, 'min' like heuristicMinimumPartition
+        :return: index of the chosen line segment in 'ListLineSegments'
+        """
+        Candidates = self.sampleIndices(len(ListLineSegments), self.SampleSize, self.Stratified)
+        Others = self.sampleIndices(len(ListLineSegments), self.SegmentSampleSize)
+
+        BestIndex = Candidates[0]
+        MinDivide = 99999999
+        MinNodes = 99999999
+        for index in Candidates:
+            ALineSegment = ListLineSegments[index]
+            LeftCount = 0
+            RightCount = 0
+            PartitionCount = 0
+            for OtherIndex in Others:
+                if index != OtherIndex:
+                    CompareResult = self.compareLines(ALineSegment, ListLineSegments[OtherIndex])
+                    if CompareResult == 'P':
+                        PartitionCount += 1
+                    elif CompareResult == 'F':
+                        LeftCount += 1
+                    elif CompareResult == 'B':
+                        RightCount += 1
+
+            if Score == 'min':
+                Divide, Nodes = PartitionCount, 0
+            else:
+                Divide = abs(LeftCount - RightCount)
+                Nodes = LeftCount + RightCount + 2 * PartitionCount
+
+            if Divide < MinDivide or (Divide == MinDivide and Nodes < MinNodes):
+                MinDivide = Divide
+                MinNodes = Nodes
+                BestIndex = index
+
+        return BestIndex
+
+    def compareLines(self, Splitter, OtherLine):
+        """'Splitter.compare(OtherLine)', or compareRobust in robust mode"""
+        if self.Robust:
+            return Splitter.compareRobust(OtherLine, self.RobustTolerance)
+        return Splitter.compare(OtherLine)
+
+    def splitLines(self, Splitter, OtherLine):
+        """returns the fragments of 'OtherLine' partitioned by 'Splitter' as a list of (side, fragment), side is the
+        comparison of the fragment with 'Splitter', 'F' or 'B' unless the fragment is degenerate"""
+        if self.Robust:
+            Front, Back = Splitter.splitRobust(OtherLine, self.RobustTolerance)
+            return [('F', Front), ('B', Back)]
+        return [(Splitter.compare(SplitLine), SplitLine) for SplitLine in Splitter.split(OtherLine)]
+
     def generateTree(self, tree, UseHeuristic='even'):
         """
         Generates the binary space partition tree recursively using the specified heuristic at each sub-tree
         :param tree: BinaryTree, value should be self.tree on the first call, this argument exists so we can traverse the tree recursively
-        :param UseHeuristic: string, either 'even' for balanced tree or 'min' for least number of nodes
+        :param UseHeuristic: string, either 'even' for balanced tree or 'min' for least number of nodes, 'sample-even' and
+        'sample-min' select the same way from a sample of candidates only, see heuristicSampled
         :return: nothing
         """
+        # Any compiled FlatTree is out of date now
+        self.flat = None
+        self.Version += 1
+        if tree is self.tree:
+            self.UseHeuristic = UseHeuristic
+            for L in tree.data:
+                self.registerSegment(L)
+
+        for SubTree in self.partitionTree(tree, UseHeuristic):
+            self.generateTree(SubTree, UseHeuristic)
+        self.updateBox(tree)
+
+        if tree is self.tree:
+            self.SegmentCount = self.countNodes(self.tree)
+
+    def updateBox(self, tree):
+        """Sets the bounding box of node 'tree' from its line segments and the boxes of its children, children without
+        a box get theirs first"""
+        Box = getBox(tree.data)
+        for Child in (tree.left, tree.right):
+            if Child is not None:
+                if Child.box is None:
+                    self.updateBox(Child)
+                Box = mergeBoxes(Box, Child.box)
+        tree.box = Box
+
+    def partitionTree(self, tree, UseHeuristic):
+        """
+        Partitions a single node, chooses the splitter of 'tree' with the heuristic and distributes the other line
+        segments of the node among the node itself (collinear ones) and its new left and right sub-trees
+        :return: list of the new sub-trees that hold more than one line segment and still need to be partitioned
+        """
         BestIndex = 0
         if UseHeuristic == 'min':
             BestIndex = self.heuristicMinimumPartition(tree.data)
         elif UseHeuristic == 'even':
             BestIndex = self.heuristicEvenDivide(tree.data)
+        elif UseHeuristic == 'sample-even':
+            BestIndex = self.heuristicSampled(tree.data, 'even')
+        elif UseHeuristic == 'sample-min':
+            BestIndex = self.heuristicSampled(tree.data, 'min')
 
         DataList = []
         DataListLeft = []
         DataListRight = []
+        tree.box = None
         H = tree.data.pop(BestIndex)
         DataList.append(H)
 
         for L in tree.data:
-            result = H.compare(L)
+            result = self.compareLines(H, L)
             if result == 'P':
-                SplitLines = H.split(L)
-
-                for SplitLine in SplitLines:
-                    SplitCompare = H.compare(SplitLine)
+                for SplitCompare, SplitLine in self.splitLines(H, L):
                     if SplitCompare == 'F':
                         DataListLeft.append(SplitLine)
                     elif SplitCompare == 'B':
                         DataListRight.append(SplitLine)
                     else:
-                        print('Error!!', SplitCompare)
+                        self.MisclassifiedFragments += 1
 
             elif result == 'C':
                 DataList.append(L)
@@ -159,20 +1045,294 @@ class BSP:
                 DataListRight.append(L)
 
         tree.data = DataList
+        SubTrees = []
         if len(DataListLeft) > 0:
             tree.left = BinaryTree()
             tree.left.data = DataListLeft
             if len(DataListLeft) > 1:
-                self.generateTree(tree.left, UseHeuristic)
+                SubTrees.append(tree.left)
 
         if len(DataListRight) > 0:
             tree.right = BinaryTree()
             tree.right.data = DataListRight
             if len(DataListRight) > 1:
-                self.generateTree(tree.right, UseHeuristic)
+                SubTrees.append(tree.right)
+        return SubTrees
+
+    def generateTreeParallel(self, tree, UseHeuristic='even', Workers=None, Threshold=1000, Executor=None):
+        """
+        Same as generateTree, but sub-trees with at least 'Threshold' line segments are generated by a pool of worker
+        processes and stitched back under their parents. Nodes near the root are partitioned here until there are
+        enough independent sub-trees to keep all workers busy, smaller sub-trees are generated here while the workers
+        run.
+        The tree is the same as the one of generateTree, except for the sampled heuristics whose random choices differ,
+        every worker samples with a seed drawn from the BSP's generator, so a seeded BSP still builds the same tree
+        every time
+        :param tree: BinaryTree, normally self.tree
+        :param UseHeuristic: string, see generateTree
+        :param Workers: int, number of worker processes, defaults to the number of CPUs
+        :param Threshold: int, smallest sub-tree (number of line segments) sent to a worker
+        :param Executor: concurrent.futures.Executor to use instead of a new process pool
+        :return: nothing
+        """
+        self.flat = None
+        self.Version += 1
+        if tree is self.tree:
+            self.UseHeuristic = UseHeuristic
+            for L in tree.data:
+                self.registerSegment(L)
+        if Workers is None:
+            Workers = os.cpu_count() or 1
+
+        # Largest sub-trees first, the counter keeps heap entries comparable
+        Pending = [(-len(tree.data), 0, tree)] if len(tree.data) > 1 else []
+        Counter = 1
+        while len(Pending) != 0 and len(Pending) < 2 * Workers and -Pending[0][0] >= Threshold:
+            Size, Index, SubTree = heapq.heappop(Pending)
+            for Child in self.partitionTree(SubTree, UseHeuristic):
+                heapq.heappush(Pending, (-len(Child.data), Counter, Child))
+                Counter += 1
+
+        Remote = [SubTree for Size, Index, SubTree in Pending if -Size >= Threshold]
+        Local = [SubTree for Size, Index, SubTree in Pending if -Size < Threshold]
+        if len(Remote) == 0:
+            for SubTree in Local:
+                self.generateTree(SubTree, UseHeuristic)
+        else:
+            Options = {
+                'SampleSize': self.SampleSize,
+                'SegmentSampleSize': self.SegmentSampleSize,
+                'Stratified': self.Stratified,
+                'Vectorized': self.Vectorized,
+                'Robust': self.Robust,
+                'RobustTolerance': self.RobustTolerance}
+            # Drawn in submission order, which does not depend on the order the workers finish in
+            Seeds = self.Random.integers(0, 2 ** 63 - 1, len(Remote)).tolist()
+            Pool = Executor if Executor is not None else concurrent.futures.ProcessPoolExecutor(Workers)
+            try:
+                Futures = {Pool.submit(buildSubtree, SubTree.data, UseHeuristic, Options, Seed): SubTree
+                           for SubTree, Seed in zip(Remote, Seeds)}
+                # The small sub-trees are generated here while the workers generate the large ones
+                for SubTree in Local:
+                    self.generateTree(SubTree, UseHeuristic)
+                for Future in concurrent.futures.as_completed(Futures):
+                    SubTree = Futures[Future]
+                    Result, Misclassified = Future.result()
+                    self.MisclassifiedFragments += Misclassified
+                    SubTree.data = Result.data
+                    SubTree.left = Result.left
+                    SubTree.right = Result.right
+            finally:
+                if Executor is None:
+                    Pool.shutdown()
+        # Nodes partitioned here have no box yet, the sub-trees generated anywhere have theirs
+        self.updateBox(tree)
+
+        if tree is self.tree:
+            self.SegmentCount = self.countNodes(self.tree)
+
+    def registerSegment(self, segment):
+        """Assigns the next free Id to 'segment' if it has none and remembers it as the wall with that Id"""
+        if segment.Id is None:
+            segment.Id = self.NextId
+        self.NextId = max(self.NextId, segment.Id + 1)
+        self.Segments.setdefault(segment.Id, segment)
+        return segment.Id
+
+    def insert(self, segment):
+        """
+        Inserts a wall into the generated tree without rebuilding it, the wall is pushed down from the root and split by
+        the splitters it crosses until every fragment reaches an empty child (a new leaf) or a node it is collinear with
+        :param segment: LineSegment
+        :return: Id of the inserted wall, use it to remove the wall again
+        """
+        self.flat = None
+        self.Version += 1
+        Id = self.registerSegment(segment)
+        if len(self.tree.data) == 0:
+            self.tree.data.append(segment)
+            self.tree.box = getBox(self.tree.data)
+            self.SegmentCount = 1
+            return Id
+
+        DeepestPath = None
+        stack = [([self.tree], segment)]
+        while len(stack) != 0:
+            Path, L = stack.pop()
+            TreePointer = Path[-1]
+            # 'L' ends up somewhere in this sub-tree
+            TreePointer.box = mergeBoxes(TreePointer.box, getBox([L]))
+            H = TreePointer.data[0]
+            result = self.compareLines(H, L)
+            if result == 'P':
+                Fragments = self.splitLines(H, L)
+            else:
+                Fragments = [(result, L)]
+
+            for result, Fragment in Fragments:
+                if result == 'P':
+                    # Still crossing the splitter after the split, possible within DoubleTolerance of it only, the
+                    # fragment is dropped and counted as in partitionTree
+                    self.MisclassifiedFragments += 1
+                    continue
+                if result == 'C':
+                    TreePointer.data.append(Fragment)
+                    self.SegmentCount += 1
+                elif result == 'F' or result == 'B':
+                    Child = TreePointer.left if result == 'F' else TreePointer.right
+                    if Child is not None:
+                        stack.append((Path + [Child], Fragment))
+                        continue
+
+                    Child = BinaryTree()
+                    Child.data.append(Fragment)
+                    Child.box = getBox(Child.data)
+                    if result == 'F':
+                        TreePointer.left = Child
+                    else:
+                        TreePointer.right = Child
+                    self.SegmentCount += 1
+                    if DeepestPath is None or len(Path) >= len(DeepestPath):
+                        DeepestPath = Path + [Child]
+
+        if DeepestPath is not None:
+            self.rebalance(DeepestPath)
+        return Id
+
+    def remove(self, segment_id):
+        """
+        Removes all fragments of a wall from the generated tree, a node left without line segments has its sub-tree
+        rebuilt from the remaining line segments in it
+        :param segment_id: int, Id of the wall as assigned by generateTree or insert
+        :return: number of fragments removed
+        """
+        segment = self.Segments.pop(segment_id, None)
+        if segment is None or len(self.tree.data) == 0:
+            return 0
+        self.flat = None
+        self.Version += 1
+
+        # Fragments of the wall can only be where inserting the wall again would put them, and in nodes it is
+        # collinear with on the way down, so visit those nodes only
+        Removed = 0
+        EmptyNodes = []
+        Visited = []
+        stack = [(self.tree, None, None)]
+        while len(stack) != 0:
+            TreePointer, Parent, Side = stack.pop()
+            Visited.append(TreePointer)
+            result = self.compareLines(TreePointer.data[0], segment)
+            Remaining = [L for L in TreePointer.data if L.Id != segment_id]
+            if len(Remaining) != len(TreePointer.data):
+                Removed += len(TreePointer.data) - len(Remaining)
+                if len(Remaining) == 0:
+                    EmptyNodes.append((TreePointer, Parent, Side))
+                elif Remaining[0] is not TreePointer.data[0] and \
+                        Remaining[0].NormalV.dotProduct(TreePointer.data[0].NormalV) < 0:
+                    # A collinear line segment facing the other way takes over as splitter, front and back swap
+                    TreePointer.left, TreePointer.right = TreePointer.right, TreePointer.left
+                    result = {'F': 'B', 'B': 'F'}.get(result, result)
+                TreePointer.data = Remaining
+
+            if result != 'B' and TreePointer.left is not None:
+                stack.append((TreePointer.left, TreePointer, 'left'))
+            if result != 'F' and TreePointer.right is not None:
+                stack.append((TreePointer.right, TreePointer, 'right'))
+
+        # Ancestors come before their descendants in EmptyNodes, rebuilding an ancestor takes the descendants along
+        Absorbed = set()
+        for TreePointer, Parent, Side in EmptyNodes:
+            if id(TreePointer) in Absorbed:
+                continue
+            Fragments = []
+            for SubTree in (TreePointer.left, TreePointer.right):
+                if SubTree is not None:
+                    Fragments.extend(self.collectSegments(SubTree, Absorbed))
+            Absorbed.add(id(TreePointer))
+
+            TreePointer.left = None
+            TreePointer.right = None
+            TreePointer.data = Fragments
+            if len(Fragments) > 0:
+                self.generateTree(TreePointer, self.UseHeuristic)
+            elif Parent is not None:
+                setattr(Parent, Side, None)
+
+        # Boxes only shrink where fragments were removed, on the visited nodes, children come after their parents
+        for TreePointer in reversed(Visited):
+            Box = getBox(TreePointer.data)
+            for Child in (TreePointer.left, TreePointer.right):
+                if Child is not None:
+                    Box = mergeBoxes(Box, Child.box)
+            TreePointer.box = Box
+        self.SegmentCount = self.countNodes(self.tree)
+        return Removed
+
+    def collectSegments(self, tree, Visited=None):
+        """returns a list of all line segments in the sub-tree 'tree', adds id() of every node to set 'Visited' if given"""
+        Segments = []
+        stack = [tree]
+        while len(stack) != 0:
+            TreePointer = stack.pop()
+            if Visited is not None:
+                Visited.add(id(TreePointer))
+            Segments.extend(TreePointer.data)
+            if TreePointer.left is not None:
+                stack.append(TreePointer.left)
+            if TreePointer.right is not None:
+                stack.append(TreePointer.right)
+        return Segments
+
+    def rebalance(self, Path):
+        """
+        Rebuilds a single sub-tree on 'Path' (list of nodes from the root down to a newly inserted leaf) if the leaf is
+        deeper than 'self.RebalanceDepth' times log2 of the number of line segments. Walking up from the leaf, the
+        sub-tree rebuilt is the first one whose larger child holds more than 'self.RebalanceImbalance' of its line
+        segments or whose depth exceeds 'self.RebalanceDepth' times log2 of its own number of line segments
+        :return: the rebuilt sub-tree or None
+        """
+        if self.RebalanceDepth is None or \
+                len(Path) <= self.RebalanceDepth * math.log2(self.SegmentCount + 1):
+            return None
+
+        Size = len(Path[-1].data)
+        for index in range(len(Path) - 2, -1, -1):
+            TreePointer = Path[index]
+            ChildSize = Size
+            OtherChild = TreePointer.right if TreePointer.left is Path[index + 1] else TreePointer.left
+            OtherSize = self.countNodes(OtherChild) if OtherChild is not None else 0
+            Size = len(TreePointer.data) + ChildSize + OtherSize
+
+            Depth = len(Path) - index
+            if max(ChildSize, OtherSize) > self.RebalanceImbalance * Size or \
+                    Depth > self.RebalanceDepth * math.log2(Size + 1):
+                self.rebuildSubtree(TreePointer)
+                return TreePointer
+        return None
+
+    def rebuildSubtree(self, tree):
+        """Regenerates the sub-tree 'tree' in place from the line segments it holds, with the last used heuristic"""
+        Segments = self.collectSegments(tree)
+        OldCount = len(Segments)
+        tree.left = None
+        tree.right = None
+        tree.data = Segments
+        self.generateTree(tree, self.UseHeuristic)
+        if tree is not self.tree:
+            self.SegmentCount += self.countNodes(tree) - OldCount
+
+    def compileTree(self):
+        """Compiles the generated tree into a FlatTree, batch queries use the arrays from then on,
+        :return: the FlatTree, also kept in self.flat
+        """
+        self.flat = FlatTree.fromTree(self.tree)
+        return self.flat
 
     def countNodes(self, tree):
-        """returns the number of nodes in the entire tree by traversing the tree"""
+        """returns the number of nodes in the entire tree by traversing the tree, or from the arrays of the compiled
+        tree if 'tree' is the root and the tree is compiled"""
+        if tree is self.tree and self.flat is not None:
+            return self.flat.countNodes()
         count = len(tree.data)
         if tree.left is not None:
             count += self.countNodes(tree.left)
@@ -180,10 +1340,11 @@ class BSP:
             count += self.countNodes(tree.right)
         return count
 
-    def checkLoS(self, points):
+    def checkLoS(self, points, Stats=None):
         """Determine line of sight between all points in the list by constructing a line segment for the two points
         in question and comparing it for intersection with line segments in the BSP tree
         :param points: a list of Point objects
+        :param Stats: QueryStats to record the traversal of every pair in, or None
         :return: a list of lists, n by n, an entry at [i][j] tells wether point i and point j have line of sight with each other
         """
         LoS = []
@@ -194,47 +1355,388 @@ class BSP:
             for ToIndex, ToPoint in enumerate(points):
                 # if LoS is not determined
                 if (FromIndex != ToIndex) and (LoS[FromIndex][ToIndex] == 'X'):
-                    # Assume there is LoS
-                    LoS[FromIndex][ToIndex] = 'T'
-                    LoS[ToIndex][FromIndex] = 'T'
-
                     SightSegment = LineSegment(
                         points[FromIndex], points[ToIndex])
 
-                    # Point to root node
-                    stack = [self.tree]
-                    IsIntersection = False
-                    # NumOfIntersections = 0
-                    NumOfTraversals = 0
-                    while len(stack) != 0 and IsIntersection == False:
-                        TreePointer = stack.pop()
-                        NumOfTraversals += 1
-
-                        compareLoS = TreePointer.data[0].compare(SightSegment)
-                        if compareLoS == 'P':
-                            if SightSegment.split(TreePointer.data[0]) is not None:
-                                LoS[FromIndex][ToIndex] = 'F'
-                                LoS[ToIndex][FromIndex] = 'F'
-                            else:
-                                if TreePointer.left is not None:
-                                    stack.append(TreePointer.left)
-                                if TreePointer.right is not None:
-                                    stack.append(TreePointer.right)
-
-                        elif compareLoS == 'F':
-                            if TreePointer.left is not None:
-                                stack.append(TreePointer.left)
-
-                        elif compareLoS == 'B':
-                            if TreePointer.right is not None:
-                                stack.append(TreePointer.right)
-
-                    distance = points[FromIndex].getDistance(points[ToIndex])
-                    if IsIntersection:
-                        print(('Distance: %0.1f' % distance) +
-                              ', # of traversals(F): ' + str(NumOfTraversals))
+                    if self.isVisible(SightSegment, Stats):
+                        LoS[FromIndex][ToIndex] = 'T'
+                        LoS[ToIndex][FromIndex] = 'T'
                     else:
-                        print(('Distance: %0.1f' % distance) +
-                              ', # of traversals(T): ' + str(NumOfTraversals))
+                        LoS[FromIndex][ToIndex] = 'F'
+                        LoS[ToIndex][FromIndex] = 'F'
 
         return LoS
+
+    def isVisible(self, SightSegment, Stats=None):
+        """
+        Line of sight test of a single sight segment, traverses the BSP tree and stops at the first line segment that
+        intersects the sight segment
+        :param SightSegment: LineSegment between the two points in question
+        :param Stats: QueryStats to record the traversal in, or None
+        :return: boolean, True if no line segment in the tree intersects 'SightSegment'
+        """
+        if Stats is not None:
+            return self.traceSightSegment(SightSegment, Stats)
+
+        Sight = (SightSegment.p1.x, SightSegment.p1.y, SightSegment.p2.x, SightSegment.p2.y) if self.UseBoxes else None
+        # Point to root node, the root of a tree without walls (all removed) has no line segments
+        stack = [self.tree] if len(self.tree.data) > 0 else []
+        while len(stack) != 0:
+            TreePointer = stack.pop()
+
+            compareLoS = TreePointer.data[0].compare(SightSegment)
+            if compareLoS == 'P':
+                # Collinear line segments of the node are walls as much as the splitter is
+                for line in TreePointer.data:
+                    if SightSegment.split(line) is not None:
+                        return False
+                # A sight segment crossing the splitter may still miss one or both sub-trees, those are skipped. On
+                # one side of the splitter the box is not worth testing, the next splitter sorts the segment out as fast
+                for Child in (TreePointer.left, TreePointer.right):
+                    if Child is not None and (Sight is None or not missesBox(Sight, Child.box)):
+                        stack.append(Child)
+
+            elif compareLoS == 'F':
+                if TreePointer.left is not None:
+                    stack.append(TreePointer.left)
+
+            elif compareLoS == 'B':
+                if TreePointer.right is not None:
+                    stack.append(TreePointer.right)
+
+        return True
+
+    def traceSightSegment(self, SightSegment, Stats):
+        """Same as isVisible, but counts nodes visited, intersection tests and depth reached and records them in 'Stats'"""
+        Sight = (SightSegment.p1.x, SightSegment.p1.y, SightSegment.p2.x, SightSegment.p2.y) if self.UseBoxes else None
+        stack = [(self.tree, 1)] if len(self.tree.data) > 0 else []
+        IsIntersection = False
+        NumOfTraversals = 0
+        NumOfTests = 0
+        NumOfRejections = 0
+        MaxDepth = 0
+        while len(stack) != 0 and not IsIntersection:
+            TreePointer, Depth = stack.pop()
+            NumOfTraversals += 1
+            MaxDepth = max(MaxDepth, Depth)
+
+            compareLoS = TreePointer.data[0].compare(SightSegment)
+            if compareLoS == 'P':
+                for line in TreePointer.data:
+                    NumOfTests += 1
+                    if SightSegment.split(line) is not None:
+                        IsIntersection = True
+                        break
+                else:
+                    Children = (TreePointer.left, TreePointer.right)
+
+            elif compareLoS == 'F':
+                Children = (TreePointer.left,)
+
+            elif compareLoS == 'B':
+                Children = (TreePointer.right,)
+
+            if IsIntersection or compareLoS == 'C':
+                continue
+            for Child in Children:
+                if Child is None:
+                    continue
+                if Sight is not None and compareLoS == 'P' and missesBox(Sight, Child.box):
+                    NumOfRejections += 1
+                else:
+                    stack.append((Child, Depth + 1))
+
+        Stats.record(SightSegment.getLength(), NumOfTraversals, NumOfTests, MaxDepth,
+                     IsIntersection, IsIntersection and len(stack) != 0, NumOfRejections)
+        return not IsIntersection
+
+    def getDepth(self, tree):
+        """returns the depth of the tree, i.e. the number of nodes on the longest path from 'tree' down to a leaf"""
+        depth = 0
+        if tree.left is not None:
+            depth = self.getDepth(tree.left)
+        if tree.right is not None:
+            depth = max(depth, self.getDepth(tree.right))
+        return depth + 1
+
+    def checkSightSegments(self, segments, Stats=None):
+        """Batch version of the line of sight test, walks the BSP tree once for all sight segments together, at every
+        node the sight segments still in question are tested against the splitter with a single vectorized test
+        :param segments: array-like of shape (M, 4), rows of sight segments (x1, y1, x2, y2)
+        :param Stats: QueryStats to record the traversal of every sight segment in, or None
+        :return: boolean array of length M, an entry is True if nothing in the tree blocks the sight segment
+        """
+        if self.flat is not None:
+            return self.flat.checkSightSegments(segments, Stats, self.UseBoxes)
+
+        Segments = np.asarray(segments, dtype=np.float64).reshape(-1, 4)
+        return walkSightSegments(Segments, self.tree if len(self.tree.data) > 0 else None, getTreeNode, Stats,
+                                 getTreeBox if self.UseBoxes else None)
+
+    def visible_within(self, points, radius, Format='edges', Stats=None):
+        """
+        Line of sight between the pairs of points that are at most 'radius' apart, the pairs are found with a uniform
+        grid (see findPairsWithin) so the BSP tree is walked for O(N * k) pairs instead of all N^2
+        :param points: a list of Point objects or an array-like of shape (N, 2)
+        :param radius: float, perception radius
+        :param Format: string, 'edges' or 'csr'
+        :param Stats: QueryStats or None
+        :return: for 'edges' two int arrays I and J with I[k] < J[k], the pairs in range that have line of sight, for
+        'csr' the same pairs as symmetric adjacency, see edgesToCSR
+        """
+        Points = toPointArray(points)
+        I, J, Segments = pairSegments(Points, *findPairsWithin(Points, radius))
+        Visible = self.checkSightSegments(Segments, Stats)
+        I = I[Visible]
+        J = J[Visible]
+        if Format == 'csr':
+            return edgesToCSR(len(Points), I, J)
+        return I, J
+
+    def checkLoSBatch(self, points, Stats=None):
+        """Determine line of sight between all points like checkLoS does, but for all pairs of points at once
+        :param points: a list of Point objects or an array-like of shape (N, 2)
+        :param Stats: QueryStats or None
+        :return: boolean array, N by N, an entry at [i][j] is True where checkLoS reports 'T' (diagonal is False)
+        """
+        return pairsToMatrix(points, self.checkSightSegments, Stats)
+
+    def raycast(self, origin, direction, MaxT=None):
+        """
+        Nearest wall hit by a ray, the tree is walked front to back along the ray, so the walk ends soon after the
+        first hit instead of testing everything the ray crosses
+        :param origin: Point or (x, y)
+        :param direction: Vector, Point or (x, y), the ray reaches origin + t * direction for t >= 0
+        :param MaxT: float, hits with larger t are ignored, e.g. 1 with direction = target - origin for a sight
+        segment, None for no limit
+        :return: tuple (Id, (x, y), t) of the nearest hit, Id is the wall Id (-1 for none), None if nothing is hit
+        """
+        Ox, Oy = (origin.x, origin.y) if isinstance(origin, Point) else (float(origin[0]), float(origin[1]))
+        Dx, Dy = (direction.x, direction.y) if hasattr(direction, 'x') else (float(direction[0]), float(direction[1]))
+        Best = MaxT if MaxT is not None else math.inf
+        BestLine = None
+        stack = [(self.tree, 0.0, Best)] if len(self.tree.data) > 0 else []
+        while len(stack) != 0:
+            TreePointer, Tmin, Tmax = stack.pop()
+            Tmax = min(Tmax, Best)
+            if Tmin > Tmax:
+                continue
+
+            Splitter = TreePointer.data[0]
+            Dot = Splitter.Nx * (Ox - Splitter.Px) + Splitter.Ny * (Oy - Splitter.Py)
+            Dd = Splitter.Nx * Dx + Splitter.Ny * Dy
+            if Dd != 0:
+                Tsplit, Slack, InFront = splitRayInterval(Dot, Dd, Tmin, Tmax)
+                Crossing = Tsplit + Slack >= Tmin and Tsplit - Slack <= Tmax
+            else:
+                InFront, Crossing = Dot >= 0, False
+            if Crossing:
+                # Collinear line segments of the node are walls as much as the splitter is
+                for line in TreePointer.data:
+                    t = hitRay(Ox, Oy, Dx, Dy, line)
+                    if t < Best or (t == Best and BestLine is None and t != math.inf):
+                        Best, BestLine = t, line
+            Near, Far = (TreePointer.left, TreePointer.right) if InFront else (TreePointer.right, TreePointer.left)
+            if Crossing and Far is not None:
+                stack.append((Far, max(Tmin, Tsplit - Slack), Tmax))
+            if Near is not None:
+                stack.append((Near, Tmin, min(Tmax, Tsplit + Slack) if Crossing else Tmax))
+
+        if BestLine is None:
+            return None
+        return (BestLine.Id if BestLine.Id is not None else -1, (Ox + Best * Dx, Oy + Best * Dy), Best)
+
+    def raycastBatch(self, Origins, Directions, MaxT=None):
+        """
+        Batch version of raycast over the compiled tree (compiled first if needed), all rays walk the arrays together
+        :param Origins: a list of Point objects or an array-like of shape (M, 2)
+        :param Directions: same for the directions
+        :param MaxT: float, array-like (M) or None, see raycast
+        :return: int array (M) of wall Ids (-1 for no hit or no Id), float64 array (M, 2) of hit points (NaN for no
+        hit) and float64 array (M) of t (infinity for no hit)
+        """
+        flat = self.flat if self.flat is not None else self.compileTree()
+        return flat.raycastBatch(Origins, Directions, MaxT)
+
+    def iterFragments(self, point, Order='front', Wedge=None, radius=None):
+        """
+        Generator of the line segments in the tree (walls and fragments of walls) in visibility order from 'point':
+        front to back, a line segment never hides one yielded before it, or back to front (painter's order). The
+        tree is walked lazily, so stopping early skips the rest of it
+        :param point: Point or (x, y), the viewpoint
+        :param Order: string, 'front' for front to back, 'back' for back to front
+        :param Wedge: tuple (Start, Stop), directions in radians, counter-clockwise from 'Start' to 'Stop', sub-trees
+        lying entirely outside of the wedge from 'point' are skipped, None (or Stop - Start >= 2 pi) for all directions
+        :param radius: float, sub-trees lying entirely farther away than this are skipped, None for no limit
+        :return: generator of LineSegment, the line segments of the nodes not skipped, which may still lie outside of
+        the wedge or the radius themselves
+        """
+        Px, Py = (point.x, point.y) if isinstance(point, Point) else (float(point[0]), float(point[1]))
+        if Wedge is not None and Wedge[1] - Wedge[0] >= TwoPi:
+            # A full circle, the modulo below would shrink it to a single direction
+            Wedge = None
+        if Wedge is not None:
+            WedgeStart = Wedge[0] % TwoPi
+            WedgeSpan = (Wedge[1] - Wedge[0]) % TwoPi
+            WedgeCos = (math.cos(WedgeStart), math.sin(WedgeStart), math.cos(Wedge[1]), math.sin(Wedge[1]))
+
+        def isReachable(Nx, Ny, DotProduct):
+            """whether the wedge and radius reach the half-plane Nx * (x - Px) + Ny * (y - Py) >= -DotProduct, the side
+            of a splitter the viewpoint is not on"""
+            # Line segments within DoubleTolerance of the splitter may be on either side of it
+            Distance = DotProduct - DoubleTolerance
+            if Distance <= 0:
+                return True
+            Length = math.hypot(Nx, Ny)
+            # Largest share of a step in the wedge that goes towards the half-plane
+            Reach = 1.0
+            if Wedge is not None and (getAngle(Nx, Ny) - WedgeStart) % TwoPi > WedgeSpan:
+                Reach = max(Nx * WedgeCos[0] + Ny * WedgeCos[1], Nx * WedgeCos[2] + Ny * WedgeCos[3]) / Length
+            if Reach <= 0:
+                return False
+            return radius is None or Distance / Length <= radius * Reach
+
+        FrontToBack = Order == 'front'
+        # (node, True) once the sub-tree to be yielded before the node is done, then the node itself is next
+        stack = [(self.tree, False)] if len(self.tree.data) > 0 else []
+        while len(stack) != 0:
+            TreePointer, Expanded = stack.pop()
+            if Expanded:
+                yield from TreePointer.data
+                continue
+
+            Splitter = TreePointer.data[0]
+            DotProduct = Splitter.Nx * (Px - Splitter.Px) + Splitter.Ny * (Py - Splitter.Py)
+            if DotProduct >= 0:
+                Near, Far = TreePointer.left, TreePointer.right
+                Nx, Ny = -Splitter.Nx, -Splitter.Ny
+            else:
+                Near, Far = TreePointer.right, TreePointer.left
+                Nx, Ny = Splitter.Nx, Splitter.Ny
+                DotProduct = -DotProduct
+            if Far is not None and not isReachable(Nx, Ny, DotProduct):
+                Far = None
+            First, Last = (Near, Far) if FrontToBack else (Far, Near)
+            if Last is not None:
+                stack.append((Last, False))
+            stack.append((TreePointer, True))
+            if First is not None:
+                stack.append((First, False))
+
+    def visibility_polygon(self, point, radius=None, ArcSegments=64, Bounds=None):
+        """
+        Region visible from 'point', found with a single front to back sweep of the BSP tree (see iterFragments): every
+        fragment is seen in the directions no nearer fragment covered already, the sweep stops once all directions
+        are covered
+        :param point: Point or (x, y), the viewpoint
+        :param radius: float, range of sight, None for unlimited, then the region is cut off at the bounding box of
+        the walls and 'Bounds' (grown by 1)
+        :param ArcSegments: int, number of polygon edges a full circle of 'radius' is drawn with
+        :param Bounds: tuple (xmin, ymin, xmax, ymax) the region has to reach at least, without 'radius' only
+        :return: three arrays, the polygon (V, 2) with vertices counter-clockwise around 'point', the visible parts of
+        wall fragments (F, 4) as rows (x1, y1, x2, y2) and their wall Ids (F), -1 for none
+        """
+        Px, Py = (point.x, point.y) if isinstance(point, Point) else (float(point[0]), float(point[1]))
+        Covered = AngularIntervals()
+        # (Start, Stop, Vertices) of the boundary in every direction
+        Pieces = []
+        Fragments = []
+        Ids = []
+        Box = [Px - 1.0, Py - 1.0, Px + 1.0, Py + 1.0]
+        if Bounds is not None:
+            Box = [min(Box[0], Bounds[0]), min(Box[1], Bounds[1]), max(Box[2], Bounds[2]), max(Box[3], Bounds[3])]
+
+        for line in self.iterFragments((Px, Py), radius=radius):
+            if Covered.isFull():
+                break
+            x1, y1, x2, y2 = line.p1.x, line.p1.y, line.p2.x, line.p2.y
+            Box = [min(Box[0], x1, x2), min(Box[1], y1, y2), max(Box[2], x1, x2), max(Box[3], y1, y2)]
+            if radius is not None:
+                Clipped = clipToDisk(x1, y1, x2, y2, Px, Py, radius)
+                if Clipped is None:
+                    continue
+                x1, y1, x2, y2 = Clipped
+            Cross = (x1 - Px) * (y2 - Py) - (y1 - Py) * (x2 - Px)
+            if Cross == 0:
+                # Seen edge-on
+                continue
+            if Cross < 0:
+                x1, y1, x2, y2 = x2, y2, x1, y1
+            Start = getAngle(x1 - Px, y1 - Py)
+            Stop = getAngle(x2 - Px, y2 - Py)
+            Wrapped = False
+            for GapStart, GapStop in Covered.cover(Start, Stop):
+                From = (x1, y1) if GapStart == Start else getRayPoint(Px, Py, GapStart, x1, y1, x2, y2)
+                To = (x2, y2) if GapStop == Stop else getRayPoint(Px, Py, GapStop, x1, y1, x2, y2)
+                Pieces.append((GapStart, GapStop, [From, To]))
+                if Wrapped and GapStart == 0.0:
+                    # Same visible part as the previous gap, split only where the directions wrap around
+                    Fragments[-1] = Fragments[-1][0:2] + To
+                else:
+                    Fragments.append(From + To)
+                    Ids.append(line.Id if line.Id is not None else -1)
+                Wrapped = GapStop == TwoPi
+
+        Box = (Box[0] - 1.0, Box[1] - 1.0, Box[2] + 1.0, Box[3] + 1.0)
+        for GapStart, GapStop in Covered.getGaps():
+            Pieces.append((GapStart, GapStop, getOuterBoundary(Px, Py, GapStart, GapStop, radius, Box, ArcSegments)))
+        Pieces.sort(key=lambda Piece: Piece[0])
+
+        # Vertices shared by neighbouring pieces, up to rounding of the directions, are kept once
+        Tolerance = 1e-12 * max(Box[2] - Box[0], Box[3] - Box[1], radius if radius is not None else 0.0)
+        Polygon = []
+        for Start, Stop, Vertices in Pieces:
+            for x, y in Vertices:
+                if len(Polygon) == 0 or abs(x - Polygon[-1][0]) > Tolerance or abs(y - Polygon[-1][1]) > Tolerance:
+                    Polygon.append((x, y))
+        if len(Polygon) > 1 and abs(Polygon[0][0] - Polygon[-1][0]) <= Tolerance and \
+                abs(Polygon[0][1] - Polygon[-1][1]) <= Tolerance:
+            Polygon.pop()
+        return (np.array(Polygon, dtype=np.float64).reshape(-1, 2),
+                np.array(Fragments, dtype=np.float64).reshape(-1, 4), np.array(Ids, dtype=np.int64))
+
+    def visible_from(self, point, targets, radius=None):
+        """
+        Line of sight from one viewpoint to many targets, one sweep for visibility_polygon and one point in polygon
+        test per target instead of a tree walk per target. Targets on the boundary of the polygon (exactly on a wall
+        or a shadow edge) may come out either way
+        :param point: Point or (x, y)
+        :param targets: a list of Point objects or an array-like of shape (N, 2)
+        :param radius: float or None, see visibility_polygon, targets farther away are not visible
+        :return: boolean array (N)
+        """
+        Targets = toPointArray(targets)
+        if len(Targets) == 0:
+            return np.zeros(0, dtype=bool)
+        Bounds = tuple(Targets.min(axis=0).tolist() + Targets.max(axis=0).tolist())
+        return pointsInPolygon(self.visibility_polygon(point, radius, Bounds=Bounds)[0], Targets)
+
+def buildSubtree(ListLineSegments, UseHeuristic, Options, Seed=None):
+    """Worker process side of BSP.generateTreeParallel, returns the BinaryTree generated from the line segments with
+    a BSP configured by 'Options' and seeded with 'Seed', and the number of fragments it dropped as misclassified"""
+    bsptree = BSP(Seed=Seed, **Options)
+    tree = BinaryTree()
+    tree.data = ListLineSegments
+    bsptree.generateTree(tree, UseHeuristic)
+    return tree, bsptree.MisclassifiedFragments
+
+def compareHeuristics(ListLineSegments, Heuristics=('even', 'min', 'sample-even', 'sample-min'), **kwargs):
+    """
+    Builds a BSP tree from the same line segments with every heuristic, to weigh build time against tree quality
+    :param ListLineSegments: list of LineSegment, it is not modified
+    :param Heuristics: names of heuristics accepted by BSP.generateTree
+    :param kwargs: passed to the BSP constructor, i.e. the sampling configuration
+    :return: a list of dictionaries with keys 'Heuristic', 'Nodes', 'Depth' and 'Time' (seconds spent in generateTree)
+    """
+    Results = []
+    for Heuristic in Heuristics:
+        bsptree = BSP(**kwargs)
+        bsptree.tree.data = list(ListLineSegments)
+        StartTime = time.perf_counter()
+        bsptree.generateTree(bsptree.tree, UseHeuristic=Heuristic)
+        Results.append({
+            'Heuristic': Heuristic,
+            'Nodes': bsptree.countNodes(bsptree.tree),
+            'Depth': bsptree.getDepth(bsptree.tree),
+            'Time': time.perf_counter() - StartTime})
+    return Results
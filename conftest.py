@@ -0,0 +1,14 @@
+import pytest
+
+from bsp import BSP
+from scene import generateSceneFast
+
+@pytest.fixture
+def buildTree():
+    """returns a function that generates a BSP from a seeded scene of 'WallCount' walls on an 800 by 600 map"""
+    def build(WallCount, Seed=0, Heuristic='sample-even', **Options):
+        bsptree = BSP(Seed=Seed, **Options)
+        bsptree.tree.data = generateSceneFast(WallCount, 800, 600, Seed=Seed)
+        bsptree.generateTree(bsptree.tree, Heuristic)
+        return bsptree
+    return build
@@ -1,10 +1,19 @@
 import math
+from fractions import Fraction
 
 def sign(x): return (x > 0) - (x < 0)
 DoubleTolerance = 1e-5
+# Robust predicates (LineSegment.side and friends): a point is on a line when its distance to the line is at most this
+# share of the larger of the length of the line and the distance of the point from it, the same for any map scale
+RelativeTolerance = 1e-9
+# Bound of the rounding error of the floating point orientation determinant relative to the sum of the magnitudes of
+# its two products, see Shewchuk, Adaptive Precision Floating-Point Arithmetic and Fast Robust Geometric Predicates
+OrientationErrorBound = (3.0 + 16.0 * 2.0 ** -53) * 2.0 ** -53
 
 class Point:
     """2D cartesian coordinate representation of point"""
+    __slots__ = ('x', 'y')
+
     def __init__(self, x=0, y=0):
         self.x = x
         self.y = y
@@ -18,6 +27,8 @@ class Point:
 
 class Vector:
     """A quite basic 2D vector class"""
+    __slots__ = ('x', 'y')
+
     def __init__(self, x=0, y=0):
         self.x = x
         self.y = y
@@ -28,7 +39,9 @@ class Vector:
 
 
 class LineSegment:
-    """2D line segment class"""
+    """2D line segment class, p1, p2 and Normal are fixed once constructed since the normal vector is cached"""
+    __slots__ = ('p1', 'p2', 'Name', 'Id', 'Normal', 'NormalV', 'Nx', 'Ny', 'Px', 'Py')
+
     def __init__(self, p1, p2, Normal=1, Name=''):
         """Arguments: p1 (type: Point), p2 (type: Point), Normal (type: Int), Name (type: String),
         arg 'Normal' represents one of two possible directions of normal vector of our line segment, arg 'Name
@@ -36,13 +49,20 @@ class LineSegment:
         self.p1 = p1
         self.p2 = p2
         self.Name = Name
+        # Identifies the wall this line segment (or fragment of a wall) belongs to, assigned by BSP
+        self.Id = None
 
         Dx = p2.x - p1.x
         Dy = p2.y - p1.y
         self.Normal = Normal
-        self.NormalV = Vector(Dy, -Dx)
         if Normal == -1:
-            self.NormalV = Vector(-Dy, Dx)
+            Dx, Dy = -Dx, -Dy
+        self.NormalV = Vector(Dy, -Dx)
+        # Plain copies of the normal and of p1 for compare and split
+        self.Nx = Dy
+        self.Ny = -Dx
+        self.Px = p1.x
+        self.Py = p1.y
 
     def getMidPoint(self):
         """returns middle point of our line segment"""
@@ -66,34 +86,29 @@ class LineSegment:
         if our line segment (infinite) intersects the 'Otherline' and thus causes the 'Otherline' to split into two, it returns 'P'
         if both line segments are collinear, returns 'C'
         """
-        DotProduct1 = self.NormalV.dotProduct(
-            Vector(
-                (OtherLine.p1.x - self.p1.x),
-                (OtherLine.p1.y - self.p1.y)))
-        if abs(DotProduct1) < DoubleTolerance:
+        # Same arithmetic as NormalV.dotProduct(Vector(...)), without the allocations
+        DotProduct1 = self.Nx * (OtherLine.p1.x - self.Px) + self.Ny * (OtherLine.p1.y - self.Py)
+        if -DoubleTolerance < DotProduct1 < DoubleTolerance:
             DotProduct1 = 0
 
-        DotProduct2 = self.NormalV.dotProduct(
-            Vector(
-                (OtherLine.p2.x - self.p1.x),
-                (OtherLine.p2.y - self.p1.y)))
-        if abs(DotProduct2) < DoubleTolerance:
+        DotProduct2 = self.Nx * (OtherLine.p2.x - self.Px) + self.Ny * (OtherLine.p2.y - self.Py)
+        if -DoubleTolerance < DotProduct2 < DoubleTolerance:
             DotProduct2 = 0
 
-        if (sign(DotProduct1) == 1 and sign(DotProduct2) == -1) \
-                or (sign(DotProduct1) == -1 and sign(DotProduct2) == 1):
+        if (DotProduct1 > 0 and DotProduct2 < 0) or (DotProduct1 < 0 and DotProduct2 > 0):
             # Lines Partition
             return 'P'
 
-        elif (DotProduct1 + DotProduct2) == 0:
+        Sum = DotProduct1 + DotProduct2
+        if Sum == 0:
             # Lines Collinear
             return 'C'
 
-        elif sign(DotProduct1 + DotProduct2) == 1:
+        elif Sum > 0:
             # Lines no Partition, in Front
             return 'F'
 
-        elif sign(DotProduct1 + DotProduct2) == -1:
+        elif Sum < 0:
             # Lines no Partition, in Back
             return 'B'
 
@@ -103,10 +118,10 @@ class LineSegment:
         :return: returns two LineSegments if LineSegment in 'self' (as an infinite line segment) partitions 'otherLine' in space partitioning,
         otherwise returns None
         """
-        numer = (self.NormalV.x * (OtherLine.p1.x - self.p1.x)) + \
-            (self.NormalV.y * (OtherLine.p1.y - self.p1.y))
-        denom = ((-self.NormalV.x) * (OtherLine.p2.x - OtherLine.p1.x)) + \
-            ((-self.NormalV.y) * (OtherLine.p2.y - OtherLine.p1.y))
+        p1 = OtherLine.p1
+        p2 = OtherLine.p2
+        numer = (self.Nx * (p1.x - self.Px)) + (self.Ny * (p1.y - self.Py))
+        denom = ((-self.Nx) * (p2.x - p1.x)) + ((-self.Ny) * (p2.y - p1.y))
 
         if denom != 0.0:
             t = numer / denom
@@ -114,13 +129,72 @@ class LineSegment:
             return None
 
         if 0 <= t <= 1.0:
-            IntersectPoint = Point()
-            IntersectPoint.x = OtherLine.p1.x + \
-                t * (OtherLine.p2.x - OtherLine.p1.x)
-            IntersectPoint.y = OtherLine.p1.y + \
-                t * (OtherLine.p2.y - OtherLine.p1.y)
-            return LineSegment(
-                OtherLine.p1, IntersectPoint, (OtherLine.Name + '1')), LineSegment(
-                IntersectPoint, OtherLine.p2, OtherLine.Normal, (OtherLine.Name + '2'))
+            IntersectPoint = Point(p1.x + t * (p2.x - p1.x), p1.y + t * (p2.y - p1.y))
+            Fragment1 = LineSegment(p1, IntersectPoint, (OtherLine.Name + '1'))
+            Fragment2 = LineSegment(IntersectPoint, p2, OtherLine.Normal, (OtherLine.Name + '2'))
+            Fragment1.Id = Fragment2.Id = OtherLine.Id
+            return Fragment1, Fragment2
         else:
-            return None
\ No newline at end of file
+            return None
+
+    def side(self, point, Tolerance=RelativeTolerance):
+        """
+        Robust side of 'point' relative to our line segment (imagined as an infinite line), in front is the direction
+        of the normal vector
+        :param Tolerance: float, relative tolerance (see RelativeTolerance), 0 for the exact side
+        :return: 1 in front, -1 behind, 0 on the line
+        """
+        Dx = point.x - self.Px
+        Dy = point.y - self.Py
+        Left = self.Nx * Dx
+        Right = self.Ny * Dy
+        DotProduct = Left + Right
+        if Tolerance > 0:
+            # Squared, distance <= Tolerance * max(length, |point - p1|)
+            Length = self.Nx * self.Nx + self.Ny * self.Ny
+            if DotProduct * DotProduct <= Tolerance * Tolerance * Length * max(Length, Dx * Dx + Dy * Dy):
+                return 0
+        if abs(DotProduct) > OrientationErrorBound * (abs(Left) + abs(Right)):
+            return sign(DotProduct)
+
+        # Too close to call with floats, rationals are exact for any float or int coordinates
+        Exact = (Fraction(self.p2.y) - Fraction(self.p1.y)) * (Fraction(point.x) - Fraction(self.p1.x)) - \
+            (Fraction(self.p2.x) - Fraction(self.p1.x)) * (Fraction(point.y) - Fraction(self.p1.y))
+        return sign(Exact) if self.Normal != -1 else -sign(Exact)
+
+    def compareRobust(self, OtherLine, Tolerance=RelativeTolerance):
+        """Same as compare, with the end points of 'OtherLine' classified by side"""
+        Side1 = self.side(OtherLine.p1, Tolerance)
+        Side2 = self.side(OtherLine.p2, Tolerance)
+        if Side1 * Side2 < 0:
+            return 'P'
+        elif Side1 + Side2 == 0:
+            return 'C'
+        elif Side1 + Side2 > 0:
+            return 'F'
+        else:
+            return 'B'
+
+    def splitRobust(self, OtherLine, Tolerance=RelativeTolerance):
+        """
+        Counterpart of split for compareRobust
+        :return: two LineSegments (the one in front first) if compareRobust returns 'P', otherwise None. Each fragment
+        lies on the side of the end point of 'OtherLine' it keeps, it needs no classification of its own
+        """
+        Side1 = self.side(OtherLine.p1, Tolerance)
+        if Side1 * self.side(OtherLine.p2, Tolerance) >= 0:
+            return None
+
+        p1 = OtherLine.p1
+        p2 = OtherLine.p2
+        DotProduct1 = (self.Nx * (p1.x - self.Px)) + (self.Ny * (p1.y - self.Py))
+        DotProduct2 = (self.Nx * (p2.x - self.Px)) + (self.Ny * (p2.y - self.Py))
+        # The end points are on opposite sides, only rounding can push t out of [0, 1]
+        t = min(1.0, max(0.0, DotProduct1 / (DotProduct1 - DotProduct2))) if DotProduct1 != DotProduct2 else 0.5
+        IntersectPoint = Point(p1.x + t * (p2.x - p1.x), p1.y + t * (p2.y - p1.y))
+        Fragment1 = LineSegment(p1, IntersectPoint, (OtherLine.Name + '1'))
+        Fragment2 = LineSegment(IntersectPoint, p2, OtherLine.Normal, (OtherLine.Name + '2'))
+        Fragment1.Id = Fragment2.Id = OtherLine.Id
+        if Side1 > 0:
+            return Fragment1, Fragment2
+        return Fragment2, Fragment1
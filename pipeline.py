@@ -0,0 +1,60 @@
+import importlib
+
+import numpy as np
+
+from bsp import BSP
+from scene import generatePoints, generateRandomScene, generateSceneFast
+
+# Renderer plug-ins by name, module and function, imported only when asked for
+Renderers = {'pygame': ('render', 'drawScene')}
+
+def loadRenderer(Renderer):
+    """returns the render function of 'Renderer', either a name in Renderers (imported now) or a callable"""
+    if callable(Renderer):
+        return Renderer
+    Module, Function = Renderers[Renderer]
+    return getattr(importlib.import_module(Module), Function)
+
+def runPipeline(
+        WallCount=20,
+        AgentCount=4,
+        width=800,
+        height=600,
+        isUniform=True,
+        UseHeuristic='even',
+        Scene='random',
+        Seed=None,
+        Renderer=None,
+        Stats=None):
+    """
+    Generates a scene and agents, the BSP tree of the scene and line of sight between all agents, without any display
+    :param WallCount: int, Number of line segments
+    :param AgentCount: int, Number of points
+    :param width: int, area width
+    :param height: int, area height
+    :param isUniform: boolean, uniform or powerlaw distribution of line segments and points
+    :param UseHeuristic: string, see BSP.generateTree
+    :param Scene: string, 'random' for generateRandomScene, 'fast' for generateSceneFast
+    :param Seed: int, seed for the scene, the points and the sampled heuristics, None for random ones
+    :param Renderer: None, a name in Renderers or a callable, called with the result dictionary once it is complete
+    :param Stats: QueryStats or None
+    :return: a dictionary with keys 'Lines' (list of LineSegment), 'Points' (list of Point), 'BSP' and 'LoS' (N by N
+    boolean array, see BSP.checkLoSBatch), 'width' and 'height'
+    """
+    if Seed is not None:
+        np.random.seed(Seed)
+    if Scene == 'fast':
+        Lines = generateSceneFast(WallCount, width, height, isUniform=isUniform, Seed=Seed)
+    else:
+        Lines = generateRandomScene(WallCount, width, height, isUniform=isUniform)
+    Points = generatePoints(AgentCount, width, height, isUniform=isUniform)
+
+    bsptree = BSP(Seed=Seed)
+    bsptree.tree.data = list(Lines)
+    bsptree.generateTree(bsptree.tree, UseHeuristic=UseHeuristic)
+    LoS = bsptree.checkLoSBatch(Points, Stats)
+
+    Result = {'Lines': Lines, 'Points': Points, 'BSP': bsptree, 'LoS': LoS, 'width': width, 'height': height}
+    if Renderer is not None:
+        loadRenderer(Renderer)(Result)
+    return Result
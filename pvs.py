@@ -0,0 +1,446 @@
+import numpy as np
+
+from bsp import pairsToMatrix
+from scene import expandRanges
+from visibility import getFlatTree, getVersion
+
+# Classification of a pair of leaf cells, PairUnknown for partially visible pairs and pairs never classified
+PairUnknown, PairVisible, PairOccluded = 0, 1, 2
+
+def clipPolygon(Polygon, Nx, Ny, Px, Py):
+    """returns the part of convex polygon 'Polygon' (list of (x, y)) where Nx * (x - Px) + Ny * (y - Py) >= 0"""
+    Clipped = []
+    for index, (x1, y1) in enumerate(Polygon):
+        x2, y2 = Polygon[(index + 1) % len(Polygon)]
+        Side1 = Nx * (x1 - Px) + Ny * (y1 - Py)
+        Side2 = Nx * (x2 - Px) + Ny * (y2 - Py)
+        if Side1 >= 0:
+            Clipped.append((x1, y1))
+        if (Side1 > 0 and Side2 < 0) or (Side1 < 0 and Side2 > 0):
+            t = Side1 / (Side1 - Side2)
+            Clipped.append((x1 + t * (x2 - x1), y1 + t * (y2 - y1)))
+    return Clipped
+
+def getCells(flat, Bounds):
+    """
+    Leaf cells of a FlatTree, the convex regions of the empty child slots clipped to the rectangle 'Bounds', numbered
+    depth first so that the cells of a sub-tree are numbered together and close cells mostly get close numbers
+    :return: list of polygons (lists of (x, y)) and two int arrays (K), the cell of the left and right child slot of
+    every node, -1 where the node has a child
+    """
+    xmin, ymin, xmax, ymax = Bounds
+    Polygons = []
+    LeftCell = np.full(len(flat.Left), -1, dtype=np.int64)
+    RightCell = np.full(len(flat.Left), -1, dtype=np.int64)
+    if len(flat.Left) == 0:
+        return [[(xmin, ymin), (xmax, ymin), (xmax, ymax), (xmin, ymax)]], LeftCell, RightCell
+
+    stack = [(0, [(xmin, ymin), (xmax, ymin), (xmax, ymax), (xmin, ymax)])]
+    while len(stack) != 0:
+        node, Polygon = stack.pop()
+        Px, Py = flat.Lines[flat.NodeStart[node], 0:2].tolist()
+        Nx, Ny = flat.Normals[flat.NodeStart[node]].tolist()
+        # Children in front of the splitter are left children, as in LineSegment.compare
+        for Child, Cells, Sign in ((flat.Right[node], RightCell, -1), (flat.Left[node], LeftCell, 1)):
+            Part = clipPolygon(Polygon, Sign * Nx, Sign * Ny, Px, Py)
+            if Child != -1:
+                stack.append((Child, Part))
+            else:
+                Cells[node] = len(Polygons)
+                Polygons.append(Part)
+    return Polygons, LeftCell, RightCell
+
+def getVertexArrays(Polygons, MaxVertices, Margin):
+    """
+    Pads every polygon to 'MaxVertices' vertices by repeating its first one, polygons with more vertices are replaced
+    by their bounding box, which contains them
+    :return: two float64 arrays (C, MaxVertices) of x and y, and a boolean array (C), True for polygons too thin to
+    hold a point 'Margin' away from their boundary
+    """
+    X = np.zeros((len(Polygons), MaxVertices))
+    Y = np.zeros((len(Polygons), MaxVertices))
+    Empty = np.zeros(len(Polygons), dtype=bool)
+    for index, Polygon in enumerate(Polygons):
+        Area = 0.0
+        Perimeter = 0.0
+        for (x1, y1), (x2, y2) in zip(Polygon, Polygon[1:] + Polygon[:1]):
+            Area += x1 * y2 - x2 * y1
+            Perimeter += np.hypot(x2 - x1, y2 - y1)
+        # The inscribed circle of a convex polygon has a radius of at most 2 * Area / Perimeter
+        if len(Polygon) < 3 or abs(Area) <= Margin * Perimeter:
+            Empty[index] = True
+            continue
+        if len(Polygon) > MaxVertices:
+            xs = [x for x, y in Polygon]
+            ys = [y for x, y in Polygon]
+            Polygon = [(min(xs), min(ys)), (max(xs), min(ys)), (max(xs), max(ys)), (min(xs), max(ys))]
+        Polygon = Polygon + [Polygon[0]] * (MaxVertices - len(Polygon))
+        X[index] = [x for x, y in Polygon]
+        Y[index] = [y for x, y in Polygon]
+    return X, Y, Empty
+
+def findCellPairs(X, Y, Empty, MaxDistance):
+    """
+    Pairs of non-degenerate cells to classify, all of them if 'MaxDistance' is None, otherwise those whose bounding
+    boxes are at most 'MaxDistance' apart along both axes, found with a grid of buckets 'MaxDistance' wide
+    :return: two int arrays I and J with I[k] < J[k], ordered by I then J
+    """
+    Cells = np.flatnonzero(~Empty)
+    if MaxDistance is None:
+        I, J = np.triu_indices(len(Cells), 1)
+        return Cells[I], Cells[J]
+
+    CellSize = max(MaxDistance, 1e-9)
+    Low = np.floor((np.stack((X[Cells].min(axis=1), Y[Cells].min(axis=1)), axis=1) - MaxDistance / 2) / CellSize)
+    High = np.floor((np.stack((X[Cells].max(axis=1), Y[Cells].max(axis=1)), axis=1) + MaxDistance / 2) / CellSize)
+    Low = Low.astype(np.int64)
+    High = High.astype(np.int64)
+    Size = High - Low + 1
+    # Every cell goes into all the buckets its box, grown by half of MaxDistance on every side, overlaps
+    Owners = np.repeat(np.arange(len(Cells)), Size[:, 0] * Size[:, 1])
+    Offsets = expandRanges(np.zeros(len(Cells), dtype=np.int64), Size[:, 0] * Size[:, 1])
+    Bx = Low[Owners, 0] + Offsets // Size[Owners, 1]
+    By = Low[Owners, 1] + Offsets % Size[Owners, 1]
+    Keys = (Bx - Bx.min()) * (int(By.max() - By.min()) + 1) + (By - By.min())
+
+    Order = np.lexsort((Owners, Keys))
+    Keys = Keys[Order]
+    Owners = Owners[Order]
+    # Every entry is paired with the entries after it in its bucket
+    End = np.searchsorted(Keys, Keys, side='right')
+    Counts = End - np.arange(len(Keys)) - 1
+    From = np.repeat(Owners, Counts)
+    To = Owners[expandRanges(np.arange(len(Keys)) + 1, Counts)]
+    Pairs = np.unique(np.minimum(From, To) * len(Cells) + np.maximum(From, To))
+    return Cells[Pairs // len(Cells)], Cells[Pairs % len(Cells)]
+
+def getNodeFrames(flat):
+    """
+    Splitter lines of all nodes in the frame used by classifyCellPairs
+    :return: float64 arrays (K) Px, Py, Nx, Ny (unit normal), Ux, Uy (unit direction), and (F) the interval of every
+    line segment along the direction of the splitter of its node from W0 to W1, and the interval of the whole wall
+    it is a fragment of from Wall0 to Wall1
+    """
+    Splitters = flat.NodeStart[:-1]
+    Px = flat.Lines[Splitters, 0]
+    Py = flat.Lines[Splitters, 1]
+    Length = np.hypot(flat.Normals[Splitters, 0], flat.Normals[Splitters, 1])
+    Length[Length == 0] = np.inf
+    Nx = flat.Normals[Splitters, 0] / Length
+    Ny = flat.Normals[Splitters, 1] / Length
+    # Any direction along the line works, the intervals are measured in the same one
+    Ux = -Ny
+    Uy = Nx
+
+    Owner = np.repeat(np.arange(len(Splitters)), np.diff(flat.NodeStart))
+    def project(x, y):
+        return Ux[Owner] * (x - Px[Owner]) + Uy[Owner] * (y - Py[Owner])
+    S1 = project(flat.Lines[:, 0], flat.Lines[:, 1])
+    S2 = project(flat.Lines[:, 2], flat.Lines[:, 3])
+
+    # End points of the whole walls, the outermost end points of their fragments along the first fragment
+    Ids = np.where(flat.Ids >= 0, flat.Ids, -1 - np.arange(len(flat.Ids)))
+    Groups, First, Group = np.unique(Ids, return_index=True, return_inverse=True)
+    Direction = flat.Lines[First, 2:4] - flat.Lines[First, 0:2]
+    Points = np.concatenate((flat.Lines[:, 0:2], flat.Lines[:, 2:4]))
+    PointGroup = np.concatenate((Group, Group))
+    Along = ((Points - flat.Lines[First[PointGroup], 0:2]) * Direction[PointGroup]).sum(axis=1)
+    Order = np.lexsort((Along, PointGroup))
+    Start = np.searchsorted(PointGroup[Order], np.arange(len(Groups)))
+    End = np.searchsorted(PointGroup[Order], np.arange(len(Groups)), side='right') - 1
+    Extreme0 = Points[Order[Start]][Group]
+    Extreme1 = Points[Order[End]][Group]
+    E1 = project(Extreme0[:, 0], Extreme0[:, 1])
+    E2 = project(Extreme1[:, 0], Extreme1[:, 1])
+    return Px, Py, Nx, Ny, Ux, Uy, np.minimum(S1, S2), np.maximum(S1, S2), np.minimum(E1, E2), np.maximum(E1, E2)
+
+def classifyCellPairs(flat, Frames, X, Y, I, J, Margin):
+    """
+    Classifies pairs of cells by walking the convex hull of both cells through the tree. A node whose splitter line
+    does not cut the hull only passes the pair on to the side the hull is on. Otherwise the walls of the node are
+    intervals on the line, and the hull meets the line in an interval as well: walls apart from it let the pair pass to
+    both sides, a single wall covering it while the cells are on opposite sides occludes every sight segment between
+    them. Any other wall meeting the interval makes the pair partially visible, unless a wall further down occludes
+    it. Pairs no wall met are fully visible
+    :param Frames: see getNodeFrames
+    :param X: float64 array (C, V), x of the vertices of every cell, see getVertexArrays
+    :param Y: float64 array (C, V)
+    :param I: int array, first cell of every pair
+    :param J: int array, second cell of every pair
+    :param Margin: float, distances up to this count as touching, in favour of PairUnknown
+    :return: int8 array, PairVisible, PairOccluded or PairUnknown for every pair
+    """
+    Px, Py, Nx, Ny, Ux, Uy, W0, W1, Wall0, Wall1 = Frames
+    V = X.shape[1]
+    Slack = Margin / 2
+    Running = -1
+    Status = np.full(len(I), Running, dtype=np.int8)
+    Touched = np.zeros(len(I), dtype=bool)
+    if len(I) == 0 or len(flat.Left) == 0:
+        Status[:] = PairVisible
+        return Status
+    PX = np.hstack((X[I], X[J]))
+    PY = np.hstack((Y[I], Y[J]))
+
+    stack = [(0, np.arange(len(I)))]
+    while len(stack) != 0:
+        node, Active = stack.pop()
+        Active = Active[Status[Active] == Running]
+        if len(Active) == 0:
+            continue
+
+        D = Nx[node] * (PX[Active] - Px[node]) + Ny[node] * (PY[Active] - Py[node])
+        # Cells on the splitter line are on one side, points queried are at least Margin inside their cells
+        Front = (D >= -Slack).all(axis=1)
+        Back = (D <= Slack).all(axis=1)
+        Cut = Front == Back
+        Front &= ~Cut
+        Back &= ~Cut
+        Pass = Active[:0]
+        if Cut.any():
+            Pairs = Active[Cut]
+            D = D[Cut]
+            S = Ux[node] * (PX[Pairs] - Px[node]) + Uy[node] * (PY[Pairs] - Py[node])
+            # Where the hull meets the line, for cells on opposite sides between the crossings of the edges from one
+            # cell to the other and the vertices on the line, otherwise within the extent of the hull along the line
+            Opposite = ((D[:, :V] >= -Slack).all(axis=1) & (D[:, V:] <= Slack).all(axis=1)) | \
+                ((D[:, :V] <= Slack).all(axis=1) & (D[:, V:] >= -Slack).all(axis=1))
+            Low = S.min(axis=1)
+            High = S.max(axis=1)
+            if Opposite.any():
+                Di = D[Opposite, :V, None]
+                Dj = D[Opposite, None, V:]
+                Crossing = Di * Dj < 0
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    Position = (Di * S[Opposite, None, V:] - Dj * S[Opposite, :V, None]) / (Di - Dj)
+                OnLine = np.abs(D[Opposite]) <= Margin
+                Low[Opposite] = np.minimum(np.where(Crossing, Position, np.inf).min(axis=(1, 2)),
+                                           np.where(OnLine, S[Opposite], np.inf).min(axis=1))
+                High[Opposite] = np.maximum(np.where(Crossing, Position, -np.inf).max(axis=(1, 2)),
+                                            np.where(OnLine, S[Opposite], -np.inf).max(axis=1))
+
+            Walls = slice(flat.NodeStart[node], flat.NodeStart[node + 1])
+            Touch = ((W0[None, Walls] - Margin <= High[:, None]) & (W1[None, Walls] + Margin >= Low[:, None])).any(axis=1)
+            # A wall can cover the hull with fragments in other nodes as well
+            Covered = ((Wall0[None, Walls] + Margin <= Low[:, None]) &
+                       (Wall1[None, Walls] - Margin >= High[:, None])).any(axis=1)
+            Occluded = Touch & Covered & Opposite
+            Status[Pairs[Occluded]] = PairOccluded
+            # Some sight segments may pass, the pair is partially visible unless another wall occludes it
+            Touched[Pairs[Touch]] = True
+            Pass = Pairs[~Occluded]
+
+        if flat.Left[node] != -1:
+            GoLeft = np.concatenate((Active[Front], Pass))
+            if len(GoLeft) > 0:
+                stack.append((flat.Left[node], GoLeft))
+        if flat.Right[node] != -1:
+            GoRight = np.concatenate((Active[Back], Pass))
+            if len(GoRight) > 0:
+                stack.append((flat.Right[node], GoRight))
+
+    Status[(Status == Running) & Touched] = PairUnknown
+    Status[Status == Running] = PairVisible
+    return Status
+
+def searchSegments(Values, Start, Stop, Targets):
+    """
+    Vectorized binary search, for every target the first position in Values[Start[k]:Stop[k]] (a sorted slice) whose
+    value is not less than Targets[k], Stop[k] if there is none
+    """
+    First = np.array(Start, dtype=np.int64)
+    Length = np.asarray(Stop, dtype=np.int64) - First
+    Last = max(len(Values) - 1, 0)
+    # All searches step together, the finished ones with a length of 0
+    while Length.any():
+        Half = Length >> 1
+        Middle = First + Half
+        Less = (Length > 0) & (Values[np.minimum(Middle, Last)] < Targets)
+        First = np.where(Less, Middle + 1, First)
+        Length = np.where(Less, Length - Half - 1, Half)
+    return First
+
+class CompressedBitset:
+    """
+    Read-only set of non-negative ints, split into chunks of 2^ChunkBits by their high bits. Like Roaring bitmaps, a
+    sparse chunk stores its members as sorted uint16 offsets, only a chunk with more than MaxArray members gets a
+    bitmap, which is smaller then. Chunks without members take no space
+    """
+    ChunkBits = 16
+    # A bitmap of 2^16 bits takes as many bytes as 4096 uint16 offsets
+    MaxArray = 4096
+
+    def __init__(self, Indices):
+        """:param Indices: int array of the members"""
+        Indices = np.unique(np.asarray(Indices, dtype=np.int64))
+        Chunks = Indices >> self.ChunkBits
+        Local = (Indices & ((1 << self.ChunkBits) - 1)).astype(np.uint16)
+        self.Keys, Counts = np.unique(Chunks, return_counts=True)
+        Dense = Counts > self.MaxArray
+        # Chunk k holds Offsets[OffsetStart[k]:OffsetStart[k + 1]], or Bitmaps[BitmapIndex[k]] if it is dense
+        Sparse = ~np.repeat(Dense, Counts)
+        self.Offsets = Local[Sparse]
+        self.OffsetStart = np.zeros(len(self.Keys) + 1, dtype=np.int64)
+        np.cumsum(np.where(Dense, 0, Counts), out=self.OffsetStart[1:])
+        self.BitmapIndex = np.where(Dense, np.cumsum(Dense) - 1, -1).astype(np.int32)
+        self.Bitmaps = np.zeros((int(np.count_nonzero(Dense)), (1 << self.ChunkBits) // 8), dtype=np.uint8)
+        if len(self.Bitmaps) > 0:
+            Row = self.BitmapIndex[np.repeat(np.arange(len(self.Keys)), Counts)[~Sparse]]
+            Bits = Local[~Sparse]
+            np.bitwise_or.at(self.Bitmaps, (Row, Bits >> 3), (1 << (7 - (Bits & 7))).astype(np.uint8))
+        self.Count = len(Indices)
+
+    def contains(self, Indices):
+        """returns a boolean array, True for the members among 'Indices'"""
+        Indices = np.asarray(Indices, dtype=np.int64)
+        Found = np.zeros(len(Indices), dtype=bool)
+        if len(self.Keys) == 0:
+            return Found
+        Chunks = Indices >> self.ChunkBits
+        Position = np.minimum(np.searchsorted(self.Keys, Chunks), len(self.Keys) - 1)
+        Local = Indices & ((1 << self.ChunkBits) - 1)
+        Present = self.Keys[Position] == Chunks
+        Bitmap = Present & (self.BitmapIndex[Position] != -1)
+        Array = np.flatnonzero(Present & ~Bitmap)
+
+        if Bitmap.any():
+            Bits = self.Bitmaps[self.BitmapIndex[Position[Bitmap]], Local[Bitmap] >> 3] >> (7 - (Local[Bitmap] & 7))
+            Found[Bitmap] = (Bits & 1) == 1
+        if len(Array) > 0:
+            Start = self.OffsetStart[Position[Array]]
+            Stop = self.OffsetStart[Position[Array] + 1]
+            At = searchSegments(self.Offsets, Start, Stop, Local[Array])
+            Found[Array] = (At < Stop) & (self.Offsets[np.minimum(At, len(self.Offsets) - 1)] == Local[Array])
+        return Found
+
+    @property
+    def nbytes(self):
+        return self.Keys.nbytes + self.Offsets.nbytes + self.OffsetStart.nbytes + self.BitmapIndex.nbytes + \
+            self.Bitmaps.nbytes
+
+class PVS:
+    """
+    Potentially visible sets of the leaf cells of a BSP tree: every pair of cells is fully visible, fully occluded or
+    unknown (partially visible, or not classified), so line of sight between points in decided cells is a lookup, the
+    rest falls back to walking the tree. The classification is geometric, it agrees with the tree walk except where the
+    walk itself is degenerate (sight segments collinear with a splitter within DoubleTolerance)
+    """
+    def __init__(self, tree, Bounds=None, MaxDistance=None, Margin=None, MaxVertices=6, BatchSize=16384):
+        """
+        Precomputes the cell pairs
+        :param tree: BSP (compiled if needed) or FlatTree
+        :param Bounds: tuple (xmin, ymin, xmax, ymax), the area covered by cells, defaults to the bounding box of the
+        walls grown by 5%, points outside fall back to the tree walk
+        :param MaxDistance: float, only pairs of cells whose bounding boxes are at most this far apart are classified,
+        None for all pairs (quadratic in the number of cells, for small trees only)
+        :param Margin: float, points closer than this to the boundary of their cell fall back to the tree walk, and
+        the classification treats distances up to it as touching, defaults to 1e-6 of the diagonal of 'Bounds'
+        :param MaxVertices: int, cells with more vertices are classified by their bounding box
+        :param BatchSize: int, number of cell pairs walked through the tree together
+        """
+        self.tree = tree
+        self.TreeVersion = getVersion(tree)
+        self.flat = getFlatTree(tree)
+        if Bounds is None:
+            Lines = self.flat.Lines
+            if len(Lines) > 0:
+                Low = np.minimum(Lines[:, 0:2], Lines[:, 2:4]).min(axis=0)
+                High = np.maximum(Lines[:, 0:2], Lines[:, 2:4]).max(axis=0)
+            else:
+                Low, High = np.zeros(2), np.ones(2)
+            Grow = 0.05 * (High - Low) + 1.0
+            Bounds = tuple((Low - Grow).tolist() + (High + Grow).tolist())
+        self.Bounds = Bounds
+        self.Margin = Margin if Margin is not None else 1e-6 * np.hypot(Bounds[2] - Bounds[0], Bounds[3] - Bounds[1])
+
+        Polygons, self.LeftCell, self.RightCell = getCells(self.flat, Bounds)
+        self.CellCount = len(Polygons)
+        X, Y, Empty = getVertexArrays(Polygons, MaxVertices, self.Margin)
+        self.Frames = getNodeFrames(self.flat)
+        I, J = findCellPairs(X, Y, Empty, MaxDistance)
+
+        VisiblePairs = []
+        OccludedPairs = []
+        for Start in range(0, len(I), BatchSize):
+            BatchI = I[Start:Start + BatchSize]
+            BatchJ = J[Start:Start + BatchSize]
+            Status = classifyCellPairs(self.flat, self.Frames, X, Y, BatchI, BatchJ, self.Margin)
+            Index = BatchI * self.CellCount + BatchJ
+            VisiblePairs.append(Index[Status == PairVisible])
+            OccludedPairs.append(Index[Status == PairOccluded])
+        self.Visible = CompressedBitset(np.concatenate(VisiblePairs) if len(VisiblePairs) > 0 else [])
+        self.Occluded = CompressedBitset(np.concatenate(OccludedPairs) if len(OccludedPairs) > 0 else [])
+        self.Pairs = len(I)
+
+        self.Lookups = 0
+        self.Fallbacks = 0
+
+    def locateCells(self, Points):
+        """returns an int array, the cell of every point of float64 array (N, 2), -1 for points outside 'Bounds' or
+        closer than 'Margin' to the splitter line of a node on their way down"""
+        Px, Py, Nx, Ny = self.Frames[0:4]
+        xmin, ymin, xmax, ymax = self.Bounds
+        Cells = np.full(len(Points), -1, dtype=np.int64)
+        Inside = (Points[:, 0] > xmin + self.Margin) & (Points[:, 0] < xmax - self.Margin) & \
+            (Points[:, 1] > ymin + self.Margin) & (Points[:, 1] < ymax - self.Margin)
+        if len(self.flat.Left) == 0:
+            Cells[Inside] = 0
+            return Cells
+
+        stack = [(0, np.flatnonzero(Inside))]
+        while len(stack) != 0:
+            node, Active = stack.pop()
+            D = Nx[node] * (Points[Active, 0] - Px[node]) + Ny[node] * (Points[Active, 1] - Py[node])
+            for Child, Cell, Side in ((self.flat.Left[node], self.LeftCell[node], D > self.Margin),
+                                      (self.flat.Right[node], self.RightCell[node], D < -self.Margin)):
+                if Child != -1:
+                    if Side.any():
+                        stack.append((Child, Active[Side]))
+                else:
+                    Cells[Active[Side]] = Cell
+        return Cells
+
+    def checkSightSegments(self, segments, Stats=None):
+        """
+        Same as BSP.checkSightSegments, pairs of cells decided by the PVS are looked up, the others are walked
+        through the tree (all of them once the BSP tree changed after the precomputation)
+        :param Stats: QueryStats to record the walked sight segments in, or None
+        """
+        Segments = np.asarray(segments, dtype=np.float64).reshape(-1, 4)
+        self.Lookups += len(Segments)
+        if getVersion(self.tree) != self.TreeVersion:
+            self.Fallbacks += len(Segments)
+            return self.tree.checkSightSegments(Segments, Stats)
+
+        From = self.locateCells(Segments[:, 0:2])
+        To = self.locateCells(Segments[:, 2:4])
+        Located = (From != -1) & (To != -1)
+        Index = np.minimum(From, To) * self.CellCount + np.maximum(From, To)
+        # A cell is convex and no wall crosses it
+        Visible = Located & ((From == To) | self.Visible.contains(Index))
+        Decided = Visible | (Located & self.Occluded.contains(Index))
+
+        Walk = np.flatnonzero(~Decided)
+        if len(Walk) > 0:
+            Visible[Walk] = self.tree.checkSightSegments(Segments[Walk], Stats)
+        self.Fallbacks += len(Walk)
+        return Visible
+
+    def checkLoSBatch(self, points, Stats=None):
+        """Same as BSP.checkLoSBatch through the PVS"""
+        return pairsToMatrix(points, self.checkSightSegments, Stats)
+
+    def summary(self):
+        """returns the size of the PVS and the share of lookups answered without walking the tree as a dictionary"""
+        return {
+            'Cells': self.CellCount,
+            'Pairs': self.Pairs,
+            'Visible': self.Visible.Count,
+            'Occluded': self.Occluded.Count,
+            'Unknown': self.Pairs - self.Visible.Count - self.Occluded.Count,
+            'Bytes': self.Visible.nbytes + self.Occluded.nbytes,
+            # Two plain bitsets of all pairs of cells, for comparison
+            'UncompressedBytes': 2 * ((self.CellCount * (self.CellCount - 1) // 2 + 7) // 8),
+            'Lookups': self.Lookups,
+            'Fallbacks': self.Fallbacks,
+            'HitRate': 1 - self.Fallbacks / self.Lookups if self.Lookups > 0 else 0.0}
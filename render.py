@@ -0,0 +1,57 @@
+import sys
+
+def drawScene(Result):
+    """Renderer plug-in of runPipeline, draws line segments, points and lines of sight with pygame and blocks in the
+    window event loop until the window is closed"""
+    import pygame
+    from pygame.locals import QUIT
+
+    Lines = Result['Lines']
+    points = Result['Points']
+    LoS = Result['LoS']
+
+    # set up pygame
+    pygame.init()
+
+    # set up the window
+    windowSurface = pygame.display.set_mode(
+        (Result['width'], Result['height']), 0, 32)
+    pygame.display.set_caption('BSP')
+
+    # set up the colors
+    BLACK = (0, 0, 0)
+    WHITE = (255, 255, 255)
+    ORANGE = (255, 127, 0)
+    GREEN = (0, 255, 0)
+
+    # draw the white background onto the surface
+    windowSurface.fill(BLACK)
+
+    # draw lines onto the surface
+    for l in Lines:
+        pygame.draw.line(windowSurface, WHITE,
+                         (l.p1.x, l.p1.y), (l.p2.x, l.p2.y), 2)
+
+    for point in points:
+        pygame.draw.circle(windowSurface, ORANGE, (point.x, point.y), 4, 4)
+
+    for iFrom in range(len(points)):
+        for iTo in range(len(points)):
+            if iFrom != iTo and LoS[iFrom][iTo]:
+                pygame.draw.line(
+                    windowSurface,
+                    GREEN,
+                    (points[iFrom].x,
+                     points[iFrom].y),
+                    (points[iTo].x,
+                     points[iTo].y))
+
+    # draw the window onto the screen
+    pygame.display.update()
+
+    # run the game loop
+    while True:
+        for event in pygame.event.get():
+            if event.type == QUIT:
+                pygame.quit()
+                sys.exit()
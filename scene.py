@@ -0,0 +1,295 @@
+import numpy as np
+
+from geometry import LineSegment, Point, sign
+
+def generateRandom(n, Range, a=3, isPowerLaw=False):
+    """
+    Generate a random number
+    :param n: int, Number of numbers to return
+    :param Range: float, maximum range of a number to be generated
+    :param a: float, for use in powerlaw distribution
+    :param isPowerLaw: boolean, generate with powerlaw distribution if true else generate with uniform distribution
+    :return: integer or list of numbers depending on argument n
+    """
+    if not isPowerLaw:
+        if n > 1:
+            return list(np.random.uniform(0, Range, n))
+        else:
+            return np.random.uniform(0, Range)
+
+    else:
+        if n > 1:
+            return list(np.random.power(a, n) * Range)
+        else:
+            return np.random.power(a) * Range
+
+
+def generateRandomScene(
+        n,
+        width,
+        height,
+        MinLength=50,
+        MaxLength=300,
+        isUniform=True):
+    """
+    Randomnly generates a list of non intersecting line segments
+    :param n: int, Number of line segments
+    :param width: int, our area width
+    :param height: int, our area height
+    :param MinLength: float, Minimum possible length of a line segment
+    :param MaxLength: float, Maximum possible length of a line segment
+    :param isUniform: boolean, whether the position of line segments should be generated with uniform distributed random number or with powerlaw distribution
+    :return: a list of line segments
+    """
+    Lines = []
+    for i in range(n):
+        Done = False
+        while not Done:
+            P2x = -1
+            P2y = -1
+            c = 0
+            if isUniform:
+                P1x = int(round(np.random.uniform(0, width)))
+                P1y = int(round(np.random.uniform(0, height)))
+                Distance = np.random.uniform(MinLength, MaxLength)
+
+
+                while not 0 <= P2x <= width:
+                    c = np.random.uniform(-1, 1)
+                    P2x = P1x + int(round(c * Distance))
+
+                while not 0 <= P2y <= height:
+                    P2y = P1y + \
+                        int(round(sign(np.random.uniform(-1, 1)) * (1 - (abs(c))) * Distance))
+
+            else:
+                P1x = int(round(np.random.power(3.0) * width))
+                P1y = int(round(np.random.power(3.0) * height))
+                Distance = np.random.uniform(MinLength, MaxLength)
+
+                while not 0 <= P2x <= width:
+                    c = np.random.uniform(-1, 1)
+                    P2x = P1x + int(round(c * Distance))
+
+                while not 0 <= P2y <= height:
+                    P2y = P1y + \
+                        int(round(sign(np.random.uniform(-1, 1)) * (1 - (abs(c))) * Distance))
+            r = round(generateRandom(1, 1))
+            if r == 0:
+                r = -1
+
+            NewLine = LineSegment(Point(P1x, P1y), Point(P2x, P2y), r)
+            IsIntersection = False
+            for line in Lines:
+                if NewLine.split(line) is not None:
+                    IsIntersection = True
+                    break
+
+            if not IsIntersection:
+                Lines.append(NewLine)
+                Done = True
+
+    return Lines
+
+def generatePoints(n, width, height, isUniform=True):
+    """
+    Randomnly generates a list of points
+    :param n: int, Number of points
+    :param width: int, area width
+    :param height: int, area height
+    :param isUniform: boolean, whether the position of line segments should be generated with random number of uniform distribution or powerlaw distribution
+    :return: list of points
+    """
+    Points = []
+    for i in range(n):
+        if isUniform:
+            Points.append(Point(int(round(generateRandom(1, width))),
+                                int(round(generateRandom(1, height)))))
+        else:
+            Points.append(Point(int(round(generateRandom(1, width, isPowerLaw=True))), int(
+                round(generateRandom(1, height, isPowerLaw=True)))))
+
+    return Points
+
+def expandRanges(Start, Counts):
+    """returns the concatenation of range(Start[k], Start[k] + Counts[k]) over all k as one int array"""
+    Offsets = np.arange(Counts.sum()) - np.repeat(np.cumsum(Counts) - Counts, Counts)
+    return np.repeat(Start, Counts) + Offsets
+
+def getCellEntries(Lines, CellSize, Width):
+    """
+    Grid cells overlapped by the bounding box of every line segment, with cells at least as large as the longest line
+    segment a bounding box overlaps at most 2 by 2 cells
+    :return: two int arrays, cell keys and the index of the line segment of every entry
+    """
+    Low = np.minimum(Lines[:, 0:2], Lines[:, 2:4]) // CellSize
+    High = np.maximum(Lines[:, 0:2], Lines[:, 2:4]) // CellSize
+    Keys = []
+    Owners = []
+    for dx in (0, 1):
+        for dy in (0, 1):
+            Inside = (Low[:, 0] + dx <= High[:, 0]) & (Low[:, 1] + dy <= High[:, 1])
+            Keys.append((Low[Inside, 0] + dx) * Width + (Low[Inside, 1] + dy))
+            Owners.append(np.flatnonzero(Inside))
+    return np.concatenate(Keys), np.concatenate(Owners)
+
+def orientation(Ax, Ay, Bx, By, Cx, Cy):
+    """sign of the cross product (B - A) x (C - A), exact for integer coordinates"""
+    return np.sign((Bx - Ax) * (Cy - Ay) - (By - Ay) * (Cx - Ax))
+
+def segmentsIntersect(A, B):
+    """returns a boolean array, True where closed line segment A[k] intersects or touches B[k], rows (x1, y1, x2, y2)"""
+    o1 = orientation(A[:, 0], A[:, 1], A[:, 2], A[:, 3], B[:, 0], B[:, 1])
+    o2 = orientation(A[:, 0], A[:, 1], A[:, 2], A[:, 3], B[:, 2], B[:, 3])
+    o3 = orientation(B[:, 0], B[:, 1], B[:, 2], B[:, 3], A[:, 0], A[:, 1])
+    o4 = orientation(B[:, 0], B[:, 1], B[:, 2], B[:, 3], A[:, 2], A[:, 3])
+    Crossing = (o1 * o2 <= 0) & (o3 * o4 <= 0)
+    # Collinear line segments only intersect if their extents overlap
+    Collinear = (o1 == 0) & (o2 == 0)
+    Overlap = (np.maximum(np.minimum(A[:, 0], A[:, 2]), np.minimum(B[:, 0], B[:, 2])) <=
+               np.minimum(np.maximum(A[:, 0], A[:, 2]), np.maximum(B[:, 0], B[:, 2]))) & \
+              (np.maximum(np.minimum(A[:, 1], A[:, 3]), np.minimum(B[:, 1], B[:, 3])) <=
+               np.minimum(np.maximum(A[:, 1], A[:, 3]), np.maximum(B[:, 1], B[:, 3])))
+    return np.where(Collinear, Overlap, Crossing)
+
+def drawCandidates(Random, Count, width, height, MinLength, MaxLength, isUniform):
+    """
+    Draws line segments the way generateRandomScene does, all at once
+    :return: int64 array (Count, 4) of line segments (x1, y1, x2, y2) inside the area, fewer rows if some did not fit
+    """
+    if isUniform:
+        P1x = np.round(Random.uniform(0, width, Count))
+        P1y = np.round(Random.uniform(0, height, Count))
+    else:
+        P1x = np.round(Random.power(3.0, Count) * width)
+        P1y = np.round(Random.power(3.0, Count) * height)
+    Distance = Random.uniform(MinLength, MaxLength, Count)
+
+    # Redraw the direction of the candidates whose second point falls outside the area, a few times at most
+    P2x = np.full(Count, -1.0)
+    P2y = np.full(Count, -1.0)
+    c = np.zeros(Count)
+    Redraw = np.ones(Count, dtype=bool)
+    for Attempt in range(8):
+        c[Redraw] = Random.uniform(-1, 1, np.count_nonzero(Redraw))
+        P2x[Redraw] = P1x[Redraw] + np.round(c[Redraw] * Distance[Redraw])
+        Redraw = ~((0 <= P2x) & (P2x <= width))
+        if not Redraw.any():
+            break
+    Redraw = np.ones(Count, dtype=bool)
+    for Attempt in range(8):
+        Sign = np.where(Random.uniform(-1, 1, np.count_nonzero(Redraw)) > 0, 1, -1)
+        P2y[Redraw] = P1y[Redraw] + np.round(Sign * (1 - np.abs(c[Redraw])) * Distance[Redraw])
+        Redraw = ~((0 <= P2y) & (P2y <= height))
+        if not Redraw.any():
+            break
+
+    Fits = (0 <= P2x) & (P2x <= width) & (0 <= P2y) & (P2y <= height)
+    return np.stack((P1x, P1y, P2x, P2y), axis=1)[Fits].astype(np.int64)
+
+def generateSceneArrays(
+        n,
+        width,
+        height,
+        MinLength=50,
+        MaxLength=300,
+        isUniform=True,
+        Seed=None,
+        MaxAttempts=None):
+    """
+    Randomnly generates non intersecting line segments like generateRandomScene, but draws candidates in batches with
+    a vectorized random number generator and rejects intersecting candidates with a uniform grid, so every candidate is
+    only tested against line segments in the neighbouring cells. Unlike generateRandomScene, which rejects a candidate
+    whose infinite line crosses any line segment, only candidates that actually intersect a line segment are rejected
+    :param n: int, Number of line segments
+    :param width: int, our area width
+    :param height: int, our area height
+    :param MinLength: float, Minimum possible length of a line segment
+    :param MaxLength: float, Maximum possible length of a line segment
+    :param isUniform: boolean, uniform or powerlaw distribution of the positions of line segments
+    :param Seed: int, seed of the random number generator, None for a random seed
+    :param MaxAttempts: int, number of candidates to draw at most before giving up, defaults to 1000 * n
+    :return: int64 array (n, 4) of line segments (x1, y1, x2, y2) and int8 array (n) of normal directions (1 or -1)
+    """
+    Random = np.random.default_rng(Seed)
+    if MaxAttempts is None:
+        MaxAttempts = 1000 * max(n, 1)
+    CellSize = max(int(np.ceil(MaxLength)), 1)
+    GridWidth = height // CellSize + 3
+
+    Lines = np.zeros((0, 4), dtype=np.int64)
+    Keys = np.zeros(0, dtype=np.int64)
+    Owners = np.zeros(0, dtype=np.int64)
+    Attempts = 0
+    while len(Lines) < n:
+        if Attempts >= MaxAttempts:
+            raise RuntimeError('Generated %d of %d line segments in %d attempts, the area is too crowded' % (
+                len(Lines), n, Attempts))
+        Count = min(max(1024, 2 * (n - len(Lines))), 1 << 16)
+        Attempts += Count
+        Candidates = drawCandidates(Random, Count, width, height, MinLength, MaxLength, isUniform)
+        CandidateKeys, CandidateOwners = getCellEntries(Candidates, CellSize, GridWidth)
+
+        # Candidates against the line segments accepted so far, through the cells they share
+        Rejected = np.zeros(len(Candidates), dtype=bool)
+        Order = np.argsort(Keys, kind='stable')
+        SortedKeys = Keys[Order]
+        Start = np.searchsorted(SortedKeys, CandidateKeys, side='left')
+        Counts = np.searchsorted(SortedKeys, CandidateKeys, side='right') - Start
+        Candidate = np.repeat(CandidateOwners, Counts)
+        Accepted = Owners[Order[expandRanges(Start, Counts)]]
+        Hits = segmentsIntersect(Candidates[Candidate], Lines[Accepted])
+        Rejected[Candidate[Hits]] = True
+
+        # Candidates of the batch against the earlier candidates of the batch they intersect
+        Order = np.argsort(CandidateKeys, kind='stable')
+        SortedKeys = CandidateKeys[Order]
+        Start = np.searchsorted(SortedKeys, CandidateKeys, side='left')
+        Counts = np.searchsorted(SortedKeys, CandidateKeys, side='right') - Start
+        Candidate = np.repeat(CandidateOwners, Counts)
+        Other = CandidateOwners[Order[expandRanges(Start, Counts)]]
+        Earlier = (Other < Candidate) & ~Rejected[Other] & ~Rejected[Candidate]
+        Candidate = Candidate[Earlier]
+        Other = Other[Earlier]
+        Hits = segmentsIntersect(Candidates[Candidate], Candidates[Other])
+        Candidate = Candidate[Hits]
+        Other = Other[Hits]
+
+        # Greedy in the order of the batch, as if the candidates were added one by one: a candidate is rejected when
+        # an earlier candidate it intersects is accepted, and accepted once all of them are rejected. Every round
+        # settles at least the earliest candidate still open
+        Open = np.zeros(len(Candidates), dtype=bool)
+        Open[Candidate] = True
+        while len(Candidate) > 0:
+            Settled = ~Open[Other]
+            Rejected[Candidate[Settled & ~Rejected[Other]]] = True
+            Waiting = np.zeros(len(Candidates), dtype=bool)
+            Waiting[Candidate[~Settled]] = True
+            Open &= Waiting & ~Rejected
+            Keep = Open[Candidate]
+            Candidate = Candidate[Keep]
+            Other = Other[Keep]
+
+        New = Candidates[~Rejected][:n - len(Lines)]
+        NewKeys, NewOwners = getCellEntries(New, CellSize, GridWidth)
+        Keys = np.concatenate((Keys, NewKeys))
+        Owners = np.concatenate((Owners, NewOwners + len(Lines)))
+        Lines = np.concatenate((Lines, New))
+
+    Normals = np.where(Random.uniform(0, 1, n) < 0.5, -1, 1).astype(np.int8)
+    return Lines, Normals
+
+def generateSceneFast(n, width, height, MinLength=50, MaxLength=300, isUniform=True, Seed=None):
+    """Same as generateSceneArrays, but returns a list of line segments like generateRandomScene"""
+    Lines, Normals = generateSceneArrays(n, width, height, MinLength, MaxLength, isUniform, Seed)
+    return [LineSegment(Point(x1, y1), Point(x2, y2), Normal)
+            for (x1, y1, x2, y2), Normal in zip(Lines.tolist(), Normals.tolist())]
+
+def generatePointArray(n, width, height, isUniform=True, Seed=None):
+    """Same distribution as generatePoints, all at once, returns an int64 array (n, 2)"""
+    Random = np.random.default_rng(Seed)
+    if isUniform:
+        Points = Random.uniform(0, 1, (n, 2))
+    else:
+        Points = Random.power(3, (n, 2))
+    return np.round(Points * (width, height)).astype(np.int64)
@@ -0,0 +1,198 @@
+import asyncio
+import collections
+import time
+
+import numpy as np
+
+from bsp import fillMatrix, pairSegments, toPointArray
+
+class ServiceClosed(Exception):
+    """Raised for requests to a LoSService that is not running"""
+
+class LoSService:
+    """
+    Asyncio front end of a prebuilt tree for many coroutines: requests that arrive within 'Window' seconds of each
+    other are collected into one batch of sight segments, the batch is tested with a single call of
+    checkSightSegments in an executor, so the event loop is never blocked by a traversal. Batches run one at a time,
+    so 'tree' may be anything with checkSightSegments (BSP, FlatTree, PVS, VisibilityCache), it is never used by two
+    threads at once. Changing a BSP tree (insert, remove) while the service runs is up to the caller to serialize
+    """
+    def __init__(self, tree, Window=0.002, MaxBatch=8192, MaxPending=1024, Timeout=1.0, Executor=None,
+                 MetricsSize=10000, Stats=None):
+        """
+        :param tree: BSP, FlatTree or any object with checkSightSegments(segments, Stats)
+        :param Window: float, seconds a batch waits for more requests after its first request arrived
+        :param MaxBatch: int, a batch is started without waiting for the window once it holds this many sight segments
+        :param MaxPending: int, number of queued requests, further requests wait for room (backpressure)
+        :param Timeout: float, default seconds a request may take from submission to result, None for no limit
+        :param Executor: concurrent.futures.Executor for the traversals, None for the default executor of the loop
+        :param MetricsSize: int, number of most recent latencies and batch sizes kept for the percentiles
+        :param Stats: QueryStats to record the traversals in, or None
+        """
+        self.tree = tree
+        self.Window = Window
+        self.MaxBatch = MaxBatch
+        self.MaxPending = MaxPending
+        self.Timeout = Timeout
+        self.Executor = Executor
+        self.Stats = Stats
+        self.queue = None
+        self.task = None
+
+        self.Latencies = collections.deque(maxlen=MetricsSize)
+        self.BatchSizes = collections.deque(maxlen=MetricsSize)
+        self.Requests = 0
+        self.Segments = 0
+        self.Batches = 0
+        self.TimedOut = 0
+        self.Failed = 0
+
+    async def start(self):
+        """Starts the batching task on the running event loop"""
+        if self.task is None:
+            self.queue = asyncio.Queue(self.MaxPending)
+            self.task = asyncio.get_running_loop().create_task(self.runBatches())
+
+    async def stop(self):
+        """Finishes the queued requests and stops the batching task"""
+        if self.task is not None:
+            await self.queue.join()
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.stop()
+
+    async def checkSightSegments(self, segments, Timeout=-1):
+        """
+        Line of sight of a few sight segments, waits for room in the queue when too many requests are pending
+        :param segments: array-like of shape (M, 4), rows of sight segments (x1, y1, x2, y2)
+        :param Timeout: float, seconds, None for no limit, defaults to the Timeout of the service. The time spent
+        waiting for room in the queue counts as well
+        :return: boolean array of length M, see BSP.checkSightSegments
+        :raise asyncio.TimeoutError: if no result arrived in time, the request is dropped from its batch if the batch
+        has not been started yet
+        """
+        if self.task is None:
+            raise ServiceClosed('LoSService is not running')
+        Segments = np.asarray(segments, dtype=np.float64).reshape(-1, 4)
+        Timeout = self.Timeout if Timeout == -1 else Timeout
+        Future = asyncio.get_running_loop().create_future()
+        self.Requests += 1
+        try:
+            return await asyncio.wait_for(self.submit(Segments, Future), Timeout)
+        except asyncio.TimeoutError:
+            self.TimedOut += 1
+            Future.cancel()
+            raise
+
+    async def submit(self, Segments, Future):
+        """Queues a request and waits for its result"""
+        await self.queue.put((Segments, Future, time.perf_counter()))
+        return await Future
+
+    async def checkSight(self, p1, p2, Timeout=-1):
+        """returns True if nothing blocks the sight segment from 'p1' to 'p2' (Point or (x, y)), see
+        checkSightSegments"""
+        Segment = np.hstack((toPointArray([p1]), toPointArray([p2])))
+        return bool((await self.checkSightSegments(Segment, Timeout))[0])
+
+    async def runBatches(self):
+        """Batching task, collects requests into batches and tests every batch in the executor"""
+        loop = asyncio.get_running_loop()
+        while True:
+            Batch = [await self.queue.get()]
+            Count = len(Batch[0][0])
+            Deadline = loop.time() + self.Window
+            while Count < self.MaxBatch:
+                try:
+                    Request = self.queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    if loop.time() >= Deadline:
+                        break
+                    try:
+                        Request = await asyncio.wait_for(self.queue.get(), Deadline - loop.time())
+                    except asyncio.TimeoutError:
+                        break
+                Batch.append(Request)
+                Count += len(Request[0])
+            try:
+                await self.runBatch(loop, Batch)
+            finally:
+                for _ in Batch:
+                    self.queue.task_done()
+
+    async def runBatch(self, loop, Batch):
+        """Tests the sight segments of the requests of 'Batch' not timed out yet with a single call in the executor
+        and hands every request its share of the result"""
+        Batch = [Request for Request in Batch if not Request[1].done()]
+        if len(Batch) == 0:
+            return
+        Segments = np.concatenate([Request[0] for Request in Batch])
+        try:
+            Visible = await loop.run_in_executor(self.Executor, self.tree.checkSightSegments, Segments, self.Stats)
+        except Exception as Error:
+            self.Failed += len(Batch)
+            for Request in Batch:
+                if not Request[1].done():
+                    Request[1].set_exception(Error)
+            return
+
+        self.Batches += 1
+        self.Segments += len(Segments)
+        self.BatchSizes.append(len(Segments))
+        Now = time.perf_counter()
+        Start = 0
+        for RequestSegments, Future, Submitted in Batch:
+            Stop = Start + len(RequestSegments)
+            if not Future.done():
+                Future.set_result(Visible[Start:Stop])
+                self.Latencies.append(Now - Submitted)
+            Start = Stop
+
+    def summary(self):
+        """returns request counts, batch counts and sizes and latency percentiles (seconds, of the requests that got
+        a result, from queueing to result) as a dictionary"""
+        Latencies = np.asarray(self.Latencies)
+        BatchSizes = np.asarray(self.BatchSizes)
+        return {
+            'Requests': self.Requests,
+            'Segments': self.Segments,
+            'Batches': self.Batches,
+            'TimedOut': self.TimedOut,
+            'Failed': self.Failed,
+            'Pending': self.queue.qsize() if self.queue is not None else 0,
+            'LatencyP50': float(np.percentile(Latencies, 50)) if len(Latencies) > 0 else 0.0,
+            'LatencyP99': float(np.percentile(Latencies, 99)) if len(Latencies) > 0 else 0.0,
+            'BatchSizeMean': float(BatchSizes.mean()) if len(BatchSizes) > 0 else 0.0,
+            'BatchSizeP50': float(np.percentile(BatchSizes, 50)) if len(BatchSizes) > 0 else 0.0,
+            'BatchSizeP99': float(np.percentile(BatchSizes, 99)) if len(BatchSizes) > 0 else 0.0,
+            'BatchSizeMax': int(BatchSizes.max()) if len(BatchSizes) > 0 else 0}
+
+class LocalClient:
+    """In-process client of a LoSService, with the query methods of BSP as coroutines, for tests and for game logic
+    running in the same process as the service"""
+    def __init__(self, service):
+        self.service = service
+
+    async def checkSightSegments(self, segments, Timeout=-1):
+        """see LoSService.checkSightSegments"""
+        return await self.service.checkSightSegments(segments, Timeout)
+
+    async def checkSight(self, p1, p2, Timeout=-1):
+        """see LoSService.checkSight"""
+        return await self.service.checkSight(p1, p2, Timeout)
+
+    async def checkLoSBatch(self, points, Timeout=-1):
+        """Same as BSP.checkLoSBatch, all pairs of 'points' in a single request"""
+        Points = toPointArray(points)
+        I, J, Segments = pairSegments(Points)
+        return fillMatrix(len(Points), I, J, await self.checkSightSegments(Segments, Timeout))
@@ -0,0 +1,101 @@
+import numpy as np
+
+class QueryStats:
+    """Collects statistics of line of sight queries, pass an instance as 'Stats' to the query methods of BSP and
+    FlatTree, queries are not instrumented at all without one"""
+    def __init__(self, BinWidth=50.0):
+        """
+        :param BinWidth: float, width of the distance bins of the histogram, distance is the length of the sight segment
+        """
+        self.BinWidth = BinWidth
+        self.Queries = 0
+        self.Blocked = 0
+        # Traversals stopped at an intersection while sub-trees were still waiting to be visited
+        self.EarlyExits = 0
+        self.NodesVisited = 0
+        # Intersection tests of the sight segment against line segments of the visited nodes
+        self.SplitterTests = 0
+        self.MaxDepth = 0
+        # Sub-trees skipped because the sight segment misses their bounding box, each saves at least one node visit
+        self.BoxRejections = 0
+        # Distance bin -> [Queries, Blocked, NodesVisited, MaxNodesVisited]
+        self.Bins = {}
+
+    def record(self, Distance, NodesVisited, SplitterTests, Depth, Blocked, EarlyExit, BoxRejections=0):
+        """Records a single query"""
+        self.Queries += 1
+        self.Blocked += int(Blocked)
+        self.EarlyExits += int(EarlyExit)
+        self.NodesVisited += NodesVisited
+        self.SplitterTests += SplitterTests
+        self.BoxRejections += BoxRejections
+        self.MaxDepth = max(self.MaxDepth, Depth)
+
+        Bin = self.Bins.setdefault(int(Distance // self.BinWidth), [0, 0, 0, 0])
+        Bin[0] += 1
+        Bin[1] += int(Blocked)
+        Bin[2] += NodesVisited
+        Bin[3] = max(Bin[3], NodesVisited)
+
+    def recordBatch(self, Distances, NodesVisited, SplitterTests, Depths, Blocked, EarlyExits, BoxRejections=None):
+        """Records a batch of queries, every argument is an array with one entry per query"""
+        if len(Distances) == 0:
+            return
+        self.Queries += len(Distances)
+        self.Blocked += int(np.count_nonzero(Blocked))
+        self.EarlyExits += int(np.count_nonzero(EarlyExits))
+        self.NodesVisited += int(NodesVisited.sum())
+        self.SplitterTests += int(SplitterTests.sum())
+        if BoxRejections is not None:
+            self.BoxRejections += int(BoxRejections.sum())
+        self.MaxDepth = max(self.MaxDepth, int(Depths.max()))
+
+        BinIndex = (Distances // self.BinWidth).astype(np.int64)
+        Keys, Inverse = np.unique(BinIndex, return_inverse=True)
+        Queries = np.bincount(Inverse, minlength=len(Keys))
+        BlockedCount = np.bincount(Inverse, weights=Blocked, minlength=len(Keys))
+        Nodes = np.bincount(Inverse, weights=NodesVisited, minlength=len(Keys))
+        MaxNodes = np.zeros(len(Keys), dtype=np.int64)
+        np.maximum.at(MaxNodes, Inverse, NodesVisited)
+        for index, Key in enumerate(Keys.tolist()):
+            Bin = self.Bins.setdefault(Key, [0, 0, 0, 0])
+            Bin[0] += int(Queries[index])
+            Bin[1] += int(BlockedCount[index])
+            Bin[2] += int(Nodes[index])
+            Bin[3] = max(Bin[3], int(MaxNodes[index]))
+
+    def histogram(self):
+        """returns a list of dictionaries, one per distance bin in ascending order, with keys 'From', 'To', 'Queries',
+        'Blocked', 'MeanNodesVisited' and 'MaxNodesVisited'"""
+        Histogram = []
+        for Key in sorted(self.Bins):
+            Queries, Blocked, Nodes, MaxNodes = self.Bins[Key]
+            Histogram.append({
+                'From': Key * self.BinWidth,
+                'To': (Key + 1) * self.BinWidth,
+                'Queries': Queries,
+                'Blocked': Blocked,
+                'MeanNodesVisited': Nodes / Queries,
+                'MaxNodesVisited': MaxNodes})
+        return Histogram
+
+    def summary(self):
+        """returns the totals as a dictionary"""
+        return {
+            'Queries': self.Queries,
+            'Blocked': self.Blocked,
+            'EarlyExits': self.EarlyExits,
+            'NodesVisited': self.NodesVisited,
+            'SplitterTests': self.SplitterTests,
+            'MaxDepth': self.MaxDepth,
+            'BoxRejections': self.BoxRejections,
+            'MeanNodesVisited': self.NodesVisited / self.Queries if self.Queries > 0 else 0.0}
+
+    def report(self):
+        """returns the totals and the histogram as printable text"""
+        Lines = [', '.join('%s: %s' % (Key, Value) for Key, Value in self.summary().items())]
+        for Bin in self.histogram():
+            Lines.append('Distance %0.1f-%0.1f: %d queries, %d blocked, # of traversals mean %0.2f max %d' % (
+                Bin['From'], Bin['To'], Bin['Queries'], Bin['Blocked'], Bin['MeanNodesVisited'],
+                Bin['MaxNodesVisited']))
+        return '\n'.join(Lines)
@@ -0,0 +1,162 @@
+import json
+import struct
+
+import numpy as np
+
+from bsp import BSP, FlatTree, getSegmentArrays
+from geometry import LineSegment, Point
+
+# File layout: Magic, then Version and the length of the JSON directory as little endian uint32, then the directory
+# (array name -> dtype, shape and byte offset), then the raw arrays, each aligned to Alignment bytes
+Magic = b'LOSBSP\x00\x00'
+Version = 1
+Alignment = 64
+HeaderFormat = '<8sII'
+# Files written before node bounding boxes were added have no TreeBoxes, FlatTree computes them when loading those
+TreeArrays = ('Lines', 'Normals', 'NodeStart', 'Left', 'Right', 'Ids', 'Boxes')
+
+def saveScene(Filename, Walls=None, Agents=None, Tree=None):
+    """
+    Writes walls, agents and a built tree into one binary file, any of them may be left out
+    :param Walls: list of LineSegment, or a tuple of arrays (Lines (W, 4), Normals (W)) as from generateSceneArrays
+    :param Agents: list of Point or array-like (N, 2)
+    :param Tree: BSP (compiled if needed) or FlatTree
+    """
+    Arrays = {}
+    if Walls is not None:
+        if isinstance(Walls, tuple):
+            Lines, Normals = Walls
+        else:
+            Lines = getSegmentArrays(Walls)[0]
+            Normals = [line.Normal for line in Walls]
+        Arrays['Walls'] = np.asarray(Lines, dtype=np.float64).reshape(-1, 4)
+        Arrays['WallNormals'] = np.asarray(Normals, dtype=np.int8)
+    if Agents is not None:
+        if len(Agents) > 0 and hasattr(Agents[0], 'x'):
+            Agents = [(point.x, point.y) for point in Agents]
+        Arrays['Agents'] = np.asarray(Agents, dtype=np.float64).reshape(-1, 2)
+    if Tree is not None:
+        if isinstance(Tree, BSP):
+            Tree = Tree.flat if Tree.flat is not None else Tree.compileTree()
+        for Name in TreeArrays:
+            Arrays['Tree' + Name] = np.ascontiguousarray(getattr(Tree, Name))
+
+    # The directory holds the offsets, which depend on the directory length, so reserve enough room for it first
+    Directory = {Name: {'dtype': Array.dtype.str, 'shape': list(Array.shape), 'offset': 0}
+                 for Name, Array in Arrays.items()}
+    DirectorySize = len(json.dumps(Directory)) + 32 * len(Arrays) + 64
+    Offset = alignOffset(struct.calcsize(HeaderFormat) + DirectorySize)
+    for Name, Array in Arrays.items():
+        Directory[Name]['offset'] = Offset
+        Offset = alignOffset(Offset + Array.nbytes)
+    Text = json.dumps(Directory).encode().ljust(DirectorySize)
+
+    with open(Filename, 'wb') as f:
+        f.write(struct.pack(HeaderFormat, Magic, Version, len(Text)))
+        f.write(Text)
+        for Name, Array in Arrays.items():
+            f.seek(Directory[Name]['offset'])
+            f.write(Array.tobytes())
+        f.truncate(Offset)
+
+def alignOffset(Offset):
+    """returns the first multiple of Alignment not below 'Offset'"""
+    return (Offset + Alignment - 1) // Alignment * Alignment
+
+def readDirectory(Filename):
+    """returns the directory of a file written by saveScene, raises ValueError for other files and versions"""
+    with open(Filename, 'rb') as f:
+        Header = f.read(struct.calcsize(HeaderFormat))
+        if len(Header) < struct.calcsize(HeaderFormat):
+            raise ValueError('%s is not a scene file' % Filename)
+        FileMagic, FileVersion, DirectorySize = struct.unpack(HeaderFormat, Header)
+        if FileMagic != Magic:
+            raise ValueError('%s is not a scene file' % Filename)
+        if FileVersion != Version:
+            raise ValueError('%s has version %d, only version %d is supported' % (Filename, FileVersion, Version))
+        return json.loads(f.read(DirectorySize).decode())
+
+def loadScene(Filename, Mmap=True):
+    """
+    Reads a file written by saveScene, with 'Mmap' the arrays are read-only numpy.memmap views of the file, so any
+    number of processes can map the same file without copying it
+    :return: a dictionary with the keys present of 'Walls' (W, 4), 'WallNormals' (W), 'Agents' (N, 2) and 'Tree'
+    (FlatTree)
+    """
+    Arrays = {}
+    for Name, Entry in readDirectory(Filename).items():
+        Shape = tuple(Entry['shape'])
+        if int(np.prod(Shape)) == 0:
+            # numpy.memmap cannot map empty arrays
+            Arrays[Name] = np.zeros(Shape, dtype=Entry['dtype'])
+        elif Mmap:
+            Arrays[Name] = np.memmap(Filename, dtype=Entry['dtype'], mode='r', offset=Entry['offset'], shape=Shape)
+        else:
+            with open(Filename, 'rb') as f:
+                f.seek(Entry['offset'])
+                Arrays[Name] = np.fromfile(f, dtype=Entry['dtype'], count=int(np.prod(Shape))).reshape(Shape)
+
+    Scene = {Name: Array for Name, Array in Arrays.items() if not Name.startswith('Tree')}
+    if 'TreeLines' in Arrays:
+        Scene['Tree'] = FlatTree(*[Arrays.get('Tree' + Name) for Name in TreeArrays])
+    return Scene
+
+def loadTree(Filename):
+    """returns the memory-mapped FlatTree of a file written by saveScene"""
+    return loadScene(Filename)['Tree']
+
+def iterLinesFromFile(filename):
+    """yields (x1, y1, x2, y2, Normal, Name) for every line segment of a text file in the format of
+    BSP.readLinesFromFile, one line of the file at a time"""
+    with open(filename, 'r') as f:
+        for line in f:
+            if line[0] != '#' and line.strip() != '':
+                data = line.rstrip('\n').split('\t')
+                x1, y1, x2, y2 = [float(x) for x in data[0].split(',')]
+                yield x1, y1, x2, y2, int(data[1]), data[2] if len(data) > 2 else ''
+
+def iterPointsFromFile(filename):
+    """yields (x, y) for every point of a text file in the format of BSP.readPointsFromFile"""
+    with open(filename, 'r') as f:
+        for line in f:
+            if line[0] != '#' and line.strip() != '':
+                x, y = [float(x) for x in line.split(',')]
+                yield x, y
+
+def fillChunks(Rows, Columns, ChunkSize):
+    """collects the first 'Columns' values of every row of iterable 'Rows' in float64 chunks of 'ChunkSize' rows,
+    returns the (n, Columns) array"""
+    Chunks = []
+    Chunk = np.empty((ChunkSize, Columns), dtype=np.float64)
+    Count = 0
+    for Row in Rows:
+        Chunk[Count] = Row[:Columns]
+        Count += 1
+        if Count == ChunkSize:
+            Chunks.append(Chunk)
+            Chunk = np.empty((ChunkSize, Columns), dtype=np.float64)
+            Count = 0
+    Chunks.append(Chunk[:Count])
+    return np.concatenate(Chunks)
+
+def importLinesFromFile(filename, ChunkSize=65536):
+    """Streaming importer of a line segment text file, returns float64 array (W, 4) of end points and int8 array (W)
+    of normal directions, names are dropped"""
+    Rows = fillChunks(((x1, y1, x2, y2, Normal) for x1, y1, x2, y2, Normal, Name in iterLinesFromFile(filename)),
+                      5, ChunkSize)
+    return Rows[:, 0:4].copy(), Rows[:, 4].astype(np.int8)
+
+def importPointsFromFile(filename, ChunkSize=65536):
+    """Streaming importer of a point text file, returns float64 array (N, 2)"""
+    return fillChunks(iterPointsFromFile(filename), 2, ChunkSize)
+
+def convertTextScene(LinesFilename, Filename, PointsFilename=None, UseHeuristic='even'):
+    """Reads a line segment text file (and optionally a point text file), generates the BSP tree and saves all of it
+    with saveScene"""
+    bsptree = BSP()
+    bsptree.tree.data = [LineSegment(Point(x1, y1), Point(x2, y2), Normal, Name)
+                         for x1, y1, x2, y2, Normal, Name in iterLinesFromFile(LinesFilename)]
+    Walls = list(bsptree.tree.data)
+    bsptree.generateTree(bsptree.tree, UseHeuristic)
+    Agents = importPointsFromFile(PointsFilename) if PointsFilename is not None else None
+    saveScene(Filename, Walls, Agents, bsptree)
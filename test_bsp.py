@@ -0,0 +1,329 @@
+import concurrent.futures
+import hashlib
+
+import numpy as np
+import pytest
+
+from benchmark import generateStressScenes, stressPredicates
+from bsp import BSP
+from stats import QueryStats
+from geometry import LineSegment, Point
+from scene import generateSceneFast
+
+Width, Height = 800, 600
+
+def getWalls(bsptree):
+    """returns the walls of a BSP as a float64 array (W, 4) and their Ids (W)"""
+    Ids = sorted(bsptree.Segments)
+    Walls = [bsptree.Segments[Id] for Id in Ids]
+    return np.array([(L.p1.x, L.p1.y, L.p2.x, L.p2.y) for L in Walls], dtype=np.float64).reshape(-1, 4), np.array(Ids)
+
+def randomSegments(Count, Seed):
+    """returns seeded random sight segments (Count, 4) over the scene"""
+    return np.random.default_rng(Seed).uniform(0, [Width, Height, Width, Height], (Count, 4))
+
+def bruteForceVisible(Walls, Segments):
+    """line of sight by testing every sight segment against every wall, True where no wall crosses or touches it"""
+    def cross(Ax, Ay, Bx, By, Cx, Cy):
+        return (Bx - Ax) * (Cy - Ay) - (By - Ay) * (Cx - Ax)
+    S = Segments[:, None, :]
+    W = Walls[None, :, :]
+    D1 = cross(W[..., 0], W[..., 1], W[..., 2], W[..., 3], S[..., 0], S[..., 1])
+    D2 = cross(W[..., 0], W[..., 1], W[..., 2], W[..., 3], S[..., 2], S[..., 3])
+    D3 = cross(S[..., 0], S[..., 1], S[..., 2], S[..., 3], W[..., 0], W[..., 1])
+    D4 = cross(S[..., 0], S[..., 1], S[..., 2], S[..., 3], W[..., 2], W[..., 3])
+    return ~((D1 * D2 <= 0) & (D3 * D4 <= 0)).any(axis=1)
+
+def bruteForceRaycast(Walls, Ids, Origins, Directions):
+    """nearest hit of every ray by testing every wall, returns the Ids (-1 for no hit) and t (infinity for no hit)"""
+    O = Origins[:, None, :]
+    D = Directions[:, None, :]
+    A = Walls[None, :, 0:2]
+    E = Walls[None, :, 2:4] - A
+    Denominator = D[..., 0] * E[..., 1] - D[..., 1] * E[..., 0]
+    Safe = np.where(Denominator == 0, 1.0, Denominator)
+    t = ((A[..., 0] - O[..., 0]) * E[..., 1] - (A[..., 1] - O[..., 1]) * E[..., 0]) / Safe
+    u = ((A[..., 0] - O[..., 0]) * D[..., 1] - (A[..., 1] - O[..., 1]) * D[..., 0]) / Safe
+    t = np.where((Denominator != 0) & (t >= 0) & (u >= 0) & (u <= 1), t, np.inf)
+    Nearest = t.argmin(axis=1)
+    Best = t[np.arange(len(Origins)), Nearest]
+    return np.where(np.isfinite(Best), Ids[Nearest], -1), Best
+
+def preorderNodes(tree):
+    """returns the nodes of a BinaryTree in preorder, the order of the nodes of a FlatTree"""
+    Nodes = []
+    stack = [tree] if len(tree.data) > 0 else []
+    while len(stack) != 0:
+        TreePointer = stack.pop()
+        Nodes.append(TreePointer)
+        for Child in (TreePointer.right, TreePointer.left):
+            if Child is not None:
+                stack.append(Child)
+    return Nodes
+
+def serializeTree(tree):
+    """returns the nodes of a BinaryTree in preorder as tuples of their line segments and which children they have"""
+    return [(tuple((L.p1.x, L.p1.y, L.p2.x, L.p2.y) for L in TreePointer.data),
+             TreePointer.left is not None, TreePointer.right is not None) for TreePointer in preorderNodes(tree)]
+
+@pytest.mark.parametrize('Heuristic', ['even', 'sample-even', 'sample-min'])
+def testBatchMatchesCheckLoS(Heuristic, buildTree):
+    bsptree = buildTree(150, Seed=1, Heuristic=Heuristic, Vectorized=True)
+    Points = np.random.default_rng(2).uniform(0, [Width, Height], (40, 2))
+    Expected = np.array(bsptree.checkLoS([Point(x, y) for x, y in Points.tolist()])) == 'T'
+    assert np.array_equal(bsptree.checkLoSBatch(Points), Expected)
+
+def testBatchMatchesBruteForce(buildTree):
+    bsptree = buildTree(300, Seed=3)
+    Walls = getWalls(bsptree)[0]
+    Segments = randomSegments(3000, 4)
+    Expected = bruteForceVisible(Walls, Segments)
+    assert np.array_equal(bsptree.checkSightSegments(Segments), Expected)
+    Scalar = [bsptree.isVisible(LineSegment(Point(x1, y1), Point(x2, y2))) for x1, y1, x2, y2 in Segments.tolist()]
+    assert np.array_equal(Scalar, Expected)
+
+def testCompiledTreeMatchesTreeWalk(buildTree):
+    bsptree = buildTree(300, Seed=26)
+    Segments = randomSegments(3000, 27)
+    Points = np.random.default_rng(28).uniform(0, [Width, Height], (40, 2))
+    Expected = bsptree.checkSightSegments(Segments)
+    ExpectedLoS = bsptree.checkLoSBatch(Points)
+    flat = bsptree.compileTree()
+    assert np.array_equal(flat.checkSightSegments(Segments), Expected)
+    assert np.array_equal(flat.checkLoSBatch(Points), ExpectedLoS)
+    # Batch queries of the BSP go through the compiled arrays from now on
+    assert np.array_equal(bsptree.checkSightSegments(Segments), Expected)
+    assert flat.countNodes() == bsptree.SegmentCount
+    assert bsptree.countNodes(bsptree.tree) == bsptree.SegmentCount
+    assert sum(flat.countNodes(Child) for Child in (flat.Left[0], flat.Right[0]) if Child != -1) == \
+        bsptree.SegmentCount - len(bsptree.tree.data)
+    assert len(flat.Left) == sum(1 for Node in serializeTree(bsptree.tree))
+
+@pytest.mark.parametrize('Heuristic', ['even', 'min'])
+def testVectorizedHeuristicsMatchLoops(Heuristic, buildTree):
+    Loop = BSP()
+    Vectorized = BSP(Vectorized=True)
+    for Seed in range(5):
+        Lines = generateSceneFast(60, Width, Height, Seed=Seed)
+        if Heuristic == 'even':
+            assert Vectorized.heuristicEvenDivide(Lines) == Loop.heuristicEvenDivide(Lines)
+        else:
+            assert Vectorized.heuristicMinimumPartition(Lines) == Loop.heuristicMinimumPartition(Lines)
+    assert serializeTree(buildTree(80, Seed=5, Heuristic=Heuristic).tree) == \
+        serializeTree(buildTree(80, Seed=5, Heuristic=Heuristic, Vectorized=True).tree)
+
+def testVisibleWithinMatchesBatch(buildTree):
+    bsptree = buildTree(150, Seed=19)
+    Points = np.random.default_rng(20).uniform(0, [Width, Height], (120, 2))
+    Expected = bsptree.checkLoSBatch(Points)
+    Within = np.hypot(*(Points[:, None, :] - Points[None, :, :]).transpose(2, 0, 1)) <= 200
+    I, J = bsptree.visible_within(Points, 200)
+    Order = np.lexsort((J, I))
+    assert np.array_equal(np.stack((I[Order], J[Order]), axis=1), np.argwhere(np.triu(Expected & Within, 1)))
+    IndPtr, Indices = bsptree.visible_within(Points, 200, Format='csr')
+    for i in range(len(Points)):
+        assert np.array_equal(Indices[IndPtr[i]:IndPtr[i + 1]], np.flatnonzero(Expected[i] & Within[i]))
+
+def testInsertIsSilent(capsys, buildTree):
+    bsptree = buildTree(100, Seed=16)
+    rng = np.random.default_rng(17)
+    # Walls close to the existing ones and crossing them, as many splitters as possible see fragments near them
+    for Id in rng.choice(sorted(bsptree.Segments), 50, replace=False).tolist():
+        Wall = bsptree.Segments[Id]
+        Shift = rng.uniform(-1e-6, 1e-6, 2)
+        bsptree.insert(LineSegment(Point(Wall.p1.x + Shift[0], Wall.p1.y + Shift[1]),
+                                   Point(2 * Wall.p2.x - Wall.p1.x, 2 * Wall.p2.y - Wall.p1.y)))
+    assert capsys.readouterr().out == ''
+    assert bsptree.SegmentCount == bsptree.countNodes(bsptree.tree)
+
+def testInsertCountsMisclassifiedFragments():
+    # The default predicates misclassify fragments of this scale, see testDefaultModeTreesUnchanged
+    Lines = generateStressScenes(100, 0)['random x1e+06']
+    bsptree = BSP(Seed=0)
+    bsptree.tree.data = list(Lines[:40])
+    bsptree.generateTree(bsptree.tree, 'even')
+    Built = bsptree.MisclassifiedFragments
+    for Line in Lines[40:]:
+        bsptree.insert(Line)
+    assert bsptree.MisclassifiedFragments > Built
+    assert bsptree.SegmentCount == bsptree.countNodes(bsptree.tree)
+
+def testQueriesAfterRemovingEveryWall(buildTree):
+    bsptree = buildTree(30, Seed=29)
+    for Id in sorted(bsptree.Segments):
+        bsptree.remove(Id)
+    assert bsptree.SegmentCount == 0
+    Points = [Point(0, 0), Point(10, 10), Point(500, 300)]
+    assert bsptree.checkLoS(Points) == [['X', 'T', 'T'], ['T', 'X', 'T'], ['T', 'T', 'X']]
+    Stats = QueryStats()
+    assert bsptree.checkLoS(Points, Stats)[0][1] == 'T'
+    assert Stats.Queries == 3
+    assert bsptree.checkSightSegments(randomSegments(10, 30)).all()
+    assert bsptree.compileTree().checkSightSegments(randomSegments(10, 30)).all()
+    assert bsptree.raycast((0, 0), (1, 1)) is None
+    # The empty tree takes walls again
+    bsptree.insert(LineSegment(Point(0, 10), Point(10, 0)))
+    assert not bsptree.isVisible(LineSegment(Point(0, 0), Point(10, 10)))
+
+def testParallelBuildMatchesSerial(buildTree):
+    Serial = buildTree(400, Seed=6, Heuristic='even', Vectorized=True)
+    Parallel = BSP(Seed=6, Vectorized=True)
+    Parallel.tree.data = generateSceneFast(400, Width, Height, Seed=6)
+    with concurrent.futures.ProcessPoolExecutor(2) as Pool:
+        Parallel.generateTreeParallel(Parallel.tree, 'even', Workers=2, Threshold=50, Executor=Pool)
+    assert serializeTree(Parallel.tree) == serializeTree(Serial.tree)
+    assert Parallel.SegmentCount == Serial.SegmentCount
+
+@pytest.mark.parametrize('Heuristic', ['sample-even', 'sample-min'])
+def testParallelSampledBuildIsReproducible(Heuristic):
+    Trees = []
+    for Run in range(2):
+        bsptree = BSP(Seed=18)
+        bsptree.tree.data = generateSceneFast(400, Width, Height, Seed=18)
+        with concurrent.futures.ProcessPoolExecutor(2) as Pool:
+            bsptree.generateTreeParallel(bsptree.tree, Heuristic, Workers=2, Threshold=50, Executor=Pool)
+        Trees.append(serializeTree(bsptree.tree))
+    assert Trees[0] == Trees[1]
+
+# Trees of generateStressScenes(100, 0) with the default predicates, as built before the robust mode existed
+DefaultTreeHashes = {
+    ('grid', 'even'): '7d52bb29eab7a7bc', ('grid', 'min'): 'b257e6cad67d75b9',
+    ('fan', 'even'): '89002340d19d60f8', ('fan', 'min'): '250a8082764b939d',
+    ('near-collinear', 'even'): 'd9148c469da614e7', ('near-collinear', 'min'): '644cfaaa975584df',
+    ('random x0.001', 'even'): 'bec653d1b717c055', ('random x0.001', 'min'): '6aa28ea5c0355d66',
+    ('random x1', 'even'): '36e9dbddf487f019', ('random x1', 'min'): 'b4a60322091d7b61',
+    ('random x1000', 'even'): 'ab94f1a1eb4e211d', ('random x1000', 'min'): 'e3bc7c79c63fe206',
+    ('random x1e+06', 'even'): 'a120c70b97ee001d', ('random x1e+06', 'min'): '5c753a16e4342f03'}
+
+@pytest.fixture(scope='module')
+def stressResults():
+    return stressPredicates(WallCount=100, Seed=0)
+
+def testRobustModesHaveNoErrors(stressResults):
+    for Result in stressResults:
+        if Result['Mode'] != 'default':
+            assert Result['Failed'] is None, Result
+            assert Result['Errors'] == 0, Result
+
+def testRobustModesAreScaleInvariant(stressResults):
+    # Scaling by 0.001 rounds the coordinates, the exact predicates answer for the rounded walls, which may touch where
+    # the integer walls did not, so only the scales that keep the coordinates exact must give the same tree
+    Scales = {'robust': ('random x0.001', 'random x1', 'random x1000', 'random x1e+06'),
+              'exact': ('random x1', 'random x1000', 'random x1e+06')}
+    for Mode in ('robust', 'exact'):
+        for Heuristic in ('even', 'min'):
+            Nodes = {Result['Nodes'] for Result in stressResults if Result['Mode'] == Mode and
+                     Result['Heuristic'] == Heuristic and Result['Scene'] in Scales[Mode]}
+            assert len(Nodes) == 1, (Mode, Heuristic, Nodes)
+
+def testDefaultModeTreesUnchanged():
+    for Scene, Lines in generateStressScenes(100, 0).items():
+        for Heuristic in ('even', 'min'):
+            bsptree = BSP(Seed=0)
+            bsptree.tree.data = list(Lines)
+            bsptree.generateTree(bsptree.tree, Heuristic)
+            # The default predicates still misclassify fragments of the largest scale only
+            assert (bsptree.MisclassifiedFragments > 0) == (Scene == 'random x1e+06'), (Scene, Heuristic)
+            Hash = hashlib.sha256(repr(serializeTree(bsptree.tree)).encode()).hexdigest()[:16]
+            assert Hash == DefaultTreeHashes[(Scene, Heuristic)], (Scene, Heuristic)
+
+def testParallelBuildCountsMisclassifiedFragments():
+    Lines = generateStressScenes(100, 0)['random x1e+06']
+    Serial = BSP(Seed=0)
+    Serial.tree.data = list(Lines)
+    Serial.generateTree(Serial.tree, 'even')
+    Parallel = BSP(Seed=0)
+    Parallel.tree.data = list(Lines)
+    with concurrent.futures.ProcessPoolExecutor(2) as Pool:
+        Parallel.generateTreeParallel(Parallel.tree, 'even', Workers=2, Threshold=20, Executor=Pool)
+    assert Parallel.MisclassifiedFragments == Serial.MisclassifiedFragments > 0
+
+def testVisibleFromMatchesTreeWalk(buildTree):
+    bsptree = buildTree(200, Seed=14)
+    rng = np.random.default_rng(15)
+    Targets = rng.uniform(0, [Width, Height], (500, 2))
+    for Viewpoint in rng.uniform(0, [Width, Height], (5, 2)):
+        Expected = bsptree.checkSightSegments(np.hstack((np.tile(Viewpoint, (len(Targets), 1)), Targets)))
+        assert np.array_equal(bsptree.visible_from(Viewpoint, Targets), Expected)
+        # The range is a polygon of 64 edges, off the circle by 200 * (1 - cos(pi / 64)) < 0.25 at most
+        Distance = np.hypot(*(Targets - Viewpoint).T)
+        Clear = np.abs(Distance - 200) > 0.25
+        Visible = bsptree.visible_from(Viewpoint, Targets, radius=200)
+        assert np.array_equal(Visible[Clear], (Expected & (Distance <= 200))[Clear])
+
+def testRaycastMatchesBruteForce(buildTree):
+    bsptree = buildTree(300, Seed=10)
+    Walls, Ids = getWalls(bsptree)
+    rng = np.random.default_rng(11)
+    Origins = rng.uniform(0, [Width, Height], (500, 2))
+    Angles = rng.uniform(0, 2 * np.pi, 500)
+    Directions = np.stack((np.cos(Angles), np.sin(Angles)), axis=1)
+    ExpectedIds, ExpectedT = bruteForceRaycast(Walls, Ids, Origins, Directions)
+
+    BatchIds, BatchPoints, BatchT = bsptree.raycastBatch(Origins, Directions)
+    assert np.array_equal(BatchIds, ExpectedIds)
+    assert np.allclose(BatchT, ExpectedT, rtol=1e-9, atol=1e-9)
+    Hit = BatchIds != -1
+    assert np.allclose(BatchPoints[Hit], Origins[Hit] + BatchT[Hit, None] * Directions[Hit])
+    assert np.isnan(BatchPoints[~Hit]).all()
+    for index, (Origin, Direction) in enumerate(zip(Origins.tolist(), Directions.tolist())):
+        Hit = bsptree.raycast(Origin, Direction)
+        if ExpectedIds[index] == -1:
+            assert Hit is None
+        else:
+            assert Hit[0] == ExpectedIds[index]
+            assert Hit[2] == pytest.approx(ExpectedT[index], rel=1e-9, abs=1e-9)
+
+@pytest.mark.filterwarnings('error')
+def testAxisAlignedMissesAreQuiet(buildTree):
+    bsptree = buildTree(300, Seed=10)
+    # Rays out of the map along the axes miss, a zero direction component times an infinite t would be NaN
+    Origins = np.array([[5, 5], [795, 595], [5, 595], [795, 5], [400, 300], [400, 300]], dtype=np.float64)
+    Directions = np.array([[-1, 0], [1, 0], [0, 1], [0, -1], [0, 1], [1, 0]], dtype=np.float64)
+    Ids, Points, T = bsptree.raycastBatch(Origins, Directions)
+    assert (Ids[:4] == -1).all() and np.isnan(Points[:4]).all() and np.isinf(T[:4]).all()
+    assert np.isfinite(Points[Ids != -1]).all()
+
+def testBoxesKeepAnswers(buildTree):
+    bsptree = buildTree(300, Seed=7)
+    Segments = randomSegments(2000, 8)
+    rng = np.random.default_rng(9)
+    for Round in range(2):
+        bsptree.UseBoxes = False
+        Expected = bsptree.checkSightSegments(Segments)
+        Scalar = [bsptree.isVisible(LineSegment(Point(x1, y1), Point(x2, y2))) for x1, y1, x2, y2 in Segments.tolist()]
+        assert np.array_equal(Scalar, Expected)
+        bsptree.UseBoxes = True
+        assert np.array_equal(bsptree.checkSightSegments(Segments), Expected)
+        Scalar = [bsptree.isVisible(LineSegment(Point(x1, y1), Point(x2, y2))) for x1, y1, x2, y2 in Segments.tolist()]
+        assert np.array_equal(Scalar, Expected)
+        flat = bsptree.compileTree()
+        assert np.array_equal(flat.checkSightSegments(Segments), Expected)
+        assert np.array_equal(Expected, bruteForceVisible(getWalls(bsptree)[0], Segments))
+        # The boxes kept on the nodes are those the compiled tree computes from its arrays
+        Boxes = [TreePointer.box for TreePointer in preorderNodes(bsptree.tree)]
+        assert np.array_equal(np.array(Boxes, dtype=np.float64).reshape(-1, 4), flat.Boxes)
+
+        # Boxes have to follow the edits as well
+        for Id in rng.choice(sorted(bsptree.Segments), 20, replace=False).tolist():
+            bsptree.remove(Id)
+        for x1, y1, x2, y2 in rng.uniform(0, [Width, Height, Width, Height], (20, 4)).tolist():
+            bsptree.insert(LineSegment(Point(x1, y1), Point(x2, y2)))
+
+def testFullWedgeYieldsEverything(buildTree):
+    bsptree = buildTree(200, Seed=21)
+    for Viewpoint in np.random.default_rng(22).uniform(0, [Width, Height], (5, 2)):
+        Expected = list(bsptree.iterFragments(Viewpoint))
+        assert len(Expected) == bsptree.SegmentCount
+        for Wedge in ((0, 2 * np.pi), (-np.pi, np.pi), (1.0, 1.0 + 3 * np.pi)):
+            assert list(bsptree.iterFragments(Viewpoint, Wedge=Wedge)) == Expected
+
+def testWedgeKeepsWallsHitInside(buildTree):
+    bsptree = buildTree(200, Seed=23)
+    rng = np.random.default_rng(24)
+    for Viewpoint, Start in zip(rng.uniform(0, [Width, Height], (10, 2)), rng.uniform(-np.pi, np.pi, 10)):
+        Yielded = {line.Id for line in bsptree.iterFragments(Viewpoint, Wedge=(Start, Start + np.pi / 2))}
+        Angles = np.linspace(Start, Start + np.pi / 2, 200)
+        Ids = bsptree.raycastBatch(np.tile(Viewpoint, (len(Angles), 1)),
+                                   np.stack((np.cos(Angles), np.sin(Angles)), axis=1))[0]
+        assert set(Ids[Ids != -1].tolist()) <= Yielded
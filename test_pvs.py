@@ -0,0 +1,41 @@
+import numpy as np
+
+from geometry import LineSegment, Point
+from pvs import PVS, CompressedBitset
+
+Width, Height = 800, 600
+
+def testPVSMatchesTreeWalk(buildTree):
+    bsptree = buildTree(200, Seed=12)
+    bsptree.compileTree()
+    pvs = PVS(bsptree, MaxDistance=150)
+    rng = np.random.default_rng(13)
+    Starts = rng.uniform(0, [Width, Height], (3000, 2))
+    # Mostly short sight segments, those have their cell pairs classified
+    Segments = np.hstack((Starts, Starts + rng.normal(0, 60, (3000, 2))))
+    assert np.array_equal(pvs.checkSightSegments(Segments), bsptree.checkSightSegments(Segments))
+    assert pvs.Fallbacks < pvs.Lookups
+    Points = rng.uniform(0, [Width, Height], (60, 2))
+    assert np.array_equal(pvs.checkLoSBatch(Points), bsptree.checkLoSBatch(Points))
+
+    # A changed tree is walked until the sets are computed again
+    bsptree.insert(LineSegment(Point(100, 100), Point(700, 500)))
+    Fallbacks = pvs.Fallbacks
+    assert np.array_equal(pvs.checkSightSegments(Segments), bsptree.checkSightSegments(Segments))
+    assert pvs.Fallbacks == Fallbacks + len(Segments)
+
+def testCompressedBitsetMembership():
+    rng = np.random.default_rng(25)
+    # Sparse chunks, a dense chunk and chunk boundaries
+    Members = np.concatenate((rng.integers(0, 1 << 34, 5000), rng.integers(1 << 20, (1 << 20) + (1 << 16), 20000),
+                              [0, 65535, 65536, 1 << 40]))
+    Queries = np.concatenate((Members, Members + 1, np.maximum(Members - 1, 0), rng.integers(0, 1 << 34, 20000),
+                              rng.integers((1 << 20) - 1000, (1 << 20) + (1 << 17), 20000)))
+    Bitset = CompressedBitset(Members)
+    assert Bitset.Count == len(np.unique(Members))
+    assert len(Bitset.Bitmaps) == 1
+    assert np.array_equal(Bitset.contains(Queries), np.isin(Queries, Members))
+    assert not CompressedBitset([]).contains(Queries).any()
+    # Pair indices of 8000 cells, sparse members take 2 bytes each plus the chunk index, below an int64 array
+    Pairs = rng.choice(8000 * 8000, 5000, replace=False)
+    assert CompressedBitset(Pairs).nbytes < Pairs.nbytes
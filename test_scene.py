@@ -0,0 +1,19 @@
+import numpy as np
+import pytest
+
+from scene import generateSceneArrays, segmentsIntersect
+
+@pytest.mark.parametrize('Count, Width, Height, isUniform', [(400, 800, 600, True), (300, 800, 600, False),
+                                                             (1500, 2000, 1500, True)])
+def testScenesHaveNoIntersectingPair(Count, Width, Height, isUniform):
+    Lines, Normals = generateSceneArrays(Count, Width, Height, isUniform=isUniform, Seed=23)
+    assert Lines.shape == (Count, 4) and Normals.shape == (Count,)
+    assert ((0 <= Lines[:, 0::2]) & (Lines[:, 0::2] <= Width)).all()
+    assert ((0 <= Lines[:, 1::2]) & (Lines[:, 1::2] <= Height)).all()
+    I, J = np.triu_indices(Count, 1)
+    assert not segmentsIntersect(Lines[I], Lines[J]).any()
+
+def testSceneIsReproducible():
+    First = generateSceneArrays(200, 800, 600, Seed=24)
+    Second = generateSceneArrays(200, 800, 600, Seed=24)
+    assert np.array_equal(First[0], Second[0]) and np.array_equal(First[1], Second[1])
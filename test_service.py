@@ -0,0 +1,46 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from geometry import Point
+from service import LocalClient, LoSService, ServiceClosed
+
+Width, Height = 800, 600
+
+def testClientMatchesTree(buildTree):
+    bsptree = buildTree(150, Seed=19)
+    rng = np.random.default_rng(20)
+    Points = rng.uniform(0, [Width, Height], (60, 2))
+    Segments = rng.uniform(0, [Width, Height, Width, Height], (100, 4))
+
+    async def query():
+        async with LoSService(bsptree) as service:
+            client = LocalClient(service)
+            LoS = await client.checkLoSBatch(Points)
+            Sight = await client.checkSight(Point(*Segments[0, 0:2]), Segments[0, 2:4])
+            return LoS, Sight, await client.checkSightSegments(Segments)
+    LoS, Sight, Visible = asyncio.run(query())
+    assert np.array_equal(LoS, bsptree.checkLoSBatch(Points))
+    assert np.array_equal(Visible, bsptree.checkSightSegments(Segments))
+    assert Sight == Visible[0]
+
+def testConcurrentRequestsAreBatched(buildTree):
+    bsptree = buildTree(150, Seed=42)
+    Requests = np.random.default_rng(43).uniform(0, [Width, Height, Width, Height], (200, 3, 4))
+
+    async def query():
+        async with LoSService(bsptree.compileTree(), Window=0.01) as service:
+            client = LocalClient(service)
+            Results = await asyncio.gather(*[client.checkSightSegments(Request) for Request in Requests])
+            return Results, service.summary()
+    Results, Summary = asyncio.run(query())
+    assert np.array_equal(np.stack(Results), bsptree.checkSightSegments(Requests.reshape(-1, 4)).reshape(200, 3))
+    assert Summary['Requests'] == 200 and Summary['Segments'] == 600
+    assert Summary['Batches'] < 200
+    assert (Summary['TimedOut'], Summary['Failed'], Summary['Pending']) == (0, 0, 0)
+
+def testStoppedServiceRejectsRequests(buildTree):
+    service = LoSService(buildTree(20, Seed=44))
+    with pytest.raises(ServiceClosed):
+        asyncio.run(service.checkSight((0, 0), (1, 1)))
@@ -0,0 +1,150 @@
+import json
+import struct
+
+import numpy as np
+import pytest
+
+import storage
+from bsp import BSP
+from geometry import Point
+from scene import generatePointArray, generateSceneArrays
+from storage import (Alignment, HeaderFormat, convertTextScene, importLinesFromFile, importPointsFromFile, loadScene,
+                     loadTree, readDirectory, saveScene)
+
+Width, Height = 800, 600
+
+def randomSegments(Count, Seed):
+    """returns seeded random sight segments (Count, 4) over the scene"""
+    return np.random.default_rng(Seed).uniform(0, [Width, Height, Width, Height], (Count, 4))
+
+def assertSameAnswers(flat, bsptree):
+    """checks that FlatTree 'flat' answers the queries of 'bsptree' the same way"""
+    Segments = randomSegments(3000, 25)
+    assert np.array_equal(flat.checkSightSegments(Segments), bsptree.checkSightSegments(Segments))
+    Rays = np.random.default_rng(26).uniform(-1, 1, (500, 2))
+    Ids, Points, T = flat.raycastBatch(Segments[:500, 0:2], Rays)
+    ExpectedIds, ExpectedPoints, ExpectedT = bsptree.raycastBatch(Segments[:500, 0:2], Rays)
+    assert np.array_equal(Ids, ExpectedIds)
+    assert np.array_equal(Points, ExpectedPoints, equal_nan=True)
+    assert np.array_equal(T, ExpectedT)
+    assert flat.countNodes() == bsptree.countNodes(bsptree.tree)
+
+@pytest.mark.parametrize('Mmap', [True, False])
+def testRoundTrip(Mmap, buildTree, tmp_path):
+    bsptree = buildTree(200, Seed=27)
+    Walls = [bsptree.Segments[Id] for Id in sorted(bsptree.Segments)]
+    Agents = [Point(10, 20), Point(300.5, 400.25), Point(799, 0)]
+    Filename = tmp_path / 'scene.los'
+    saveScene(Filename, Walls, Agents, bsptree)
+
+    Scene = loadScene(Filename, Mmap=Mmap)
+    assert sorted(Scene) == ['Agents', 'Tree', 'WallNormals', 'Walls']
+    assert np.array_equal(Scene['Walls'], [(L.p1.x, L.p1.y, L.p2.x, L.p2.y) for L in Walls])
+    assert np.array_equal(Scene['WallNormals'], [L.Normal for L in Walls])
+    assert np.array_equal(Scene['Agents'], [(P.x, P.y) for P in Agents])
+    for Name in storage.TreeArrays:
+        Loaded = getattr(Scene['Tree'], Name)
+        assert isinstance(Loaded, np.memmap) == Mmap
+        assert Loaded.dtype == getattr(bsptree.flat, Name).dtype
+        assert np.array_equal(Loaded, getattr(bsptree.flat, Name))
+    if Mmap:
+        assert not Scene['Walls'].flags.writeable
+    assertSameAnswers(Scene['Tree'], bsptree)
+    assertSameAnswers(loadTree(Filename), bsptree)
+
+def testAlignmentAndDirectory(tmp_path):
+    Filename = tmp_path / 'scene.los'
+    # Array walls, sizes that are not multiples of the alignment and an empty array
+    Lines = np.arange(4 * 37, dtype=np.float64).reshape(37, 4)
+    saveScene(Filename, (Lines, np.ones(37, dtype=np.int8)), np.zeros((0, 2)))
+    Directory = readDirectory(Filename)
+    HeaderSize = struct.calcsize(HeaderFormat)
+    with open(Filename, 'rb') as f:
+        DirectorySize = struct.unpack(HeaderFormat, f.read(HeaderSize))[2]
+        Size = f.seek(0, 2)
+
+    End = HeaderSize + DirectorySize
+    for Name in sorted(Directory, key=lambda Name: Directory[Name]['offset']):
+        Entry = Directory[Name]
+        assert Entry['offset'] % Alignment == 0
+        # Arrays follow the whole directory and do not overlap
+        assert Entry['offset'] >= End
+        End = Entry['offset'] + int(np.prod(Entry['shape'])) * np.dtype(Entry['dtype']).itemsize
+    assert Size % Alignment == 0 and Size - End < Alignment
+
+    Scene = loadScene(Filename)
+    assert np.array_equal(Scene['Walls'], Lines)
+    assert Scene['Agents'].shape == (0, 2)
+    assert 'Tree' not in Scene
+
+def testDirectoryFitsManyArrays(buildTree, tmp_path, monkeypatch):
+    # The room reserved for the directory grows with the number of arrays and the length of their names
+    bsptree = buildTree(50, Seed=28)
+    monkeypatch.setattr(storage, 'TreeArrays', storage.TreeArrays + tuple('Extra%03d' % k for k in range(200)))
+    flat = bsptree.compileTree()
+    for k in range(200):
+        setattr(flat, 'Extra%03d' % k, np.zeros((k % 7, 3 * k + 1), dtype=np.int16))
+    Filename = tmp_path / 'scene.los'
+    saveScene(Filename, Tree=flat)
+    Directory = readDirectory(Filename)
+    assert len(Directory) == len(storage.TreeArrays)
+    assert min(Entry['offset'] for Entry in Directory.values()) >= \
+        struct.calcsize(HeaderFormat) + len(json.dumps(Directory))
+
+@pytest.mark.parametrize('Header', [b'NOTASCENE' + bytes(7), struct.pack(HeaderFormat, storage.Magic, 2, 0), b'LOS'])
+def testRejectsOtherFiles(Header, tmp_path):
+    Filename = tmp_path / 'other.bin'
+    Filename.write_bytes(Header + bytes(64))
+    with pytest.raises(ValueError):
+        loadScene(Filename)
+    Filename.write_bytes(Header[:3])
+    with pytest.raises(ValueError):
+        readDirectory(Filename)
+
+def testFileWithoutBoxes(buildTree, tmp_path, monkeypatch):
+    bsptree = buildTree(200, Seed=29)
+    Filename = tmp_path / 'old.los'
+    # Files written before node bounding boxes were added
+    monkeypatch.setattr(storage, 'TreeArrays', tuple(Name for Name in storage.TreeArrays if Name != 'Boxes'))
+    saveScene(Filename, Tree=bsptree)
+    monkeypatch.undo()
+    assert 'TreeBoxes' not in readDirectory(Filename)
+    flat = loadTree(Filename)
+    assert np.array_equal(flat.Boxes, bsptree.flat.Boxes)
+    assertSameAnswers(flat, bsptree)
+
+def writeTextScene(tmp_path, Walls, Agents):
+    """writes line segment and point text files in the format of BSP.readLinesFromFile and BSP.readPointsFromFile"""
+    LinesFilename = tmp_path / 'lines.txt'
+    PointsFilename = tmp_path / 'points.txt'
+    with open(LinesFilename, 'w') as f:
+        f.write('# x1,y1,x2,y2\tnormal\tname\n')
+        for k, ((x1, y1, x2, y2), Normal) in enumerate(zip(*Walls)):
+            f.write('%d,%d,%d,%d\t%d\twall%d\n' % (x1, y1, x2, y2, Normal, k))
+    with open(PointsFilename, 'w') as f:
+        f.write('# x,y\n')
+        for x, y in Agents:
+            f.write('%d,%d\n' % (x, y))
+    return LinesFilename, PointsFilename
+
+def testImportTextScene(tmp_path):
+    Walls = generateSceneArrays(150, Width, Height, Seed=30)
+    Agents = generatePointArray(40, Width, Height, Seed=31)
+    LinesFilename, PointsFilename = writeTextScene(tmp_path, Walls, Agents)
+
+    # Chunks smaller than the files
+    Lines, Normals = importLinesFromFile(LinesFilename, ChunkSize=16)
+    assert np.array_equal(Lines, Walls[0]) and np.array_equal(Normals, Walls[1])
+    assert np.array_equal(importPointsFromFile(PointsFilename, ChunkSize=16), Agents)
+
+    Filename = tmp_path / 'scene.los'
+    convertTextScene(LinesFilename, Filename, PointsFilename)
+    bsptree = BSP()
+    bsptree.readLinesFromFile(LinesFilename)
+    assert [L.Name for L in bsptree.tree.data] == ['wall%d' % k for k in range(150)]
+    bsptree.generateTree(bsptree.tree, 'even')
+    Scene = loadScene(Filename)
+    assert np.array_equal(Scene['Walls'], Walls[0]) and np.array_equal(Scene['WallNormals'], Walls[1])
+    assert np.array_equal(Scene['Agents'], Agents)
+    assert np.array_equal(Scene['Tree'].checkLoSBatch(Agents), bsptree.checkLoSBatch(Agents))
+    assertSameAnswers(Scene['Tree'], bsptree)
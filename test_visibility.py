@@ -0,0 +1,94 @@
+import numpy as np
+
+from geometry import LineSegment, Point
+from visibility import VisibilityCache, VisibilityTracker, checkLoSAllPairs, createPackedLoS, unpackLoS
+
+Width, Height = 800, 600
+
+def randomSegments(Count, Seed):
+    """returns seeded random sight segments (Count, 4) over the scene"""
+    return np.random.default_rng(Seed).uniform(0, [Width, Height, Width, Height], (Count, 4))
+
+def testAllPairsMatchBatch(buildTree, tmp_path):
+    bsptree = buildTree(150, Seed=19)
+    Points = np.random.default_rng(20).uniform(0, [Width, Height], (61, 2))
+    Expected = bsptree.checkLoSBatch(Points)
+    assert np.array_equal(unpackLoS(checkLoSAllPairs(bsptree, Points, TileSize=16), len(Points)), Expected)
+    Upper = unpackLoS(checkLoSAllPairs(bsptree.compileTree(), Points, TileSize=8, Symmetric=False), len(Points))
+    assert np.array_equal(Upper, np.triu(Expected, 1))
+    Mapped = createPackedLoS(len(Points), tmp_path / 'los.bin')
+    checkLoSAllPairs(bsptree, Points, out=Mapped, TileSize=24, Workers=2)
+    assert np.array_equal(unpackLoS(Mapped, len(Points)), Expected)
+
+def testCacheMatchesTree(buildTree):
+    bsptree = buildTree(300, Seed=32)
+    Segments = randomSegments(20000, 33)
+    Expected = bsptree.checkSightSegments(Segments)
+    cache = VisibilityCache(bsptree)
+    for Round in range(2):
+        assert np.array_equal(cache.checkSightSegments(Segments), Expected)
+    # Snapped end points answer for the rounded sight segments, not for the queried ones
+    Snapped = VisibilityCache(bsptree, Quantum=1.0)
+    assert np.array_equal(Snapped.checkSightSegments(Segments), bsptree.checkSightSegments(np.round(Segments)))
+
+def testCacheCounters(buildTree):
+    bsptree = buildTree(100, Seed=34)
+    Segments = randomSegments(50, 35)
+    cache = VisibilityCache(bsptree)
+    cache.checkSightSegments(Segments[:30])
+    cache.checkSightSegments(Segments[20:])
+    Summary = cache.summary()
+    assert (Summary['Hits'], Summary['Misses'], Summary['Entries']) == (10, 50, 50)
+    assert Summary['HitRate'] == 10 / 60
+    assert Summary['Bytes'] == 50 * VisibilityCache.EntryBytes
+    assert (Summary['Evictions'], Summary['Invalidations']) == (0, 0)
+
+def testCacheEvictsLeastRecentlyUsed(buildTree):
+    bsptree = buildTree(100, Seed=36)
+    Segments = randomSegments(4, 37)
+    cache = VisibilityCache(bsptree, MaxBytes=3 * VisibilityCache.EntryBytes)
+    cache.checkSightSegments(Segments[0:3])
+    # The first segment becomes the most recently used, so the fourth one evicts the second one
+    cache.checkSightSegments(Segments[0:1])
+    cache.checkSightSegments(Segments[3:4])
+    assert cache.Evictions == 1 and len(cache.Entries) == 3
+    Misses = cache.Misses
+    cache.checkSightSegments(Segments[[0, 2, 3]])
+    assert cache.Misses == Misses
+    assert np.array_equal(cache.checkSightSegments(Segments), bsptree.checkSightSegments(Segments))
+    assert cache.Misses == Misses + 1 and cache.Evictions == 2
+
+def testCacheInvalidatesOnTreeChange(buildTree):
+    bsptree = buildTree(100, Seed=38)
+    Sight = np.array([[10.5, 10.5, 30.5, 30.5]])
+    Segments = np.vstack((Sight, randomSegments(100, 39)))
+    cache = VisibilityCache(bsptree)
+    cache.checkSightSegments(Segments)
+    Version = cache.Version
+    Id = bsptree.insert(LineSegment(Point(10, 30), Point(30, 10)))
+    assert cache.Version == Version + 1
+    Visible = cache.checkSightSegments(Segments)
+    assert not Visible[0]
+    assert np.array_equal(Visible, bsptree.checkSightSegments(Segments))
+    assert (cache.Invalidations, cache.Hits, cache.Misses) == (1, 0, 2 * len(Segments))
+    bsptree.remove(Id)
+    assert np.array_equal(cache.checkSightSegments(Segments), bsptree.checkSightSegments(Segments))
+    assert cache.Invalidations == 2
+
+def testTrackerMatchesBatch(buildTree):
+    bsptree = buildTree(200, Seed=40)
+    rng = np.random.default_rng(41)
+    Points = rng.uniform(0, [Width, Height], (80, 2))
+    Trackers = [VisibilityTracker(bsptree), VisibilityTracker(VisibilityCache(bsptree))]
+    for Tick in range(5):
+        Moved = rng.choice(len(Points), 10, replace=False)
+        Points[Moved] += rng.normal(0, 5, (10, 2))
+        if Tick == 3:
+            bsptree.insert(LineSegment(Point(100, 100), Point(700, 500)))
+        Expected = bsptree.checkLoSBatch(Points)
+        for tracker in Trackers:
+            assert np.array_equal(tracker.update(Points), Expected)
+    Pairs = 80 * 79 // 2
+    # The first tick and the tick after the insert compute all pairs
+    assert Trackers[0].summary()['PairsComputed'] < 3 * Pairs
+    assert Trackers[0].summary()['PairsReused'] + Trackers[0].summary()['PairsComputed'] == 5 * Pairs
@@ -0,0 +1,286 @@
+import collections
+import concurrent.futures
+
+import numpy as np
+
+from bsp import BSP, fillMatrix, pairSegments, pairsToMatrix, toPointArray
+
+def getFlatTree(tree):
+    """returns the FlatTree of 'tree', a BSP (compiled first if needed) or a FlatTree"""
+    if isinstance(tree, BSP):
+        return tree.flat if tree.flat is not None else tree.compileTree()
+    return tree
+
+def iterTiles(n, TileSize):
+    """yields tiles (RowStart, RowStop, ColStart, ColStop) covering the upper triangle (column > row) of an n by n matrix"""
+    for RowStart in range(0, n, TileSize):
+        for ColStart in range(RowStart, n, TileSize):
+            yield RowStart, min(n, RowStart + TileSize), ColStart, min(n, ColStart + TileSize)
+
+def checkTile(flat, Points, Tile):
+    """
+    Line of sight between the points of the rows and the columns of a tile, like BSP.checkLoSBatch
+    :param flat: FlatTree
+    :param Points: float64 array (N, 2)
+    :param Tile: tuple (RowStart, RowStop, ColStart, ColStop), see iterTiles
+    :return: boolean array (RowStop - RowStart, ColStop - ColStart), entries on or below the diagonal are False
+    """
+    RowStart, RowStop, ColStart, ColStop = Tile
+    Rows, Cols = np.nonzero(
+        np.arange(RowStart, RowStop)[:, None] < np.arange(ColStart, ColStop)[None, :])
+    Block = np.zeros((RowStop - RowStart, ColStop - ColStart), dtype=bool)
+    Block[Rows, Cols] = flat.checkSightSegments(pairSegments(Points, RowStart + Rows, ColStart + Cols)[2])
+    return Block
+
+# Read-only state of a worker process, set once by initWorker
+WorkerTree = None
+WorkerPoints = None
+
+def initWorker(flat, Points):
+    """Process pool initializer, keeps the compiled tree and the points for all tiles of this worker"""
+    global WorkerTree, WorkerPoints
+    WorkerTree = flat
+    WorkerPoints = Points
+
+def checkTileWorker(Tile):
+    """Worker process side of iterLoSTiles, returns the tile and its block bit-packed along the rows"""
+    return Tile, np.packbits(checkTile(WorkerTree, WorkerPoints, Tile), axis=1)
+
+def iterLoSTiles(tree, points, TileSize=1024, Workers=None):
+    """
+    Streams line of sight of all pairs of points, tile by tile over the upper triangle of the N by N matrix, only a few
+    tiles are in memory at any time whatever the number of points
+    :param tree: BSP or FlatTree
+    :param points: a list of Point objects or an array-like of shape (N, 2)
+    :param TileSize: int, number of rows and columns of a tile
+    :param Workers: int, number of worker processes sharing the compiled tree, None or 1 to compute in this process
+    :return: generator of (RowStart, ColStart, Block), Block is a boolean array as returned by checkTile, tiles are
+    yielded in the order they finish
+    """
+    flat = getFlatTree(tree)
+    Points = toPointArray(points)
+    Tiles = iterTiles(len(Points), TileSize)
+    if Workers is None or Workers <= 1:
+        for Tile in Tiles:
+            yield Tile[0], Tile[2], checkTile(flat, Points, Tile)
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(Workers, initializer=initWorker, initargs=(flat, Points)) as Pool:
+        # Bounded number of tiles in flight
+        Running = set()
+        for Tile in Tiles:
+            Running.add(Pool.submit(checkTileWorker, Tile))
+            if len(Running) >= 2 * Workers:
+                Done, Running = concurrent.futures.wait(Running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for Future in Done:
+                    yield unpackTile(*Future.result())
+        for Future in concurrent.futures.as_completed(Running):
+            yield unpackTile(*Future.result())
+
+def unpackTile(Tile, Packed):
+    """Inverse of the packing in checkTileWorker, returns (RowStart, ColStart, Block)"""
+    RowStart, RowStop, ColStart, ColStop = Tile
+    return RowStart, ColStart, np.unpackbits(Packed, axis=1, count=ColStop - ColStart).astype(bool)
+
+def createPackedLoS(n, Filename=None):
+    """returns a zeroed bit-packed n by n line of sight matrix (uint8, n by ceil(n / 8)), memory-mapped to 'Filename'
+    if given"""
+    Shape = (n, (n + 7) // 8)
+    if Filename is None:
+        return np.zeros(Shape, dtype=np.uint8)
+    return np.memmap(Filename, dtype=np.uint8, mode='w+', shape=Shape)
+
+def checkLoSAllPairs(tree, points, out=None, TileSize=1024, Workers=None, Symmetric=True):
+    """
+    Line of sight of all pairs of points into a bit-packed matrix, row i holds the bits of np.packbits of row i of
+    the boolean matrix of BSP.checkLoSBatch
+    :param tree: BSP or FlatTree
+    :param points: a list of Point objects or an array-like of shape (N, 2)
+    :param out: uint8 array from createPackedLoS (in memory or memory-mapped), a new one in memory if None
+    :param TileSize: int, rounded up to a multiple of 8 so that tiles start on byte boundaries
+    :param Workers: int, see iterLoSTiles
+    :param Symmetric: boolean, also fill the lower triangle if true, otherwise only bits [i][j] with i < j are set
+    :return: 'out'
+    """
+    Points = toPointArray(points)
+    if out is None:
+        out = createPackedLoS(len(Points))
+    TileSize = max(8, (TileSize + 7) // 8 * 8)
+    for RowStart, ColStart, Block in iterLoSTiles(tree, Points, TileSize, Workers):
+        Rows, Cols = Block.shape
+        out[RowStart:RowStart + Rows, ColStart // 8:(ColStart + Cols + 7) // 8] |= np.packbits(Block, axis=1)
+        if Symmetric:
+            out[ColStart:ColStart + Cols, RowStart // 8:(RowStart + Rows + 7) // 8] |= np.packbits(Block.T, axis=1)
+    return out
+
+def unpackLoS(Packed, n):
+    """returns the boolean n by n matrix of a bit-packed line of sight matrix"""
+    return np.unpackbits(np.asarray(Packed), axis=1, count=n).astype(bool)
+
+def getVersion(tree):
+    """returns the Version of a BSP (or of the tree of a VisibilityCache), a FlatTree never changes and is always 0"""
+    return getattr(tree, 'Version', 0)
+
+class VisibilityCache:
+    """
+    LRU cache of line of sight in front of a BSP or FlatTree, keyed on the exact end points of the sight segments, so
+    its answers are those of the tree. With a 'Quantum' the end points are snapped to a grid of that spacing and the
+    cache is approximate: a key answers for the snapped end points, which may differ from the answer for the queried
+    ones when a wall passes within a grid cell of the sight segment. The cache empties itself when the BSP tree changes
+    """
+    # Estimated memory of one entry: the 32 byte key as a bytes object and the slot of the ordered dictionary
+    EntryBytes = 200
+
+    def __init__(self, tree, Quantum=None, MaxBytes=64 << 20):
+        """
+        :param tree: BSP or FlatTree
+        :param Quantum: float, grid spacing of the end points for the approximate mode, 1.0 leaves integer coordinates
+        as they are, None to key on the exact coordinates
+        :param MaxBytes: int, memory budget, least recently used entries are evicted beyond it
+        """
+        self.tree = tree
+        self.Quantum = Quantum
+        self.MaxEntries = max(1, MaxBytes // self.EntryBytes)
+        self.Entries = collections.OrderedDict()
+        self.TreeVersion = getVersion(tree)
+        self.Hits = 0
+        self.Misses = 0
+        self.Evictions = 0
+        self.Invalidations = 0
+
+    @property
+    def Version(self):
+        return getVersion(self.tree)
+
+    def clear(self):
+        """drops all entries, counters are kept"""
+        self.Entries.clear()
+
+    def validate(self):
+        """drops all entries if the tree changed since they were computed"""
+        if getVersion(self.tree) != self.TreeVersion:
+            self.TreeVersion = getVersion(self.tree)
+            if len(self.Entries) > 0:
+                self.Entries.clear()
+                self.Invalidations += 1
+
+    def getKeys(self, Segments):
+        """returns the sight segments with snapped end points (the segments themselves without Quantum) and their keys,
+        a list of 32 byte strings"""
+        if self.Quantum is None:
+            Snapped = Segments
+            Keys = Segments
+        else:
+            Keys = np.round(Segments / self.Quantum).astype(np.int64)
+            Snapped = Keys * self.Quantum
+        return Snapped, np.ascontiguousarray(Keys).view('S32').ravel().tolist()
+
+    def checkSightSegments(self, segments, Stats=None):
+        """
+        Same as BSP.checkSightSegments, only the misses are computed, in one batch, with a Quantum the answers are
+        those for the snapped end points
+        :param Stats: QueryStats to record the computed sight segments in, or None
+        """
+        self.validate()
+        Segments = np.asarray(segments, dtype=np.float64).reshape(-1, 4)
+        Snapped, Keys = self.getKeys(Segments)
+        Visible = np.empty(len(Segments), dtype=bool)
+        Missing = []
+        Entries = self.Entries
+        for index, Key in enumerate(Keys):
+            Value = Entries.get(Key)
+            if Value is None:
+                Missing.append(index)
+            else:
+                Entries.move_to_end(Key)
+                Visible[index] = Value
+        self.Hits += len(Keys) - len(Missing)
+        self.Misses += len(Missing)
+
+        if len(Missing) > 0:
+            Missing = np.asarray(Missing)
+            Computed = self.tree.checkSightSegments(Snapped[Missing], Stats)
+            Visible[Missing] = Computed
+            for index, Value in zip(Missing.tolist(), Computed.tolist()):
+                Entries[Keys[index]] = Value
+            while len(Entries) > self.MaxEntries:
+                Entries.popitem(last=False)
+                self.Evictions += 1
+        return Visible
+
+    def checkLoSBatch(self, points, Stats=None):
+        """Same as BSP.checkLoSBatch through the cache"""
+        return pairsToMatrix(points, self.checkSightSegments, Stats)
+
+    def summary(self):
+        """returns the counters, the hit rate and the estimated memory as a dictionary"""
+        Lookups = self.Hits + self.Misses
+        return {
+            'Hits': self.Hits,
+            'Misses': self.Misses,
+            'HitRate': self.Hits / Lookups if Lookups > 0 else 0.0,
+            'Entries': len(self.Entries),
+            'Bytes': len(self.Entries) * self.EntryBytes,
+            'Evictions': self.Evictions,
+            'Invalidations': self.Invalidations}
+
+class VisibilityTracker:
+    """
+    Line of sight between all pairs of a set of agents tick after tick, only the pairs of agents that moved since the
+    previous tick are computed again, everything is computed again when the number of agents or the tree changes
+    """
+    def __init__(self, tree, Tolerance=0.0):
+        """
+        :param tree: BSP, FlatTree or VisibilityCache
+        :param Tolerance: float, an agent counts as moved once a coordinate changed by more than this since line of sight
+        was last computed for it
+        """
+        self.tree = tree
+        self.Tolerance = Tolerance
+        self.Points = None
+        self.LoS = None
+        self.TreeVersion = None
+        self.Ticks = 0
+        self.PairsReused = 0
+        self.PairsComputed = 0
+
+    def update(self, points, Stats=None):
+        """
+        Line of sight of the agents at their new positions
+        :param points: a list of Point objects or an array-like of shape (N, 2), in the same order every tick
+        :param Stats: QueryStats to record the computed pairs in, or None
+        :return: boolean array N by N as from BSP.checkLoSBatch, the tracker keeps and updates it in place next tick
+        """
+        Points = toPointArray(points)
+        n = len(Points)
+        self.Ticks += 1
+        Pairs = n * (n - 1) // 2
+        if self.Points is None or len(self.Points) != n or getVersion(self.tree) != self.TreeVersion:
+            self.TreeVersion = getVersion(self.tree)
+            self.Points = Points.copy()
+            self.LoS = pairsToMatrix(Points, self.tree.checkSightSegments, Stats)
+            self.PairsComputed += Pairs
+            return self.LoS
+
+        Moved = np.any(np.abs(Points - self.Points) > self.Tolerance, axis=1)
+        MovedIndex = np.flatnonzero(Moved)
+        # Every pair with a moved agent once: moved agent m with each agent j that is not a moved agent below m
+        M = np.repeat(MovedIndex, n)
+        J = np.tile(np.arange(n), len(MovedIndex))
+        Keep = (J != M) & ~(Moved[J] & (J < M))
+
+        self.Points[MovedIndex] = Points[MovedIndex]
+        I, J, Segments = pairSegments(self.Points, M[Keep], J[Keep])
+        fillMatrix(n, I, J, self.tree.checkSightSegments(Segments, Stats), self.LoS)
+        self.PairsComputed += len(I)
+        self.PairsReused += Pairs - len(I)
+        return self.LoS
+
+    def summary(self):
+        """returns the counters and the share of pairs reused from the previous tick as a dictionary"""
+        Pairs = self.PairsReused + self.PairsComputed
+        return {
+            'Ticks': self.Ticks,
+            'PairsReused': self.PairsReused,
+            'PairsComputed': self.PairsComputed,
+            'ReuseRate': self.PairsReused / Pairs if Pairs > 0 else 0.0}